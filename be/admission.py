@@ -0,0 +1,276 @@
+"""Admission control cho các API báo cáo tốn kém (export, tổng hợp, phân phối, trang /reports sâu).
+
+Chi phí một request được ước lượng trước khi chạy (estimate): phần bảng reports phải
+quét theo phạm vi quyền (số ward) và khoảng ngày, tính theo FULL_SCAN_COST = quét toàn
+bộ bảng (mọi ward, HISTORY_DAYS ngày), cộng số dòng phải đọc/ghi (ROWS_PER_UNIT dòng = 1).
+
+- Request nhỏ (chi phí <= SMALL_COST, ví dụ đọc trong phạm vi một ward) luôn được nhận ngay.
+  Cùng với /login, /users (không qua admission), chúng dùng phần RESERVED_SLOTS connection/
+  thread DB mà request nặng không bao giờ chiếm.
+- Request nặng phải qua token bucket của user và của role (chi phí trừ vào số token; hết
+  token thì trả 429 ngay), rồi giới hạn đồng thời: tổng HEAVY_SLOTS request nặng, tổng chi
+  phí đang chạy COST_BUDGET (luôn nhận nếu không có request nặng nào đang chạy), tối đa
+  ROLE_CONCURRENCY theo role và USER_CONCURRENCY mỗi user. Vượt giới hạn đồng thời thì
+  xếp hàng (tối đa QUEUE_SIZE request, chờ QUEUE_TIMEOUT giây), quá nữa thì 429.
+
+Lỗi từ chối là Overloaded (kèm retry_after giây, main trả 429 với header Retry-After).
+Trạng thái nằm trong từng process (mỗi worker gunicorn giới hạn riêng) và chỉ được dùng
+trên event loop, không cần khoá.
+"""
+import asyncio
+import datetime
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+import auth_cache
+from db import REQUEST_CONNECTIONS
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+FULL_SCAN_COST = 100.0
+HISTORY_DAYS = int(os.getenv("ADMISSION_HISTORY_DAYS", 365))       # số ngày khi không lọc theo ngày
+ROWS_PER_UNIT = float(os.getenv("ADMISSION_ROWS_PER_UNIT", 20000))
+ASSUMED_WARDS = 100        # khi bản đồ ward chưa nạp
+AGGREGATE_WEIGHT = float(os.getenv("ADMISSION_AGGREGATE_WEIGHT", 0.25))  # tổng hợp: phần lớn đọc rollup
+SMALL_COST = float(os.getenv("ADMISSION_SMALL_COST", 5))
+
+RESERVED_SLOTS = int(os.getenv("ADMISSION_RESERVED_SLOTS", max(1, REQUEST_CONNECTIONS // 2)))
+HEAVY_SLOTS = max(1, int(os.getenv("ADMISSION_HEAVY_SLOTS", REQUEST_CONNECTIONS - RESERVED_SLOTS)))
+COST_BUDGET = float(os.getenv("ADMISSION_COST_BUDGET", 2 * FULL_SCAN_COST))
+ROLE_CONCURRENCY = dict(
+    (role, int(limit)) for role, _, limit in (
+        item.partition("=") for item in os.getenv("ADMISSION_ROLE_CONCURRENCY", "admin=2,city=4,ward=4").split(",")
+    )
+)
+USER_CONCURRENCY = int(os.getenv("ADMISSION_USER_CONCURRENCY", 2))
+USER_RATE = float(os.getenv("ADMISSION_USER_RATE", 1))     # đơn vị chi phí/giây
+USER_BURST = float(os.getenv("ADMISSION_USER_BURST", 3 * FULL_SCAN_COST))
+ROLE_RATE = float(os.getenv("ADMISSION_ROLE_RATE", 4))
+ROLE_BURST = float(os.getenv("ADMISSION_ROLE_BURST", 6 * FULL_SCAN_COST))
+QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 32))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10))
+MAX_RETRY_AFTER = 300
+
+
+class Overloaded(Exception):
+    """Request nặng bị từ chối: hết token hoặc hàng đợi đầy/chờ quá lâu."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, min(MAX_RETRY_AFTER, math.ceil(retry_after)))
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _days(start_date, end_date):
+    start, end = _date(start_date), _date(end_date)
+    if start is None:
+        return HISTORY_DAYS
+    days = ((end or datetime.date.today()) - start).days + 1
+    return max(1, min(HISTORY_DAYS, days))
+
+
+def _ward_fraction(user, ward_id):
+    # Cùng phạm vi với report_queries.scope_filter
+    total = auth_cache.wards.count() or ASSUMED_WARDS
+    role = user["role"]
+    if role == "ward" or (role == "admin" and ward_id is not None) or (role == "city" and ward_id and ward_id > 0):
+        return 1 / total
+    if role == "city":
+        return min(1.0, (auth_cache.wards.count(user.get("city_id")) or total) / total)
+    return 1.0
+
+
+def estimate(user, ward_id=None, start_date=None, end_date=None, rows=0, weight=1.0):
+    """Chi phí ước lượng (FULL_SCAN_COST = quét toàn bộ bảng reports)."""
+    scan = FULL_SCAN_COST * _ward_fraction(user, ward_id) * _days(start_date, end_date) / HISTORY_DAYS
+    return round(weight * scan + rows / ROWS_PER_UNIT, 3)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost):
+        """Số giây tới khi đủ token cho cost (0 = đủ ngay). Chi phí lớn hơn burst cần bucket đầy."""
+        self._refill()
+        need = min(cost, self.burst)
+        return 0 if self.tokens >= need else (need - self.tokens) / self.rate
+
+    def take(self, cost):
+        # Có thể âm (nợ) khi cost > burst: các request sau phải chờ bù
+        self.tokens -= cost
+
+    def refund(self, cost):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class AdmissionController:
+    def __init__(self, heavy_slots=HEAVY_SLOTS, cost_budget=COST_BUDGET, role_concurrency=ROLE_CONCURRENCY,
+                 user_concurrency=USER_CONCURRENCY, queue_size=QUEUE_SIZE, queue_timeout=QUEUE_TIMEOUT,
+                 enabled=ENABLED):
+        self.heavy_slots = heavy_slots
+        self.cost_budget = cost_budget
+        self.role_concurrency = role_concurrency
+        self.user_concurrency = user_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        self._buckets = {}           # ("user" | "role", tên) -> TokenBucket
+        self._waiters = deque()      # (future, user, cost) theo thứ tự đến
+        self._running = 0
+        self._running_cost = 0.0
+        self._by_role = Counter()
+        self._by_user = Counter()
+        self._duration = 1.0         # trung bình trượt thời gian chạy request nặng (giây)
+        self._counts = Counter()
+
+    def is_small(self, cost):
+        return not self.enabled or cost <= SMALL_COST
+
+    def _bucket_keys(self, user):
+        return [("user", user["username"], USER_RATE, USER_BURST), ("role", user["role"], ROLE_RATE, ROLE_BURST)]
+
+    def charge(self, user, cost):
+        """Trừ token của user và role cho cost; ném Overloaded nếu chưa đủ (không trừ gì)."""
+        if self.is_small(cost):
+            return
+        buckets = []
+        for kind, name, rate, burst in self._bucket_keys(user):
+            bucket = self._buckets.get((kind, name))
+            if bucket is None:
+                bucket = self._buckets[(kind, name)] = TokenBucket(rate, burst)
+            buckets.append(bucket)
+        wait = max(bucket.wait_time(cost) for bucket in buckets)
+        if wait > 0:
+            self._counts["rejected_rate"] += 1
+            raise Overloaded(f"Vượt hạn mức truy vấn nặng, thử lại sau {math.ceil(wait)} giây", wait)
+        for bucket in buckets:
+            bucket.take(cost)
+
+    def _refund(self, user, cost):
+        for kind, name, _, _ in self._bucket_keys(user):
+            self._buckets[(kind, name)].refund(cost)
+
+    def _fits_user(self, user):
+        return (self._by_role[user["role"]] < self.role_concurrency.get(user["role"], self.heavy_slots)
+                and self._by_user[user["username"]] < self.user_concurrency)
+
+    def _fits_global(self, cost):
+        return self._running < self.heavy_slots and (
+            self._running == 0 or self._running_cost + cost <= self.cost_budget)
+
+    def _start(self, user, cost):
+        self._running += 1
+        self._running_cost += cost
+        self._by_role[user["role"]] += 1
+        self._by_user[user["username"]] += 1
+
+    def _finish(self, user, cost):
+        self._running -= 1
+        self._running_cost -= cost
+        self._by_role[user["role"]] -= 1
+        self._by_user[user["username"]] -= 1
+        self._wake()
+
+    def _wake(self):
+        # Theo thứ tự đến; request vướng giới hạn riêng của user/role không chặn request sau nó,
+        # request vướng giới hạn chung thì chặn (request chi phí lớn không bị bỏ đói)
+        for waiter in list(self._waiters):
+            future, user, cost = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+                continue
+            if not self._fits_global(cost):
+                break
+            if self._fits_user(user):
+                self._waiters.remove(waiter)
+                self._start(user, cost)
+                future.set_result(True)
+
+    def _retry_after(self):
+        return self._duration * (len(self._waiters) + 1) / self.heavy_slots
+
+    async def _acquire(self, user, cost):
+        if not self._waiters and self._fits_global(cost) and self._fits_user(user):
+            self._start(user, cost)
+            return
+        if len(self._waiters) >= self.queue_size:
+            self._counts["rejected_queue_full"] += 1
+            raise Overloaded("Máy chủ đang bận xử lý truy vấn nặng, thử lại sau", self._retry_after())
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, user, cost)
+        self._waiters.append(waiter)
+        self._counts["queued"] += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._discard(waiter):
+                return
+            self._counts["rejected_timeout"] += 1
+            raise Overloaded("Máy chủ đang bận xử lý truy vấn nặng, thử lại sau", self._retry_after())
+        except asyncio.CancelledError:
+            # Client ngắt kết nối khi đang chờ: trả lại chỗ nếu vừa được nhận
+            if self._discard(waiter):
+                self._finish(user, cost)
+            raise
+
+    def _discard(self, waiter):
+        """Bỏ waiter khỏi hàng đợi. True nếu nó đã kịp được nhận (phải trả lại chỗ)."""
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            return False
+        future = waiter[0]
+        return future.done() and not future.cancelled()
+
+    @asynccontextmanager
+    async def admit(self, user, cost):
+        """async with controller.admit(user, cost): chạy request nếu được nhận, ném Overloaded nếu không."""
+        if self.is_small(cost):
+            yield
+            return
+        self.charge(user, cost)
+        try:
+            await self._acquire(user, cost)
+        except (Overloaded, asyncio.CancelledError):
+            # Không chạy thì không tính vào hạn mức
+            self._refund(user, cost)
+            raise
+        self._counts["admitted_heavy"] += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._duration = 0.8 * self._duration + 0.2 * (time.monotonic() - started)
+            self._finish(user, cost)
+
+    def stats(self):
+        return {
+            "enabled": int(self.enabled),
+            "heavy_running": self._running,
+            "heavy_running_cost": round(max(0.0, self._running_cost), 1),
+            "heavy_slots": self.heavy_slots,
+            "queued_now": len(self._waiters),
+            "heavy_seconds_avg": round(self._duration, 3),
+            **{name: self._counts[name] for name in (
+                "admitted_heavy", "queued", "rejected_rate", "rejected_queue_full",
+                "rejected_timeout")},
+        }
+
+
+controller = AdmissionController()
@@ -0,0 +1,343 @@
+"""Phân vùng bảng reports theo tháng, lưu trữ (archive) partition cũ ra file Parquet.
+
+Bảng reports được chia RANGE COLUMNS(`date`) theo tháng (migrations/0003_report_partitions.sql):
+partition pYYYYMM chứa các dòng có date < ngày đầu tháng kế tiếp, p_max chứa phần còn lại.
+Truy vấn có khoảng ngày chỉ đọc các partition liên quan (partition pruning).
+
+Job retention chuyển các partition cũ hơn RETENTION_MONTHS tháng ra
+ARCHIVE_DIR/reports_pYYYYMM.parquet: partition được EXCHANGE sang bảng tạm (tức thời,
+dòng ghi muộn không chen vào giữa), ghi Parquet, đối chiếu số dòng rồi mới xoá.
+Export đọc tiếp từ archive khi bảng reports hết dòng (xem tail), nên khoảng ngày cũ
+vẫn xuất được. Rollup đã cộng các dòng này từ trước nên dashboard không đổi
+(`rollup.py rebuild` sau khi archive sẽ chỉ thấy dữ liệu còn trong bảng reports).
+Ingest từ chối sự kiện có ngày trước ingest_cutoff: dòng ghi muộn vào tháng đã (hoặc sắp)
+archive sẽ không khớp ingest_key với bản trong file và phá thứ tự archive cũ hơn MySQL.
+
+Cần pyarrow (tuỳ chọn, chỉ khi archive hoặc đọc archive). Dùng từ dòng lệnh (cron):
+
+    python archive.py partitions         # tạo sẵn partition cho PARTITIONS_AHEAD tháng tới
+    python archive.py run [--dry-run]    # archive các partition quá hạn
+"""
+import argparse
+import datetime
+import os
+from pathlib import Path
+
+import pymysql
+
+import report_queries
+from db import db_connection
+from report_queries import BUSINESS_HOURS
+
+ARCHIVE_DIR = Path(os.getenv("REPORT_ARCHIVE_DIR", Path(__file__).with_name("archive")))
+RETENTION_MONTHS = int(os.getenv("REPORT_RETENTION_MONTHS", 12))   # số tháng giữ trong MySQL
+PARTITIONS_AHEAD = int(os.getenv("REPORT_PARTITIONS_AHEAD", 3))    # số tháng tạo partition trước
+FETCH_SIZE = 10000
+
+ARCHIVE_TABLE = "report_archive"
+# Cột của file archive: toàn bộ cột reports + ward_name tại thời điểm archive
+COLUMNS = ['id', 'ward_id', 'city_id', 'date', 'procedure', 'count', 'age_group', 'gender',
+           'domain', 'auth_type', 'print_time', 'ingest_key', 'ward_name']
+# Cột export, cùng thứ tự với report_queries.REPORT_COLUMNS
+EXPORT_COLUMNS = [c for c in COLUMNS if c != 'ingest_key']
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Archive reports cần gói pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def _schema(pa):
+    return pa.schema([
+        ('id', pa.int32()), ('ward_id', pa.int32()), ('city_id', pa.int32()), ('date', pa.date32()),
+        ('procedure', pa.string()), ('count', pa.int32()), ('age_group', pa.string()),
+        ('gender', pa.string()), ('domain', pa.string()), ('auth_type', pa.string()),
+        ('print_time', pa.int32()), ('ingest_key', pa.string()), ('ward_name', pa.string()),
+    ])
+
+
+def _month_start(day, months=0):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(upper):
+    # Partition chứa tháng ngay trước mốc `upper`
+    return f"p{_month_start(upper, -1):%Y%m}"
+
+
+# ---------------------------------------------------------------- partitions
+
+def partitions(cursor):
+    """Các partition tháng của reports: danh sách (tên, mốc trên date) tăng dần, bỏ p_max."""
+    cursor.execute("""
+        SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'reports' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    result = []
+    for row in cursor.fetchall():
+        if row['name'] == 'p_max':
+            continue
+        result.append((row['name'], datetime.date.fromisoformat(row['bound'].strip("'"))))
+    return result
+
+
+def ensure_partitions(conn, ahead=PARTITIONS_AHEAD, today=None):
+    """Tách p_max thành các partition tháng tới hết `ahead` tháng sau tháng hiện tại.
+
+    Lần đầu (ngay sau migration) p_max chứa toàn bộ dữ liệu và được chia từ tháng của
+    MIN(date); các lần sau p_max rỗng nên REORGANIZE gần như tức thời.
+    Trả về tên các partition vừa tạo.
+    """
+    today = today or datetime.date.today()
+    with conn.cursor() as cursor:
+        existing = partitions(cursor)
+        # start: mốc trên (ngày đầu tháng kế) của partition đầu tiên cần tạo
+        if existing:
+            start = _month_start(existing[-1][1], 1)
+        else:
+            cursor.execute("SELECT MIN(date) AS first FROM reports")
+            first = cursor.fetchone()['first'] or today
+            start = _month_start(first, 1)
+        end = _month_start(today, ahead + 1)
+        bounds = []
+        while start <= end:
+            bounds.append(start)
+            start = _month_start(start, 1)
+        if not bounds:
+            return []
+        parts = ", ".join(
+            f"PARTITION `{_partition_name(b)}` VALUES LESS THAN ('{b.isoformat()}')" for b in bounds
+        )
+        cursor.execute(
+            f"ALTER TABLE reports REORGANIZE PARTITION p_max INTO "
+            f"({parts}, PARTITION p_max VALUES LESS THAN (MAXVALUE))"
+        )
+    conn.commit()
+    return [_partition_name(b) for b in bounds]
+
+
+# ------------------------------------------------------------------ retention
+
+def expired(cursor, months=RETENTION_MONTHS, today=None):
+    """Các partition chỉ chứa ngày trước mốc giữ lại (đầu tháng hiện tại - months)."""
+    cutoff = _month_start(today or datetime.date.today(), -months)
+    return [(name, bound) for name, bound in partitions(cursor) if bound <= cutoff]
+
+
+def _write_parquet(conn, table, path):
+    pa = _pyarrow()
+    schema = _schema(pa)
+    tmp = path.with_suffix(".parquet.tmp")
+    rows = 0
+    with conn.cursor(pymysql.cursors.SSCursor) as cursor, \
+            pa.parquet.ParquetWriter(tmp, schema, compression="zstd") as writer:
+        cursor.execute(f"""
+            SELECT r.id, r.ward_id, r.city_id, r.date, r.procedure, r.count, r.age_group, r.gender,
+                   r.domain, r.auth_type, r.print_time, r.ingest_key, w.ward_name
+            FROM `{table}` r LEFT JOIN wards w ON r.ward_id = w.ward_id
+            ORDER BY r.date DESC, r.print_time ASC, r.id ASC
+        """)
+        while True:
+            batch = cursor.fetchmany(FETCH_SIZE)
+            if not batch:
+                break
+            writer.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in batch], schema=schema))
+            rows += len(batch)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return rows
+
+
+def archive_partition(conn, name):
+    """Chuyển một partition ra file Parquet rồi xoá khỏi MySQL. Trả về số dòng đã archive.
+
+    Chạy lại an toàn: nếu lần trước dừng giữa chừng, bảng tạm còn giữ dữ liệu và được ghi lại.
+    """
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    stage = f"reports_archive_{name}"
+    path = ARCHIVE_DIR / f"reports_{name}.parquet"
+    with conn.cursor() as cursor:
+        cursor.execute("SHOW TABLES LIKE %s", (stage,))
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE TABLE `{stage}` LIKE reports")
+            cursor.execute(f"ALTER TABLE `{stage}` REMOVE PARTITIONING")
+            # Đổi chỗ dữ liệu partition với bảng tạm rỗng: tức thời, không copy dòng
+            cursor.execute(f"ALTER TABLE reports EXCHANGE PARTITION `{name}` WITH TABLE `{stage}`")
+    conn.commit()
+    rows = _write_parquet(conn, stage, path)
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) AS n FROM `{stage}`")
+        expected = cursor.fetchone()['n']
+        written = _pyarrow().parquet.ParquetFile(path).metadata.num_rows
+        if rows != expected or written != expected:
+            raise RuntimeError(f"Archive {name}: {written} dòng trong file, {expected} dòng trong MySQL")
+        # Xoá partition (đã rỗng sau EXCHANGE) trước bảng tạm: nếu dừng giữa chừng,
+        # lần chạy lại vẫn thấy bảng tạm và không ghi đè file bằng partition rỗng
+        cursor.execute("SELECT 1 FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+                       "AND TABLE_NAME = 'reports' AND PARTITION_NAME = %s", (name,))
+        if cursor.fetchone() is not None:
+            cursor.execute(f"ALTER TABLE reports DROP PARTITION `{name}`")
+        cursor.execute(
+            f"INSERT INTO `{ARCHIVE_TABLE}` (`partition_name`, `rows`, `path`, `archived_at`) "
+            f"VALUES (%s, %s, %s, UTC_TIMESTAMP()) "
+            f"ON DUPLICATE KEY UPDATE `rows` = VALUES(`rows`), archived_at = VALUES(archived_at)",
+            (name, expected, path.name)
+        )
+        conn.commit()
+        cursor.execute(f"DROP TABLE `{stage}`")
+    conn.commit()
+    print(f"Archived {name}: {expected} rows -> {path}")
+    return expected
+
+
+def run_retention(conn, months=RETENTION_MONTHS, dry_run=False):
+    """Archive mọi partition quá hạn. Trả về {tên partition: số dòng}."""
+    with conn.cursor() as cursor:
+        names = [name for name, _ in expired(cursor, months)]
+        # Partition đã EXCHANGE nhưng chưa xong lần trước (còn bảng tạm)
+        cursor.execute("SHOW TABLES LIKE 'reports\\_archive\\_p%'")
+        pending = [list(row.values())[0][len("reports_archive_"):] for row in cursor.fetchall()]
+    names = sorted(set(names) | set(pending))
+    if dry_run:
+        return {name: None for name in names}
+    return {name: archive_partition(conn, name) for name in names}
+
+
+def generation(cursor):
+    """Số partition đã archive (đổi khi retention chạy), None nếu chưa có bảng archive."""
+    try:
+        cursor.execute(f"SELECT COUNT(*) AS n FROM `{ARCHIVE_TABLE}`")
+    except pymysql.err.ProgrammingError:
+        return None
+    return cursor.fetchone()['n']
+
+
+def ingest_cutoff(cursor, months=RETENTION_MONTHS, today=None):
+    """Ngày nhỏ nhất còn nhận ingest: sau tháng archive mới nhất và không trước mốc giữ lại.
+
+    Tháng quá hạn nhưng chưa archive cũng bị chặn: job retention có thể đang EXCHANGE/DROP
+    partition đó và dòng mới sẽ mất theo.
+    """
+    cutoff = _month_start(today or datetime.date.today(), -months)
+    try:
+        cursor.execute(f"SELECT MAX(partition_name) AS name FROM `{ARCHIVE_TABLE}`")
+    except pymysql.err.ProgrammingError:
+        return cutoff
+    name = cursor.fetchone()['name']
+    if name:
+        latest = datetime.date(int(name[1:5]), int(name[5:7]), 1)
+        cutoff = max(cutoff, _month_start(latest, 1))
+    return cutoff
+
+
+# ---------------------------------------------------------------------- read
+
+def archived_files():
+    """Các file archive, tháng mới nhất trước (cùng chiều ORDER BY date DESC của export)."""
+    if not ARCHIVE_DIR.is_dir():
+        return []
+    return sorted(ARCHIVE_DIR.glob("reports_p*.parquet"), reverse=True)
+
+
+def _as_date(value):
+    return datetime.date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _filter(user, ward_id, start_date, end_date):
+    """Biểu thức lọc pyarrow tương đương report_queries.report_filter."""
+    field = _pyarrow().dataset.field
+    expr = (field('print_time') >= BUSINESS_HOURS[0]) & (field('print_time') <= BUSINESS_HOURS[1])
+    role = user["role"]
+    if role == "admin":
+        if ward_id is not None:
+            expr &= field('ward_id') == ward_id
+    elif role == "city":
+        expr &= field('city_id') == user["city_id"]
+        if ward_id is not None and ward_id > 0:
+            expr &= field('ward_id') == ward_id
+    elif role == "ward":
+        expr &= field('ward_id') == user["ward_id"]
+    else:
+        raise PermissionError("Invalid role")
+    if start_date:
+        expr &= field('date') >= _as_date(start_date)
+    if end_date:
+        expr &= field('date') <= _as_date(end_date)
+    return expr
+
+
+def count_rows(user, ward_id=None, start_date=None, end_date=None):
+    files = archived_files()
+    if not files:
+        return 0
+    pa, expr = _pyarrow(), _filter(user, ward_id, start_date, end_date)
+    return sum(pa.dataset.dataset(path, format="parquet").count_rows(filter=expr) for path in files)
+
+
+def iter_rows(user, ward_id=None, start_date=None, end_date=None, offset=0, limit=None, as_dicts=False):
+    """Các lô dòng archive khớp bộ lọc, theo thứ tự REPORT_ORDER, cột EXPORT_COLUMNS.
+
+    Đọc từng file (một tháng) một lần nên bộ nhớ chỉ phụ thuộc kích thước một tháng;
+    thống kê row group của Parquet giúp bỏ qua phần không khớp khoảng ngày.
+    """
+    files = archived_files()
+    if not files:
+        return
+    pa, expr = _pyarrow(), _filter(user, ward_id, start_date, end_date)
+    for path in files:
+        if limit is not None and limit <= 0:
+            return
+        table = pa.dataset.dataset(path, format="parquet").to_table(columns=EXPORT_COLUMNS, filter=expr)
+        if offset >= table.num_rows:
+            offset -= table.num_rows
+            continue
+        table = table.sort_by([("date", "descending"), ("print_time", "ascending"), ("id", "ascending")])
+        table = table.slice(offset, limit)
+        offset = 0
+        if limit is not None:
+            limit -= table.num_rows
+        for batch in table.to_batches(FETCH_SIZE):
+            if as_dicts:
+                yield batch.to_pylist()
+            else:
+                yield list(zip(*(col.to_pylist() for col in batch.columns)))
+
+
+def tail(conn, user, limit, offset, ward_id, start_date, end_date, live_rows, as_dicts=False):
+    """Các lô dòng archive nối tiếp sau `live_rows` dòng export đã đọc từ bảng reports.
+
+    Dữ liệu archive luôn cũ hơn dữ liệu còn trong MySQL nên nằm sau cùng theo REPORT_ORDER;
+    limit/offset của export được tính trên cả hai phần.
+    """
+    if live_rows >= limit or not archived_files():
+        return iter(())
+    skip = 0
+    if live_rows == 0 and offset:
+        # offset vượt quá số dòng trong MySQL: phần còn lại bỏ qua trong archive
+        with conn.cursor() as cursor:
+            cursor.execute(*report_queries.count_reports_query(user, ward_id, start_date, end_date))
+            skip = max(0, offset - cursor.fetchone()['total'])
+    return iter_rows(user, ward_id, start_date, end_date, skip, limit - live_rows, as_dicts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Phân vùng và archive bảng reports")
+    parser.add_argument("command", choices=["partitions", "run"])
+    parser.add_argument("--months", type=int, default=RETENTION_MONTHS, help="số tháng giữ trong MySQL")
+    parser.add_argument("--dry-run", action="store_true", help="chỉ liệt kê partition sẽ archive")
+    args = parser.parse_args()
+    with db_connection() as conn:
+        if args.command == "partitions":
+            print(f"Created partitions: {ensure_partitions(conn)}")
+        else:
+            ensure_partitions(conn)
+            print(run_retention(conn, args.months, args.dry_run))
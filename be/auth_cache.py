@@ -0,0 +1,115 @@
+"""Cache cho xác thực: token JWT đã verify và bản đồ ward -> city.
+
+- TokenCache: payload của token đã verify, khoá theo SHA-256 của token, entry hết hạn
+  đúng thời điểm `exp` của token (không bao giờ sống lâu hơn token).
+- WardMap: toàn bộ ward_id -> city_id (bảng wards) nằm trong bộ nhớ, được nạp lại
+  định kỳ trên thread nền, để kiểm tra quyền không phải truy vấn DB.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import db_connection
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+TOKEN_CACHE_MAX_AGE = float(os.getenv("TOKEN_CACHE_MAX_AGE", 300))   # giây, cho token không có exp
+WARD_MAP_REFRESH = float(os.getenv("WARD_MAP_REFRESH_INTERVAL", 300))  # giây, 0 = không tự nạp lại
+WARD_MAP_MISS_RELOAD = 30   # giây tối thiểu giữa 2 lần nạp lại do gặp ward_id chưa biết
+
+
+class TokenCache:
+    """LRU payload token đã verify. Chỉ dùng sau khi token đã được jwt.decode thành công."""
+
+    def __init__(self, size=TOKEN_CACHE_SIZE, max_age=TOKEN_CACHE_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._data = OrderedDict()    # digest -> (payload, expires_at theo epoch)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        # Không giữ token gốc trong bộ nhớ
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._digest(token)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def put(self, token, payload):
+        exp = payload.get("exp")
+        expires_at = float(exp) if exp is not None else time.time() + self.max_age
+        with self._lock:
+            self._data[self._digest(token)] = (payload, expires_at)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class WardMap:
+    """ward_id -> city_id, nạp từ bảng wards."""
+
+    def __init__(self):
+        self._city_of = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT ward_id, city_id FROM wards")
+            city_of = {row['ward_id']: row['city_id'] for row in cursor.fetchall()}
+        # Gán cả dict một lần, thread đọc không thấy bản nạp dở
+        with self._lock:
+            self._city_of = city_of
+            self._loaded_at = time.monotonic()
+        return len(city_of)
+
+    def city_of(self, ward_id):
+        """city_id của ward. Ném KeyError nếu ward không tồn tại."""
+        if self._loaded_at is None:
+            # Lần đầu (trước khi thread nền kịp nạp) thì nạp đồng bộ
+            self.load()
+        elif ward_id not in self._city_of and time.monotonic() - self._loaded_at > WARD_MAP_MISS_RELOAD:
+            # Ward mới thêm sau lần nạp gần nhất; giới hạn tần suất để ward_id rác không dội vào DB
+            self.load()
+        return self._city_of[ward_id]
+
+    def count(self, city_id=None):
+        """Số ward (của city_id nếu có) theo lần nạp gần nhất; 0 nếu chưa nạp. Không truy vấn DB."""
+        city_of = self._city_of
+        if city_id is None:
+            return len(city_of)
+        return sum(1 for city in city_of.values() if city == city_id)
+
+    def start_background_refresh(self, interval=WARD_MAP_REFRESH):
+        """Nạp lại định kỳ trên thread nền. Trả về Event để dừng."""
+        stop = threading.Event()
+
+        def loop():
+            while True:
+                try:
+                    self.load()
+                except Exception as e:
+                    print(f"Ward map load error: {e}")
+                if stop.wait(interval):
+                    return
+
+        if interval > 0:
+            threading.Thread(target=loop, daemon=True, name="ward-map-refresh").start()
+        return stop
+
+
+tokens = TokenCache()
+wards = WardMap()
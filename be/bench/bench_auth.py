@@ -0,0 +1,74 @@
+"""Đo chi phí xác thực/kiểm tra quyền cho mỗi request.
+
+So sánh get_current_user khi phải jwt.decode (cache trống) và khi token đã có trong
+auth_cache.tokens, cùng kiểm tra ward thuộc city qua bản đồ trong bộ nhớ. Nếu có
+--db thì đo thêm truy vấn `SELECT city_id FROM wards` mà export dùng trước đây:
+
+    python bench/bench_auth.py
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk MYSQL_SSL=0 \
+        python bench/bench_auth.py --db
+
+Kết quả in ra dạng JSON: thời gian trung bình mỗi lần gọi (µs).
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SECRET_KEY", "bench-auth")
+
+import jwt  # noqa: E402
+
+import auth_cache  # noqa: E402
+import main  # noqa: E402
+
+
+def per_call_us(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return round((time.perf_counter() - start) / n * 1e6, 2)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=20000)
+    parser.add_argument("--db", action="store_true", help="đo thêm truy vấn wards trên DB thật")
+    args = parser.parse_args()
+
+    token = jwt.encode({
+        "user_id": 2, "username": "user_city_1", "role": "city", "ward_id": None, "city_id": 1,
+        "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=8),
+    }, main.SECRET_KEY, algorithm=main.ALGORITHM)
+
+    def uncached():
+        auth_cache.tokens.clear()
+        main.get_current_user(token)
+
+    results = {
+        "get_current_user_decode_us": per_call_us(uncached, args.n),
+        "get_current_user_cached_us": per_call_us(lambda: main.get_current_user(token), args.n),
+    }
+
+    if args.db:
+        auth_cache.wards.load()
+        with main.db_connection() as conn, conn.cursor() as cursor:
+            def query():
+                cursor.execute("SELECT city_id FROM wards WHERE ward_id = %s", (1,))
+                cursor.fetchone()
+            results["ward_check_query_us"] = per_call_us(query, min(args.n, 2000))
+    else:
+        # Không có DB: nạp sẵn bản đồ giả để đo phần tra cứu trong bộ nhớ
+        auth_cache.wards._city_of = {ward_id: 1 + (ward_id - 1) // 100 for ward_id in range(1, 1001)}
+        auth_cache.wards._loaded_at = time.monotonic()
+    user = main.get_current_user(token)
+    results["ward_check_map_us"] = per_call_us(lambda: main._check_ward_access(user, 1), args.n)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,94 @@
+"""Đo độ trễ /reports khi có nhiều job /reports/export chạy song song.
+
+Chạy với server đang hoạt động:
+
+    python bench/bench_concurrency.py --base-url http://localhost:8000 \
+        --username admin --password 123456 --exports 4 --samples 50
+
+Kết quả in ra dạng JSON: p50/p95/max của /reports khi không tải và khi đang export.
+Nếu event loop bị chặn, nhóm "under_export" sẽ tăng vọt so với "baseline".
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+
+def login(base_url, username, password):
+    body = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    req = urllib.request.Request(f"{base_url}/login", data=body, method="POST")
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())["access_token"]
+
+
+def timed_get(url, token):
+    req = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req) as resp:
+        resp.read()
+    return (time.perf_counter() - start) * 1000
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(values):
+    return {
+        "n": len(values),
+        "p50_ms": round(statistics.median(values), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "max_ms": round(max(values), 2),
+    }
+
+
+def sample_reports(base_url, token, samples, limit):
+    url = f"{base_url}/reports?limit={limit}"
+    return [timed_get(url, token) for _ in range(samples)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--exports", type=int, default=4, help="số job export chạy song song")
+    parser.add_argument("--samples", type=int, default=50, help="số request /reports mỗi pha")
+    parser.add_argument("--limit", type=int, default=100, help="limit của /reports")
+    args = parser.parse_args()
+
+    token = login(args.base_url, args.username, args.password)
+    baseline = sample_reports(args.base_url, token, args.samples, args.limit)
+
+    stop = threading.Event()
+    export_times = []
+
+    def export_loop():
+        url = f"{args.base_url}/reports/export?format=xlsx"
+        while not stop.is_set():
+            export_times.append(timed_get(url, token))
+
+    workers = [threading.Thread(target=export_loop, daemon=True) for _ in range(args.exports)]
+    for t in workers:
+        t.start()
+    time.sleep(1)  # để các export bắt đầu chạy
+    under_export = sample_reports(args.base_url, token, args.samples, args.limit)
+    stop.set()
+    for t in workers:
+        t.join()
+
+    print(json.dumps({
+        "exports": args.exports,
+        "baseline": summarize(baseline),
+        "under_export": summarize(under_export),
+        "export": summarize(export_times) if export_times else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""Kiểm tra và đo thời gian dựng các bảng tổng hợp của file export.
+
+1. golden: file export mẫu trong bench/golden/ được tạo bằng export_reports của bản gốc
+   (trước khi tách export_sheets) trên golden/export_rows.json (có '', NULL, giá trị khác
+   hoa/thường, dòng không có ngày, tuần ISO qua năm mới). main._build_export hiện tại (cả
+   đường buffer và streaming) chạy trên cùng các dòng phải cho cùng giá trị từng ô xlsx và
+   cùng nội dung từng file CSV. Tạo lại file mẫu từ main.py bản gốc:
+
+       git show <commit gốc>:be/main.py > /tmp/main_baseline.py
+       python bench/bench_export_sheets.py --capture-golden /tmp/main_baseline.py
+
+2. So sánh export_sheets.counts_from_frame (một lần factorize + bincount) với groupby
+   cho mỗi bảng trên dữ liệu sinh ngẫu nhiên có cả giá trị rỗng, rồi in thời gian (ms,
+   trung vị) của hai cách ở từng cỡ dữ liệu:
+
+    python bench/bench_export_sheets.py --rows 10000,100000,1000000
+
+Thoát với mã 1 nếu có khác biệt.
+"""
+import argparse
+import asyncio
+import csv
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SECRET_KEY", "bench")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import export_sheets  # noqa: E402
+
+PROCEDURES = [f"Thủ tục {i}" for i in range(60)]
+DOMAINS = ["Hộ tịch", "Đất đai", "Giáo dục", "Y tế", "Xây dựng", "Tư pháp"]
+AGE_GROUPS = ["<18", "18-30", "31-50", ">50"]
+GENDERS = ["Nam", "Nữ"]
+AUTH_TYPES = ["CCCD", "QR", "VNeID"]
+
+GOLDEN = Path(__file__).resolve().parent / "golden"
+GOLDEN_USER = {"role": "admin", "username": "bench"}
+# (group_by, format, tên file mẫu)
+GOLDEN_CASES = [
+    ("Ngày", "xlsx", "export_ngay.xlsx"),
+    ("Tuần", "xlsx", "export_tuan.xlsx"),
+    ("Ngày", "csv", "export_ngay.zip"),
+    ("Tuần", "csv", "export_tuan.zip"),
+]
+
+
+def make_frame(n, seed=0):
+    """DataFrame giống df_data của export (đã xử lý hour/date), có ~1% giá trị rỗng."""
+    rng = np.random.default_rng(seed)
+    start = date(2025, 1, 1)
+    days = np.array([(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(365)], dtype=object)
+
+    def column(values):
+        col = np.array(values, dtype=object)[rng.integers(0, len(values), n)]
+        col[rng.random(n) < 0.01] = None
+        return col
+
+    hours = rng.integers(0, 24, n).astype('float64')
+    hours[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({
+        'id': np.arange(n),
+        'date': column(days),
+        'procedure': column(PROCEDURES),
+        'age_group': column(AGE_GROUPS),
+        'gender': column(GENDERS),
+        'domain': column(DOMAINS),
+        'auth_type': column(AUTH_TYPES),
+        'hour': hours,
+    })
+
+
+def golden_rows(n=400, seed=7):
+    """Các dòng (dict) như SELECT của export trả về, theo thứ tự ngày giảm dần, giờ, id."""
+    rng = random.Random(seed)
+    start = date(2024, 12, 20)   # có tuần ISO 2025-W01 bắt đầu từ 30/12/2024
+
+    def pick(values, variants=()):
+        roll = rng.random()
+        if roll < 0.05:
+            return None
+        if roll < 0.1:
+            return ''
+        if roll < 0.15 and variants:
+            return rng.choice(variants)
+        return rng.choice(values)
+
+    rows = []
+    for i in range(1, n + 1):
+        day = None if rng.random() < 0.03 else start + timedelta(days=rng.randrange(30))
+        rows.append({
+            'id': i,
+            'ward_id': rng.choice([1, 2, 3]),
+            'city_id': 1,
+            'date': day,
+            'procedure': pick(PROCEDURES[:12]),
+            'count': rng.choice([None, 0, 1, 1, 1, 2, 3]),
+            'age_group': pick(AGE_GROUPS, [' 18-30']),
+            'gender': pick(GENDERS, ['nam', 'nữ', 'male']),
+            'domain': pick(DOMAINS, ['y tế']),
+            'auth_type': pick(AUTH_TYPES, ['qr']),
+            'print_time': rng.randint(7, 17),
+            'ward_name': rng.choice(['Phường 1', 'Phường 2', None]),
+        })
+    rows.sort(key=lambda r: (r['date'] is None, -(r['date'] or start).toordinal(), r['print_time'], r['id']))
+    return rows
+
+
+def load_golden_rows():
+    rows = json.loads((GOLDEN / "export_rows.json").read_text(encoding="utf-8"))
+    for row in rows:
+        row['date'] = date.fromisoformat(row['date']) if row['date'] else None
+    return rows
+
+
+class GoldenCursor:
+    """Cursor trả về các dòng cố định (dict hoặc tuple) cho mọi câu SELECT."""
+
+    def __init__(self, rows, as_dict):
+        # Mỗi lần đọc một bản sao như PyMySQL (export streaming sửa dict của từng dòng)
+        self._rows = [dict(row) if as_dict else tuple(row.values()) for row in rows]
+        self._pos = 0
+        self.description = [(name,) for name in rows[0]] if rows else []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, params=()):
+        self._pos = 0
+        return len(self._rows)
+
+    def fetchone(self):
+        return self.fetchmany(1)[0] if self._pos < len(self._rows) else None
+
+    def fetchmany(self, size):
+        batch = self._rows[self._pos:self._pos + size]
+        self._pos += len(batch)
+        return batch
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows))
+
+    def close(self):
+        pass
+
+
+class GoldenConnection:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def cursor(self, cursorclass=None):
+        import pymysql
+        as_dict = cursorclass not in (pymysql.cursors.Cursor, pymysql.cursors.SSCursor)
+        return GoldenCursor(self._rows, as_dict)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def capture_golden(baseline_main):
+    """Chạy export_reports của main.py bản gốc trên golden_rows() và lưu file kết quả."""
+    spec = importlib.util.spec_from_file_location("baseline_main", baseline_main)
+    baseline = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(baseline)
+    rows = golden_rows()
+    baseline.get_connection = lambda: GoldenConnection(rows)
+    GOLDEN.mkdir(exist_ok=True)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)   # bản gốc ghi file CSV tạm vào thư mục làm việc
+        try:
+            for group_by, format, name in GOLDEN_CASES:
+                response = asyncio.run(baseline.export_reports(
+                    user=GOLDEN_USER, limit=10000, offset=0, group_by=group_by, start_date=None,
+                    end_date=None, ward_id=None, format=format))
+                shutil.move(response.path, GOLDEN / name)
+                print(f"golden/{name}")
+        finally:
+            os.chdir(cwd)
+    data = [{**row, 'date': row['date'].isoformat() if row['date'] else None} for row in rows]
+    lines = ",\n".join(json.dumps(row, ensure_ascii=False) for row in data)
+    (GOLDEN / "export_rows.json").write_text(f"[\n{lines}\n]\n", encoding="utf-8")
+
+
+@contextmanager
+def golden_export(rows):
+    """main._build_export đọc rows thay cho MySQL (không archive, số đếm từ DataFrame)."""
+    import main
+
+    @contextmanager
+    def report_connection():
+        yield GoldenConnection(rows)
+
+    saved = (main.replica.report_connection, main.archive.tail, main.rollup.covers)
+    main.replica.report_connection = report_connection
+    main.archive.tail = lambda *args, **kwargs: []
+    main.rollup.covers = lambda *args, **kwargs: False
+    try:
+        yield main._build_export
+    finally:
+        main.replica.report_connection, main.archive.tail, main.rollup.covers = saved
+
+
+def _csv_value(text):
+    # Ô CSV dạng số so theo giá trị: pandas ghi 1.0 cho cột số nguyên có NULL, streaming ghi 1
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def file_contents(path):
+    """Giá trị từng ô của mỗi sheet (xlsx) hoặc của mỗi file CSV (zip)."""
+    if str(path).endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            return {
+                name: [[_csv_value(cell) for cell in row] for row in csv.reader(io.StringIO(zf.read(name).decode("utf-8")))]
+                for name in sorted(zf.namelist())
+            }
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook}
+    finally:
+        workbook.close()
+
+
+def golden_differences():
+    """Khác biệt giữa export hiện tại (buffer và streaming) và các file mẫu của bản gốc."""
+    rows = load_golden_rows()
+    found = []
+    with golden_export(rows) as build_export:
+        for group_by, format, name in GOLDEN_CASES:
+            expected = file_contents(GOLDEN / name)
+            for stream in (False, True):
+                response = build_export(GOLDEN_USER, 10000, 0, group_by, None, None, None, format, stream=stream)
+                try:
+                    actual = file_contents(response.path)
+                finally:
+                    os.remove(response.path)
+                label = f"{name} {'streaming' if stream else 'buffer'}"
+                if list(actual) != list(expected):
+                    found.append(f"{label}: sheets {list(actual)} != {list(expected)}")
+                    continue
+                for sheet, cells in expected.items():
+                    if actual[sheet] != cells:
+                        diff = next((i for i, (a, b) in enumerate(zip(actual[sheet], cells)) if a != b),
+                                    min(len(actual[sheet]), len(cells)))
+                        found.append(f"{label} [{sheet}] dòng {diff + 1}: "
+                                     f"{actual[sheet][diff:diff + 1]} != {cells[diff:diff + 1]}")
+    return found
+
+
+def reference_counts(df_data):
+    """Cách đếm cũ: một groupby trên toàn bộ DataFrame cho mỗi bảng."""
+    return {
+        'date': df_data.groupby('date').size(),
+        'hour': df_data.groupby('hour').size(),
+        'hour_days': df_data.groupby('hour')['date'].nunique(),
+        'domain': df_data.groupby('domain').size(),
+        'procedure': df_data.groupby('procedure').size(),
+        'age_gender': df_data.groupby(['age_group', 'gender']).size(),
+        'auth_type': df_data.groupby('auth_type').size(),
+    }
+
+
+def xlsx_sheets(sheets):
+    """Nội dung các sheet trong file xlsx (bỏ docProps chứa thời điểm tạo file)."""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+        for key, sheet_name, _, _ in export_sheets.SUMMARY_SHEETS:
+            sheets[key].to_excel(writer, sheet_name=sheet_name, index=False)
+    with zipfile.ZipFile(buffer) as zf:
+        return {name: zf.read(name) for name in zf.namelist() if not name.startswith('docProps/')}
+
+
+def differences(df, group_by):
+    expected = export_sheets.build_sheets(reference_counts(df), group_by)
+    actual = export_sheets.build_sheets(export_sheets.counts_from_frame(df), group_by)
+    found = []
+    for key in expected:
+        if expected[key].to_csv(index=False) != actual[key].to_csv(index=False):
+            found.append(f"{key}: csv")
+        try:
+            pd.testing.assert_frame_equal(expected[key], actual[key])
+        except AssertionError as e:
+            found.append(f"{key}: {str(e).splitlines()[0]}")
+    if xlsx_sheets(expected) != xlsx_sheets(actual):
+        found.append("xlsx")
+    return found
+
+
+def timed(fn, df, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--capture-golden", metavar="BASELINE_MAIN",
+                        help="main.py bản gốc: tạo lại các file mẫu trong bench/golden/ rồi thoát")
+    args = parser.parse_args()
+
+    if args.capture_golden:
+        capture_golden(args.capture_golden)
+        return
+
+    failures = 0
+    for issue in golden_differences():
+        print(f"[FAIL] golden {issue}")
+        failures += 1
+    # Dữ liệu nhỏ/biên: rỗng giá trị, một dòng, một nhóm
+    for n, seed in [(1, 1), (7, 2), (500, 3), (20000, 4)]:
+        for group_by in ("Ngày", "Tuần"):
+            df = make_frame(n, seed)
+            for issue in differences(df, group_by):
+                print(f"[FAIL] rows={n} group_by={group_by} {issue}")
+                failures += 1
+
+    results = []
+    for n in (int(r) for r in args.rows.split(",")):
+        df = make_frame(n, random.randrange(1000))
+        results.append({
+            "rows": n,
+            "groupby_ms": timed(reference_counts, df, args.repeat),
+            "single_pass_ms": timed(export_sheets.counts_from_frame, df, args.repeat),
+        })
+    print(json.dumps({"mismatches": failures, "results": results}, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
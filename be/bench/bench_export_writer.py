@@ -0,0 +1,111 @@
+"""Đo thời gian export lớn của admin (export_stream.export_to_file) theo số process render CSV.
+
+Dữ liệu: replica DuckDB tạm với dữ liệu sinh ngẫu nhiên (xem bench_replica.py), hoặc MySQL
+đang cấu hình nếu có --mysql (dữ liệu có sẵn, không nạp lại). Với mỗi số dòng, chạy export
+CSV (zip) với từng giá trị --processes (0 = không dùng process pool) và export xlsx (luôn
+tuần tự: một workbook xlsxwriter chỉ ghi được từ một thread); sau đó chạy --concurrent
+export CSV cùng lúc và kiểm tra các file không đè lên nhau và có nội dung giống nhau.
+
+    python bench/bench_export_writer.py --rows 200000 1000000 --processes 0 2 4
+
+Kết quả in ra dạng JSON (giây, wall time); thoát với mã 1 nếu file CSV khác nhau giữa
+các cấu hình hoặc giữa các export chạy đồng thời.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import db  # noqa: E402
+import executor  # noqa: E402
+import export_stream  # noqa: E402
+import report_queries  # noqa: E402
+from bench_replica import load_duckdb  # noqa: E402
+
+ADMIN = {"role": "admin"}
+
+
+def set_processes(n):
+    # Đổi kích thước process pool giữa các lần đo
+    if executor._render_executor is not None:
+        executor._render_executor.shutdown()
+        executor._render_executor = None
+    executor.RENDER_PROCESSES = n
+    pool = executor.render_executor()
+    if pool is not None:
+        # Khởi động process trước khi đo (spawn + import pandas chỉ tốn ở lần đầu)
+        list(pool.map(abs, range(n)))
+
+
+def export(conn_factory, total, format):
+    sql, params = report_queries.list_reports_query(ADMIN, total, 0)
+    conn = conn_factory()
+    try:
+        started = time.perf_counter()
+        path, _, _ = export_stream.export_to_file(conn, sql, params, "Ngày", format)
+        return path, round(time.perf_counter() - started, 2)
+    finally:
+        conn.close()
+
+
+def contents(path):
+    with zipfile.ZipFile(path) as zf:
+        return {name: zf.read(name) for name in zf.namelist()}
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[200000, 1000000])
+    parser.add_argument("--processes", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--concurrent", type=int, default=3)
+    parser.add_argument("--mysql", action="store_true", help="export từ MySQL đang cấu hình thay vì DuckDB")
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for total in args.rows:
+        entry = results[str(total)] = {"csv": {}}
+        with tempfile.TemporaryDirectory() as tmp:
+            if args.mysql:
+                conn_factory = db.get_connection
+            else:
+                conn_factory = load_duckdb(os.path.join(tmp, "bench.duckdb"), total).connection
+            expected = None
+            for n in args.processes:
+                set_processes(n)
+                path, seconds = export(conn_factory, total, "csv")
+                entry["csv"][f"processes={n}"] = seconds
+                data = contents(path)
+                os.remove(path)
+                if expected is None:
+                    expected = data
+                elif data != expected:
+                    failures.append(f"{total} rows: csv differs with processes={n}")
+            path, entry["xlsx"] = export(conn_factory, total, "xlsx")
+            os.remove(path)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrent) as pool:
+                done = list(pool.map(lambda _: export(conn_factory, total, "csv"), range(args.concurrent)))
+            entry[f"csv_concurrent_{args.concurrent}"] = round(time.perf_counter() - started, 2)
+            paths = [path for path, _ in done]
+            if len(set(paths)) != len(paths) or any(contents(path) != expected for path in paths):
+                failures.append(f"{total} rows: concurrent exports collided")
+            for path in paths:
+                os.remove(path)
+        print(json.dumps({str(total): entry}), file=sys.stderr)
+    set_processes(0)
+    print(json.dumps({"cpus": os.cpu_count(), "failures": failures, "results": results}, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
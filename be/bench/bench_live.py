@@ -0,0 +1,100 @@
+"""Mở nhiều kết nối SSE tới /reports/live và đo độ trễ nhận delta sau một lần ingest.
+
+Tất cả client dùng cùng một user (cùng phạm vi), nên worker chỉ tính và mã hoá delta
+một lần rồi chia cho mọi kết nối. User cần quyền ingest cho --ward:
+
+    python bench/bench_live.py --url http://127.0.0.1:8000 --username ward1 --password ... \\
+        --clients 500 --ward 1
+
+Kết quả in ra dạng JSON: thời gian mở kết nối, số client nhận được delta và độ trễ
+(ms, tính từ lúc gửi ingest) p50/p95/max.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest_ingest import login, percentile  # noqa: E402
+
+
+async def subscribe(host, port, path, ready, received, sent_at, timeout):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    try:
+        ready.release()
+        async with asyncio.timeout(timeout):
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.startswith(b"event: delta") and sent_at:
+                    received.append((time.perf_counter() - sent_at[0]) * 1000)
+                    return
+    except TimeoutError:
+        pass
+    finally:
+        writer.close()
+
+
+def post_event(url, token, ward_id):
+    event = {"event_id": f"bench-live-{uuid.uuid4()}", "ward_id": ward_id, "date": datetime.date.today().isoformat(),
+             "procedure": "bench_live", "count": 1, "print_time": 9}
+    req = urllib.request.Request(f"{url}/reports/ingest", data=json.dumps(event).encode(), method="POST", headers={
+        "Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson",
+    })
+    with urllib.request.urlopen(req) as resp:
+        return json.load(resp)
+
+
+async def main(args):
+    token = login(args.url, args.username, args.password)
+    parsed = urllib.parse.urlparse(args.url)
+    path = f"/reports/live?{urllib.parse.urlencode({'token': token})}"
+    ready, received, sent_at = asyncio.Semaphore(0), [], []
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(subscribe(parsed.hostname, parsed.port or 80, path, ready, received, sent_at,
+                                           args.timeout)) for _ in range(args.clients)]
+    for _ in range(args.clients):
+        await ready.acquire()
+    connect_s = time.perf_counter() - started
+    await asyncio.sleep(1)   # chờ server đăng ký xong các kết nối
+
+    sent_at.append(time.perf_counter())
+    result = await asyncio.to_thread(post_event, args.url, token, args.ward)
+    await asyncio.gather(*tasks)
+
+    print(json.dumps({
+        "clients": args.clients,
+        "connect_s": round(connect_s, 2),
+        "ingest": result,
+        "received": len(received),
+        "latency_ms": {
+            "p50": percentile(received, 0.5), "p95": percentile(received, 0.95),
+            "max": round(max(received), 2),
+        } if received else None,
+    }, indent=2))
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--ward", type=int, required=True, help="ward_id của sự kiện ingest thử")
+    parser.add_argument("--timeout", type=float, default=30, help="giây chờ delta tối đa mỗi client")
+    asyncio.run(main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,103 @@
+"""So sánh độ trễ trang thứ N của /reports: LIMIT/OFFSET và keyset (cursor).
+
+Chạy trên một MySQL/MariaDB local đã nạp ai_kiosk.sql và chạy migrations.
+--inflate nhân bản bảng reports (ngày được dịch ngẫu nhiên) tới số dòng yêu cầu:
+
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk MYSQL_SSL=0 \
+        python bench/bench_pagination.py --inflate 2000000 --pages 1,10,100,1000 --limit 1000
+
+Kết quả in ra dạng JSON: thời gian truy vấn (ms, trung vị) theo role, trang và chế độ.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import report_queries  # noqa: E402
+
+USERS = {
+    "admin": {"role": "admin", "ward_id": None, "city_id": None},
+    "city": {"role": "city", "ward_id": None, "city_id": 1},
+    "ward": {"role": "ward", "ward_id": 1, "city_id": 1},
+}
+
+
+def inflate(conn, target):
+    """Nhân đôi bảng reports cho tới khi đạt `target` dòng."""
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT COUNT(*) AS n FROM reports")
+            n = cursor.fetchone()['n']
+            if n >= target:
+                return n
+            cursor.execute("""
+                INSERT INTO reports (ward_id, city_id, date, `procedure`, count, age_group, gender, domain, auth_type, print_time)
+                SELECT ward_id, city_id, DATE_SUB(date, INTERVAL FLOOR(RAND() * 730) DAY),
+                       `procedure`, count, age_group, gender, domain, auth_type, print_time
+                FROM reports
+                LIMIT %s
+            """, (target - n,))
+            conn.commit()
+            print(f"reports: {n} -> {min(2 * n, target)} rows", file=sys.stderr)
+
+
+def timed(cursor, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), rows
+
+
+def cursor_for_page(cursor, user, page, limit):
+    """Token trỏ tới dòng cuối của trang page-1 (lấy một lần bằng OFFSET, không tính giờ)."""
+    if page <= 1:
+        return None
+    sql, params = report_queries.list_reports_query(user, 1, (page - 1) * limit - 1)
+    cursor.execute(sql, params)
+    row = cursor.fetchone()
+    return (report_queries._fmt_date(row['date']), row['print_time'], row['id']) if row else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inflate", type=int, default=0, help="số dòng reports mong muốn (0 = giữ nguyên)")
+    parser.add_argument("--pages", default="1,10,100,1000")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    try:
+        total = inflate(conn, args.inflate) if args.inflate else None
+        results = []
+        with conn.cursor() as cursor:
+            for role, user in USERS.items():
+                for page in (int(p) for p in args.pages.split(",")):
+                    offset = (page - 1) * args.limit
+                    sql, params = report_queries.list_reports_query(user, args.limit, offset)
+                    offset_ms, offset_rows = timed(cursor, sql, params, args.repeat)
+                    after = cursor_for_page(cursor, user, page, args.limit)
+                    sql, params = report_queries.list_reports_query(user, args.limit, 0, after=after)
+                    keyset_ms, keyset_rows = timed(cursor, sql, params, args.repeat)
+                    results.append({
+                        "role": role,
+                        "page": page,
+                        "offset_ms": round(offset_ms, 2),
+                        "keyset_ms": round(keyset_ms, 2),
+                        "same_rows": [r['id'] for r in offset_rows] == [r['id'] for r in keyset_rows],
+                    })
+        print(json.dumps({"rows": total, "limit": args.limit, "results": results}, indent=2))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
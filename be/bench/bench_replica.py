@@ -0,0 +1,142 @@
+"""So sánh MySQL và replica DuckDB trên các truy vấn tổng hợp của dashboard và export.
+
+Sinh dữ liệu reports bằng datagen.py (mặc định 1M và 10M dòng), nạp vào một replica DuckDB
+tạm và (nếu có --mysql) vào bảng reports của MySQL đang cấu hình, rồi đo cho từng role
+(admin, city, ward; có và không có khoảng ngày):
+
+- summary: report_queries.run_summaries đủ 6 mục (MySQL: bảng gốc và rollup; DuckDB: bảng gốc)
+- export_counts: rollup.export_counts của các sheet tổng hợp (MySQL: rollup; DuckDB: view)
+- export_rows: đọc 10000 dòng export (list_reports_query)
+
+--mysql --load thay dữ liệu reports/wards/cities (datagen.load_mysql), chỉ chạy trên database thử:
+
+    python bench/bench_replica.py --rows 1000000 10000000
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk_bench MYSQL_SSL=0 \\
+        python bench/bench_replica.py --rows 1000000 --mysql --load
+
+Kết quả in ra dạng JSON: thời gian (ms, trung vị) theo số dòng, backend và truy vấn.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import datagen  # noqa: E402
+import db  # noqa: E402
+import replica  # noqa: E402
+import report_queries  # noqa: E402
+import report_rows  # noqa: E402
+import rollup  # noqa: E402
+
+WARDS, CITIES = 60, 3
+START, END = "2025-03-01", "2025-03-31"
+
+CASES = [
+    ("admin", {"role": "admin"}, None),
+    ("admin month", {"role": "admin"}, (START, END)),
+    ("city", {"role": "city", "city_id": 1}, None),
+    ("city month", {"role": "city", "city_id": 1}, (START, END)),
+    ("ward", {"role": "ward", "ward_id": 7}, None),
+    ("ward month", {"role": "ward", "ward_id": 7}, (START, END)),
+]
+
+
+def load_duckdb(path, total):
+    rep = replica.Replica(path)
+    if not rep.open():
+        sys.exit(f"Không mở được DuckDB: {rep.error}")
+    geo = datagen.Geography(WARDS, CITIES)
+    wards, cities = geo.frames()
+    con = rep._db.cursor()
+    con.register("new_wards", wards)
+    con.execute("INSERT INTO wards SELECT * FROM new_wards")
+    con.register("new_cities", cities)
+    con.execute("INSERT INTO cities SELECT * FROM new_cities")
+    for frame in datagen.frames(total, geo):
+        con.register("new_reports", frame)
+        con.execute("INSERT INTO reports SELECT * FROM new_reports")
+    con.close()
+    rep.synced = True
+    return rep
+
+
+def timed(fn, repeat):
+    fn()   # lần đầu làm nóng cache
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 1)
+
+
+def measure(conn, source, counts, repeat):
+    result = {}
+    names = list(report_queries.SUMMARIES)
+    for name, user, dates in CASES:
+        dates = dates or (None, None)
+        where, params = report_queries.report_filter(user, None, *dates, business_hours=source.business_hours)
+        count_where, count_params = report_queries.report_filter(user, None, *dates, business_hours=False)
+        sql, list_params = report_queries.list_reports_query(user, 10000, 0, None, *dates)
+
+        def summary():
+            with conn.cursor() as cursor:
+                report_queries.run_summaries(cursor, where, params, names, "Ngày", 8, source)
+
+        def export_counts():
+            with conn.cursor() as cursor:
+                rollup.export_counts(cursor, count_where, count_params)
+
+        result[name] = {
+            "summary": timed(summary, repeat),
+            "export_rows": timed(lambda: report_rows.fetch(conn, sql, list_params), repeat),
+        }
+        if counts:
+            result[name]["export_counts"] = timed(export_counts, repeat)
+    return result
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mysql", action="store_true", help="đo cả MySQL đang cấu hình (MYSQL*)")
+    parser.add_argument("--load", action="store_true", help="nạp dữ liệu sinh ngẫu nhiên vào MySQL (xoá reports)")
+    args = parser.parse_args()
+
+    results = {}
+    for total in args.rows:
+        entry = results[str(total)] = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            started = time.perf_counter()
+            rep = load_duckdb(os.path.join(tmp, "bench.duckdb"), total)
+            entry["duckdb_load_s"] = round(time.perf_counter() - started, 1)
+            conn = rep.connection()
+            entry["duckdb"] = measure(conn, replica.SOURCE, True, args.repeat)
+            conn.close()
+            rep._db.close()
+        if args.mysql:
+            conn = db.get_connection()
+            try:
+                if args.load:
+                    started = time.perf_counter()
+                    datagen.load_mysql(conn, total, datagen.Geography(WARDS, CITIES))
+                    entry["mysql_load_s"] = round(time.perf_counter() - started, 1)
+                entry["mysql_raw"] = measure(conn, report_queries.RAW, False, args.repeat)
+                entry["mysql_rollup"] = measure(conn, rollup.ROLLUP, True, args.repeat)
+            finally:
+                conn.close()
+        print(json.dumps({str(total): entry}), file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,113 @@
+"""Đo thời gian và bộ nhớ cấp phát khi dựng response /reports (và DataFrame export).
+
+So sánh cách cũ (DictCursor -> dict(row) từng dòng, strftime, jsonable_encoder +
+json.dumps của JSONResponse, in toàn bộ response ra stdout) với report_rows
+(tuple -> orjson; tuple -> DataFrame.from_records). Dữ liệu sinh ngẫu nhiên, không cần DB:
+
+    python bench/bench_serialization.py --rows 10000
+
+Kiểm tra hai cách cho cùng nội dung JSON và cùng DataFrame, rồi in JSON: thời gian
+(ms, trung vị) và tổng byte cấp phát cao nhất (tracemalloc) của mỗi cách.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import report_rows  # noqa: E402
+
+COLUMNS = ['id', 'ward_id', 'city_id', 'date', 'procedure', 'count', 'age_group', 'gender',
+           'domain', 'auth_type', 'print_time', 'ward_name']
+
+
+def make_rows(n, seed=0):
+    rnd = random.Random(seed)
+    start = datetime.date(2025, 1, 1)
+    return [(
+        i, rnd.randint(1, 25), 1, start + datetime.timedelta(days=rnd.randint(0, 364)),
+        f"Thủ tục {rnd.randint(1, 60)}", rnd.randint(1, 5), rnd.choice(["<18", "18-30", "31-50", ">50"]),
+        rnd.choice(["Nam", "Nữ"]), rnd.choice(["Hộ tịch", "Đất đai", "Y tế"]), rnd.choice(["CCCD", "QR"]),
+        rnd.randint(7, 17), f"Phường {rnd.randint(1, 25)}",
+    ) for i in range(n)]
+
+
+def legacy_reports(dict_rows):
+    """Xử lý từng dòng như _query_reports trước đây (kể cả print response)."""
+    processed_data = []
+    for row in dict_rows:
+        if row:
+            processed_row = dict(row)
+            processed_row['hour'] = int(processed_row.get('print_time', 0))
+            if processed_row.get('date'):
+                processed_row['date'] = processed_row['date'].strftime('%Y-%m-%d')
+            if 'gender' not in processed_row:
+                processed_row['gender'] = None
+            processed_data.append(processed_row)
+    final_response = {"success": True, "data": processed_data, "total": len(processed_data), "next_cursor": None}
+    with contextlib.redirect_stdout(io.StringIO()):
+        print("Reports API response:", final_response)
+    return JSONResponse(jsonable_encoder(final_response)).body
+
+
+def legacy_frame(dict_rows):
+    processed_data = []
+    for row in dict_rows:
+        processed_row = dict(row)
+        processed_row['hour'] = int(processed_row['print_time']) if processed_row.get('print_time') is not None else None
+        if processed_row.get('date'):
+            processed_row['date'] = processed_row['date'].strftime('%Y-%m-%d')
+        processed_data.append(processed_row)
+    return pd.DataFrame(processed_data)
+
+
+def measure(fn, arg, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": round(statistics.median(samples), 2), "peak_alloc_kb": round(peak / 1024)}
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    dict_rows = [dict(zip(COLUMNS, row)) for row in rows]
+
+    new_body = report_rows.reports_json(COLUMNS, rows, args.rows + 1)
+    if json.loads(legacy_reports(dict_rows)) != json.loads(new_body):
+        sys.exit("JSON /reports khác với cách cũ")
+    pd.testing.assert_frame_equal(legacy_frame(dict_rows), report_rows.export_frame(COLUMNS, rows))
+
+    print(json.dumps({
+        "rows": args.rows,
+        "reports_legacy": measure(legacy_reports, dict_rows, args.repeat),
+        "reports_orjson": measure(lambda r: report_rows.reports_json(COLUMNS, r, args.rows + 1), rows, args.repeat),
+        "export_frame_legacy": measure(legacy_frame, dict_rows, args.repeat),
+        "export_frame_columnar": measure(lambda r: report_rows.export_frame(COLUMNS, r), rows, args.repeat),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    run()
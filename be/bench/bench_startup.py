@@ -0,0 +1,189 @@
+"""Đo thời gian khởi động và bộ nhớ của app: import main, thời gian tới response đầu tiên, RSS/PSS mỗi worker.
+
+    python bench/bench_startup.py --repeat 5 --workers 1 2 4
+
+- import: chạy --repeat process mới chỉ import main, so với khi nạp trước pandas/numpy/
+  xlsxwriter (như trước khi import lazy, hoặc PRELOAD_EXPORT=1); kèm thời gian nạp các
+  thư viện này ở export đầu tiên.
+- serve: khởi động uvicorn (1 process) và gunicorn (gunicorn.conf.py) với từng số --workers,
+  có và không có PRELOAD_EXPORT; đo thời gian tới khi GET / trả 200, rồi gọi /health/db
+  tới khi thấy đủ worker để lấy số liệu process (import, RSS, PSS) do từng worker báo.
+  total_pss_mb là tổng PSS của master và các worker (đọc /proc, chỉ trên Linux).
+
+Không cần MySQL: các thread nền báo lỗi kết nối nhưng server vẫn phục vụ / và /health/db
+(gọi bằng METRICS_TOKEN, mặc định "bench").
+Kết quả in ra dạng JSON.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BE = Path(__file__).resolve().parent.parent
+EXPORT_STACK = "import numpy, pandas, xlsxwriter"
+
+IMPORT_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+{preload}
+import main
+imported = time.perf_counter()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+{export_stack}
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "import_max_rss_mb": rss,
+    "export_stack_seconds": time.perf_counter() - imported,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("METRICS_TOKEN", "bench")
+    return env
+
+
+def _summary(values):
+    return {"median": round(statistics.median(values), 3), "min": round(min(values), 3),
+            "max": round(max(values), 3)}
+
+
+def measure_import(repeat, eager):
+    script = IMPORT_SCRIPT.format(preload=EXPORT_STACK if eager else "",
+                                  export_stack="" if eager else EXPORT_STACK)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", script], cwd=BE, env=_env(),
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: _summary([run[key] for run in runs]) for key in runs[0]}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url, timeout=2, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as resp:
+        return resp.status, resp.read()
+
+
+def _pss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def measure_server(name, cmd, env, workers, timeout):
+    port = _free_port()
+    cmd = [arg.replace("{port}", str(port)) for arg in cmd]
+    env = dict(env, PORT=str(port))
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=BE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    try:
+        while True:
+            if proc.poll() is not None:
+                return {"server": name, "error": f"exited with code {proc.returncode}"}
+            if time.perf_counter() - started > timeout:
+                return {"server": name, "error": "timeout"}
+            try:
+                if _get(base + "/")[0] == 200:
+                    break
+            except OSError:
+                time.sleep(0.02)
+        first_response = time.perf_counter() - started
+
+        # Mỗi request có thể vào worker khác: gọi tới khi thấy đủ số worker
+        seen, deadline = {}, time.perf_counter() + timeout
+        while len(seen) < workers and time.perf_counter() < deadline:
+            try:
+                _get(base + "/", timeout=5)   # chờ worker còn lại sẵn sàng
+                stats = json.loads(_get(base + "/health/db", 5, env["METRICS_TOKEN"])[1])["process"]
+                seen[stats["pid"]] = stats
+            except OSError:
+                time.sleep(0.05)
+        pids = [proc.pid] + _children(proc.pid)
+        pss = [_pss_mb(pid) for pid in pids]
+        return {
+            "server": name,
+            "first_response_seconds": round(first_response, 3),
+            "workers_seen": len(seen),
+            "total_pss_mb": round(sum(pss), 1) if pss and None not in pss else None,
+            "workers": [{
+                "pid": stats["pid"],
+                "preloaded": stats["preloaded"],
+                "import_seconds": stats["import_seconds"],
+                "startup_seconds": stats["startup_seconds"],
+                "rss_mb": round(stats["rss_bytes"] / 2**20, 1) if "rss_bytes" in stats else None,
+                "pss_mb": round(stats["pss_bytes"] / 2**20, 1) if "pss_bytes" in stats else None,
+                "heavy_modules_loaded": stats["heavy_modules_loaded"],
+            } for stats in seen.values()],
+        }
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="số lần đo import")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="số worker gunicorn")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--skip-serve", action="store_true", help="chỉ đo import")
+    args = parser.parse_args()
+
+    results = {
+        "cpus": os.cpu_count(),
+        "import": {"lazy": measure_import(args.repeat, eager=False),
+                   "eager": measure_import(args.repeat, eager=True)},
+    }
+    print(json.dumps({"import": results["import"]}), file=sys.stderr)
+    if not args.skip_serve:
+        env = _env()
+        servers = [("uvicorn", [sys.executable, "-m", "uvicorn", "main:app", "--port", "{port}"], env, 1)]
+        for n in args.workers:
+            for preload in ("0", "1"):
+                servers.append((f"gunicorn workers={n} preload_export={preload}",
+                                [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py"],
+                                dict(env, WEB_CONCURRENCY=str(n), PRELOAD_EXPORT=preload), n))
+        results["serve"] = []
+        for name, cmd, server_env, workers in servers:
+            result = measure_server(name, cmd, server_env, workers, args.timeout)
+            results["serve"].append(result)
+            print(json.dumps(result), file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,100 @@
+"""So sánh kích thước payload và thời gian giải mã phía client của các định dạng /reports.
+
+Định dạng: rows (JSON mỗi dòng một object, như trước đây), columnar (JSON theo cột,
+cột chuỗi mã hoá từ điển) và arrow (Arrow IPC, chỉ khi đã cài pyarrow). Dữ liệu sinh
+ngẫu nhiên như bench_serialization, không cần DB:
+
+    python bench/bench_wire_format.py --rows 10000
+
+Kiểm tra cả ba định dạng giải mã ra cùng danh sách dòng, rồi in JSON: số byte thô và
+sau gzip (mức 6, như middleware), thời gian encode trên server và decode về danh sách
+dict ở client (ms, trung vị); với arrow thêm thời gian chỉ đọc bảng theo cột.
+"""
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import report_rows  # noqa: E402
+from bench_serialization import COLUMNS, make_rows  # noqa: E402
+
+
+def decode_rows(body):
+    return json.loads(body)["data"]
+
+
+def decode_columnar(body):
+    payload = json.loads(body)
+    columns, data = payload["columns"], payload["data"]
+    decoded = []
+    for name in columns:
+        col = data[name]
+        if isinstance(col, dict):
+            dictionary = col["dictionary"]
+            col = [dictionary[code] for code in col["codes"]]
+        decoded.append(col)
+    keys = columns + ["hour"]
+    pt = columns.index("print_time")
+    return [dict(zip(keys, values + (values[pt],))) for values in zip(*decoded)]
+
+
+def decode_arrow(body):
+    import pyarrow as pa
+    table = pa.ipc.open_stream(body).read_all()
+    rows = table.to_pylist()
+    for row in rows:
+        row["date"] = row["date"].isoformat() if row["date"] else None
+        row["hour"] = row["print_time"]
+    return rows
+
+
+DECODERS = {"rows": decode_rows, "columnar": decode_columnar, "arrow": decode_arrow}
+
+
+def timed(fn, arg, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    formats = ["rows", "columnar"] + (["arrow"] if report_rows.ARROW_AVAILABLE else [])
+    expected = None
+    result = {"row_count": args.rows}
+    for fmt in formats:
+        body = report_rows.render(fmt, COLUMNS, rows, args.rows + 1)
+        decoded = DECODERS[fmt](body)
+        if expected is None:
+            expected = decoded
+        elif decoded != expected:
+            sys.exit(f"{fmt}: giải mã khác với rows")
+        result[fmt] = {
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, compresslevel=6)),
+            "encode_ms": timed(lambda r: report_rows.render(fmt, COLUMNS, r, args.rows + 1), rows, args.repeat),
+            "decode_ms": timed(DECODERS[fmt], body, args.repeat),
+        }
+        if fmt == "arrow":
+            # Client Arrow thường đọc thẳng theo cột, không dựng lại từng dòng
+            import pyarrow as pa
+            result[fmt]["read_columns_ms"] = timed(lambda b: pa.ipc.open_stream(b).read_all(), body, args.repeat)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    run()
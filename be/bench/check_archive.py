@@ -0,0 +1,187 @@
+"""Chạy khô archive.archive_partition (không cần MySQL): EXCHANGE → Parquet → kiểm đếm → DROP.
+
+Connection giả ghi lại mọi câu SQL và trả dữ liệu cho bảng tạm; file Parquet được ghi thật
+(pyarrow) vào thư mục tạm. Các trường hợp:
+
+1. ok: thứ tự EXCHANGE PARTITION, commit, đọc bảng tạm ra Parquet, COUNT(*), DROP PARTITION,
+   ghi report_archive, DROP bảng tạm; file có đủ số dòng.
+2. count mismatch: COUNT(*) của bảng tạm khác số dòng đã ghi → RuntimeError, không DROP
+   PARTITION, không ghi report_archive, bảng tạm còn nguyên để chạy lại.
+3. short file: file Parquet thiếu dòng so với số dòng _write_parquet báo → như trên.
+4. rerun: bảng tạm còn từ lần trước và partition đã bị xoá → không EXCHANGE/DROP PARTITION
+   lại, chỉ ghi file, report_archive và xoá bảng tạm.
+
+    python bench/check_archive.py --rows 25000
+
+Kiểm tra trên MySQL 8 thật (EXCHANGE/DROP PARTITION thật): bench/check_partitions.py.
+In ra một dòng ok/FAIL cho mỗi kiểm tra; thoát với mã 1 nếu có FAIL.
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import archive  # noqa: E402
+
+PARTITION = "p202501"
+STAGE = f"reports_archive_{PARTITION}"
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.last = ""
+        self.offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.last = " ".join(sql.split())
+        self.offset = 0
+        self.conn.log.append(self.last)
+
+    def fetchone(self):
+        if self.last.startswith("SHOW TABLES"):
+            return (STAGE,) if self.conn.stage_exists else None
+        if self.last.startswith("SELECT COUNT(*)"):
+            return {"n": self.conn.stage_count}
+        if "information_schema.PARTITIONS" in self.last:
+            return (1,) if self.conn.partition_exists else None
+        return None
+
+    def fetchmany(self, size):
+        batch = self.conn.rows[self.offset:self.offset + size]
+        self.offset += len(batch)
+        return batch
+
+
+class FakeConnection:
+    """Đủ cho archive_partition: cursor() (dict và SSCursor), commit(), nhật ký SQL."""
+
+    def __init__(self, rows, stage_count=None, stage_exists=False, partition_exists=True):
+        self.rows = rows
+        self.stage_count = len(rows) if stage_count is None else stage_count
+        self.stage_exists = stage_exists
+        self.partition_exists = partition_exists
+        self.log = []
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+
+def make_rows(n):
+    start = datetime.date(2025, 1, 1)
+    return [
+        (i + 1, i % 7 + 1, i % 3 + 1, start + datetime.timedelta(days=i % 31), "Khai sinh", 1,
+         "18-30", "Nam", "tuphap", "CCCD", 8 + i % 10, f"ev-{i}", f"Phường {i % 7 + 1}")
+        for i in range(n)
+    ]
+
+
+def position(log, prefix):
+    """Vị trí câu SQL đầu tiên bắt đầu bằng prefix (không có: None)."""
+    return next((i for i, sql in enumerate(log) if sql.startswith(prefix)), None)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=25000, help="số dòng của partition giả")
+    args = parser.parse_args()
+
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"[{'ok' if ok else 'FAIL'}] {name}" + (f": {detail}" if detail else ""))
+        if not ok:
+            failures.append(name)
+
+    rows = make_rows(args.rows)
+    exchange = f"ALTER TABLE reports EXCHANGE PARTITION `{PARTITION}`"
+    drop_partition = f"ALTER TABLE reports DROP PARTITION `{PARTITION}`"
+    insert_archive = f"INSERT INTO `{archive.ARCHIVE_TABLE}`"
+    drop_stage = f"DROP TABLE `{STAGE}`"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive.ARCHIVE_DIR = Path(tmp)
+        path = archive.ARCHIVE_DIR / f"reports_{PARTITION}.parquet"
+        parquet = archive._pyarrow().parquet
+
+        # 1. Đường thành công
+        conn = FakeConnection(rows)
+        archived = archive.archive_partition(conn, PARTITION)
+        log = conn.log
+        steps = [position(log, exchange), position(log, "SELECT r.id"), position(log, "SELECT COUNT(*)"),
+                 position(log, drop_partition), position(log, insert_archive), position(log, drop_stage)]
+        check("ok: every step ran", None not in steps, str(steps))
+        check("ok: EXCHANGE → Parquet → verify → DROP order", None not in steps and steps == sorted(steps),
+              str(steps))
+        check("ok: exchange committed before reading the stage table",
+              None not in steps and "COMMIT" in log[steps[0]:steps[1]])
+        check("ok: rows archived", archived == len(rows), f"{archived}/{len(rows)}")
+        check("ok: parquet rows", parquet.ParquetFile(path).metadata.num_rows == len(rows))
+        check("ok: no temp file left", not path.with_suffix(".parquet.tmp").exists())
+
+        # 2. COUNT(*) của bảng tạm khác số dòng đã ghi ra file
+        path.unlink()
+        conn = FakeConnection(rows, stage_count=len(rows) + 1)
+        try:
+            archive.archive_partition(conn, PARTITION)
+            raised = False
+        except RuntimeError as e:
+            raised = True
+            print(f"     {e}")
+        check("count mismatch: RuntimeError", raised)
+        check("count mismatch: DROP PARTITION skipped", position(conn.log, drop_partition) is None)
+        check("count mismatch: report_archive not written", position(conn.log, insert_archive) is None)
+        check("count mismatch: stage table kept", position(conn.log, drop_stage) is None)
+
+        # 3. File Parquet thiếu dòng (ví dụ ghi dở) dù _write_parquet báo đủ
+        write_parquet = archive._write_parquet
+
+        def short_write(conn, table, path):
+            written = write_parquet(conn, table, path)
+            parquet.write_table(parquet.read_table(path).slice(0, written - 1), path)
+            return written
+
+        archive._write_parquet = short_write
+        try:
+            conn = FakeConnection(rows)
+            try:
+                archive.archive_partition(conn, PARTITION)
+                raised = False
+            except RuntimeError:
+                raised = True
+        finally:
+            archive._write_parquet = write_parquet
+        check("short file: RuntimeError", raised)
+        check("short file: DROP PARTITION skipped", position(conn.log, drop_partition) is None)
+        check("short file: report_archive not written", position(conn.log, insert_archive) is None)
+        check("short file: stage table kept", position(conn.log, drop_stage) is None)
+
+        # 4. Chạy lại sau khi dừng giữa chừng: bảng tạm còn, partition đã xoá
+        conn = FakeConnection(rows, stage_exists=True, partition_exists=False)
+        archived = archive.archive_partition(conn, PARTITION)
+        check("rerun: no second EXCHANGE", position(conn.log, exchange) is None)
+        check("rerun: no DROP of a missing partition", position(conn.log, drop_partition) is None)
+        check("rerun: report_archive written, stage dropped",
+              position(conn.log, insert_archive) is not None and position(conn.log, drop_stage) is not None)
+        check("rerun: parquet rows", archived == len(rows) and parquet.ParquetFile(path).metadata.num_rows == len(rows))
+
+    print(f"{len(failures)} archive check(s) failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
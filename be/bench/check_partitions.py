@@ -0,0 +1,143 @@
+"""Kiểm tra phân vùng theo tháng và archive Parquet của bảng reports trên MySQL/MariaDB local.
+
+Cần MySQL/MariaDB local (xem check_query_plans.py) và pyarrow. Script nạp lại dữ liệu:
+
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk MYSQL_SSL=0 \\
+        python bench/check_partitions.py --load ../ai_kiosk.sql
+
+Các bước: nạp dump, chạy migrations, chia partition tháng; kiểm tra truy vấn có khoảng
+ngày chỉ đọc partition của tháng đó; archive tháng cũ nhất ra thư mục tạm; so sánh
+dữ liệu export (MySQL + archive) trước và sau archive cho từng role; ingest vào tháng
+đã archive bị từ chối, ingest vào tháng còn trong MySQL rồi gửi lại cùng sự kiện. Thoát với mã 1 nếu có bước sai.
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("SECRET_KEY", "check-partitions")
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import archive  # noqa: E402
+import cache  # noqa: E402
+import db  # noqa: E402
+import ingest  # noqa: E402
+import migrate  # noqa: E402
+import report_queries  # noqa: E402
+import report_rows  # noqa: E402
+from check_query_plans import ADMIN, CITY, WARD, load_dump  # noqa: E402
+
+CASES = [
+    ("admin all", ADMIN, None, None, None),
+    ("admin ward 2", ADMIN, 2, None, None),
+    ("city dates", CITY, None, "2025-06-20", "2025-07-05"),
+    ("ward june", WARD, None, "2025-06-01", "2025-06-30"),
+]
+
+
+def export_rows(conn, user, ward_id, start, end, limit=100000, offset=0):
+    """Các dòng export giống main._build_export (buffer): MySQL rồi archive nối tiếp."""
+    sql, params = report_queries.list_reports_query(user, limit, offset, ward_id, start, end)
+    _, rows = report_rows.fetch(conn, sql, params)
+    rows = list(rows)
+    for batch in archive.tail(conn, user, limit, offset, ward_id, start, end, len(rows)):
+        rows += batch
+    # ward_name của archive là ảnh chụp lúc archive; dữ liệu mẫu không đổi tên ward
+    return rows
+
+
+def explain_partitions(cursor, sql, params):
+    cursor.execute("EXPLAIN " + sql, params)
+    plan = cursor.fetchall()
+    if plan and "partitions" not in plan[0]:
+        # MariaDB chỉ hiện cột partitions với EXPLAIN PARTITIONS
+        cursor.execute("EXPLAIN PARTITIONS " + sql, params)
+        plan = cursor.fetchall()
+    return {p for row in plan if row.get("table") == "r" for p in (row.get("partitions") or "").split(",") if p}
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load", help="đường dẫn ai_kiosk.sql để nạp lại dữ liệu trước khi kiểm tra")
+    args = parser.parse_args()
+    archive.ARCHIVE_DIR = Path(tempfile.mkdtemp(prefix="report_archive_"))
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"[{'ok' if ok else 'FAIL'}] {name}{': ' + detail if detail and not ok else ''}")
+        if not ok:
+            failures.append(name)
+
+    conn = db.get_connection()
+    try:
+        if args.load:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS `report_archive`")
+                cursor.execute("SHOW TABLES LIKE 'reports\\_archive\\_p%'")
+                for row in cursor.fetchall():
+                    cursor.execute(f"DROP TABLE `{list(row.values())[0]}`")
+            load_dump(conn, args.load)
+        migrate.apply_all(conn)
+        created = archive.ensure_partitions(conn)
+        with conn.cursor() as cursor:
+            parts = archive.partitions(cursor)
+            check("monthly partitions", [name for name, _ in parts][:2] == ["p202506", "p202507"],
+                  f"created {created}, have {parts}")
+            sql, params = report_queries.list_reports_query(WARD, 100, 0, None, "2025-06-01", "2025-06-30")
+            pruned = explain_partitions(cursor, sql, params)
+            check("partition pruning (June)", pruned == {"p202506"}, f"read {sorted(pruned)}")
+            version_before = cache.data_version(conn)
+
+        before = {name: export_rows(conn, user, ward, start, end) for name, user, ward, start, end in CASES}
+        paged_before = export_rows(conn, ADMIN, None, None, None, limit=500, offset=4000)
+
+        # Số tháng giữ lại sao cho chỉ tháng 6/2025 (tháng cũ nhất trong dump) hết hạn
+        today = datetime.date.today()
+        months = (today.year * 12 + today.month) - (2025 * 12 + 7)
+        archived = archive.run_retention(conn, months)
+        check("archive June", list(archived) == ["p202506"] and archived["p202506"] > 0, str(archived))
+        with conn.cursor() as cursor:
+            remaining = [name for name, _ in archive.partitions(cursor)]
+            check("partition dropped", "p202506" not in remaining, str(remaining))
+            cursor.execute("SELECT COUNT(*) AS n FROM reports WHERE date < '2025-07-01'")
+            check("no June rows left in MySQL", cursor.fetchone()['n'] == 0)
+            cache.invalidate_version()
+            check("cache version changes", cache.data_version(conn) != version_before)
+
+        for name, user, ward, start, end in CASES:
+            after = export_rows(conn, user, ward, start, end)
+            check(f"export parity {name}", after == before[name], f"{len(before[name])} -> {len(after)} rows")
+        paged_after = export_rows(conn, ADMIN, None, None, None, limit=500, offset=4000)
+        check("export parity offset across archive", paged_after == paged_before)
+
+        # Dòng đến muộn cho tháng đã archive bị từ chối (gửi lại sẽ không khớp bản trong file)
+        with conn.cursor() as cursor:
+            cutoff = archive.ingest_cutoff(cursor, months)
+        check("ingest cutoff after archived month", cutoff == datetime.date(2025, 7, 1), str(cutoff))
+        late = ingest.PrintEvent(event_id="check-partitions-late", ward_id=1, date="2025-06-15",
+                                 procedure="Kiểm tra", count=1, print_time=9)
+        try:
+            ingest.check_dates([(late, 1, 1)], cutoff)
+            rejected = False
+        except ingest.IngestError:
+            rejected = True
+        check("late ingest into archived month rejected", rejected)
+        event = ingest.PrintEvent(event_id="check-partitions-live", ward_id=1, date="2025-07-15",
+                                  procedure="Kiểm tra", count=1, print_time=9)
+        ingest.check_dates([(event, 1, 1)], cutoff)
+        first = ingest.insert_events(conn, [(event, 1, 1)])
+        again = ingest.insert_events(conn, [(event, 1, 1)])
+        check("ingest into live month, retry ignored", first == 1 and again == 0, f"inserted {first}, retry {again}")
+    finally:
+        conn.close()
+
+    print(f"{len(failures)} partition check(s) failed; archive files in {archive.ARCHIVE_DIR}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
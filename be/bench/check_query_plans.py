@@ -0,0 +1,144 @@
+"""Kiểm tra kế hoạch thực thi (EXPLAIN) của mọi câu SELECT mà main.py chạy.
+
+Cần một MySQL/MariaDB local (ví dụ `docker run -e MARIADB_ROOT_PASSWORD=root -p 3306:3306 mariadb:11`):
+
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk MYSQL_SSL=0 \
+        python bench/check_query_plans.py --load ../ai_kiosk.sql
+
+Script nạp ai_kiosk.sql (nếu có --load), chạy migrations, dựng rollup, rồi gọi các hàm xử lý
+của main.py cho từng role với một cursor ghi lại mọi câu SELECT và EXPLAIN nó.
+Thoát với mã 1 nếu có truy vấn quét toàn bảng (type=ALL) hoặc phải filesort mà không
+được khai báo là chấp nhận được.
+"""
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SECRET_KEY", "check-query-plans")
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import pymysql  # noqa: E402
+
+import db  # noqa: E402
+import distributions  # noqa: E402
+import main  # noqa: E402
+import migrate  # noqa: E402
+import report_queries  # noqa: E402
+import rollup  # noqa: E402
+
+TABLES = ["users", "reports", "wards", "cities", "schema_migrations", "report_archive", rollup.STATE_TABLE,
+          distributions.TABLE] + [
+    table for table, _ in rollup.ROLLUPS.values()
+]
+
+ADMIN = {"user_id": 0, "username": "admin", "role": "admin", "ward_id": None, "city_id": None}
+CITY = {"user_id": 0, "username": "city", "role": "city", "ward_id": None, "city_id": 1}
+WARD = {"user_id": 1, "username": "ward", "role": "ward", "ward_id": 1, "city_id": 1}
+START, END = "2025-06-01", "2025-06-30"
+ALL_SUMMARIES = list(report_queries.SUMMARIES)
+
+# (tên, hàm gọi, cho phép quét toàn bảng, cho phép filesort)
+# Admin không lọc phạm vi đọc toàn bộ dữ liệu nên quét toàn bảng là bình thường;
+# các truy vấn GROUP BY ... ORDER BY value sắp xếp kết quả đã gộp (vài chục dòng).
+CASES = [
+    ("login", lambda: main._find_user("user_ward_2"), False, False),
+    ("users admin", lambda: main._fetch_users(ADMIN), True, False),
+    ("users city", lambda: main._fetch_users(CITY), False, False),
+    ("users ward", lambda: main._fetch_users(WARD), False, False),
+    ("reports admin", lambda: main._query_reports(ADMIN, 100, 0), False, False),
+    ("reports city", lambda: main._query_reports(CITY, 100, 0), False, False),
+    ("reports ward", lambda: main._query_reports(WARD, 100, 0), False, False),
+    ("export ward dates", lambda: main._build_export(WARD, 10000, 0, "Ngày", START, END, None, "xlsx"), False, False),
+    ("export city ward", lambda: main._build_export(CITY, 10000, 0, "Tuần", None, None, 2, "xlsx"), False, False),
+    ("export city dates", lambda: main._build_export(CITY, 10000, 0, "Ngày", START, END, None, "csv"), False, False),
+    ("export admin all", lambda: main._build_export(ADMIN, 10000, 0, "Ngày", None, None, None, "xlsx"), True, True),
+    ("summary ward", lambda: main._query_summary(WARD, ALL_SUMMARIES, None, None, None, "Ngày", 8), False, True),
+    ("summary city dates", lambda: main._query_summary(CITY, ALL_SUMMARIES, None, START, END, "Tuần", 8), False, True),
+    ("summary admin", lambda: main._query_summary(ADMIN, ALL_SUMMARIES, None, None, None, "Ngày", 8), True, True),
+    ("distribution ward", lambda: main._query_distribution(WARD, "hour", None, "2025-05-20", END), False, True),
+    ("distribution city", lambda: main._query_distribution(CITY, "ward", None, "2025-05-20", END), False, True),
+    ("distribution admin", lambda: main._query_distribution(ADMIN, "hour", None, None, None), False, True),
+]
+
+
+class ExplainingCursor(pymysql.cursors.DictCursor):
+    """Cursor chạy EXPLAIN trước mỗi câu SELECT và lưu kế hoạch vào `plans`."""
+    plans = []
+
+    def execute(self, query, args=None):
+        if query.lstrip().upper().startswith("SELECT"):
+            super().execute("EXPLAIN " + query, args)
+            ExplainingCursor.plans.append((" ".join(query.split()), super().fetchall()))
+        return super().execute(query, args)
+
+
+@contextmanager
+def explaining_connection():
+    conn = db.get_connection()
+    conn.cursorclass = ExplainingCursor
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def load_dump(conn, path):
+    with conn.cursor() as cursor:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        for stmt in migrate.split_statements(Path(path).read_text(encoding="utf-8")):
+            cursor.execute(stmt.rstrip(";"))
+    conn.commit()
+
+
+def problems(plan, allow_full_scan, allow_filesort):
+    found = []
+    for row in plan:
+        extra = row.get("Extra") or ""
+        if row.get("type") == "ALL" and not allow_full_scan:
+            found.append(f"full scan on {row.get('table')}")
+        if "Using filesort" in extra and not allow_filesort:
+            found.append(f"filesort on {row.get('table')}")
+    return found
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load", help="đường dẫn ai_kiosk.sql để nạp lại dữ liệu trước khi kiểm tra")
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    try:
+        if args.load:
+            load_dump(conn, args.load)
+        migrate.apply_all(conn)
+        rollup.ensure_schema(conn)
+        with conn.cursor() as cursor:
+            rollup.rebuild(conn, rollup.max_report_id(cursor))
+        distributions.rebuild(conn)
+    finally:
+        conn.close()
+
+    main.db_connection = explaining_connection
+    failures = 0
+    for name, call, allow_full_scan, allow_filesort in CASES:
+        ExplainingCursor.plans = []
+        call()
+        for query, plan in ExplainingCursor.plans:
+            found = problems(plan, allow_full_scan, allow_filesort)
+            status = "FAIL" if found else "ok"
+            print(f"[{status}] {name}: {query[:110]}")
+            for issue in found:
+                print(f"       {issue}")
+            failures += bool(found)
+    print(f"{failures} query plan regression(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
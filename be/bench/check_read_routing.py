@@ -0,0 +1,161 @@
+"""Kiểm tra định tuyến đọc/ghi của db.py với một primary và các read replica MySQL/MariaDB local.
+
+Dựng primary + replica bằng hai container MariaDB (replication theo GTID, replica read_only):
+
+    docker network create kiosk
+    docker run -d --name kiosk-primary --network kiosk -p 3306:3306 -e MARIADB_ROOT_PASSWORD=root \\
+        -e MARIADB_DATABASE=ai_kiosk mariadb:11 --server-id=1 --log-bin=mysql-bin --binlog-format=ROW
+    docker run -d --name kiosk-replica --network kiosk -p 3307:3306 -e MARIADB_ROOT_PASSWORD=root \\
+        mariadb:11 --server-id=2 --read-only=1
+    docker exec kiosk-replica mariadb -uroot -proot -e "CHANGE MASTER TO MASTER_HOST='kiosk-primary', \\
+        MASTER_USER='root', MASTER_PASSWORD='root', MASTER_USE_GTID=slave_pos; START SLAVE;"
+    mariadb -h127.0.0.1 -uroot -proot ai_kiosk < ../ai_kiosk.sql      # nạp vào primary
+
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk MYSQL_SSL=0 \\
+        MYSQL_READ_REPLICAS=127.0.0.1:3307 python bench/check_read_routing.py --toggle-replication
+
+(Hai process mysqld/mariadbd chạy trên hai cổng với cùng cấu hình cũng dùng được.)
+
+Các bước: primary và replica là hai server khác nhau (@@server_id); các lần đọc qua
+read_connection chia đều cho các replica; ghi trên primary, read_connection(session) của
+session vừa note_write đọc từ primary và thấy ngay dòng mới, rồi dòng đó xuất hiện trên
+replica (đo độ trễ); một replica không kết nối được (--dead-replica) bị loại và các lần
+đọc vẫn thành công; check() đọc được độ trễ replication. Với --toggle-replication: dừng
+replication trên replica thì check() loại replica, chạy lại thì replica được nhận lại.
+Thoát với mã 1 nếu có bước sai.
+"""
+import argparse
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+
+def server_id(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT @@server_id AS id, @@read_only AS read_only")
+        return cursor.fetchone()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=40, help="số lần đọc để kiểm tra chia tải")
+    parser.add_argument("--lag-timeout", type=float, default=10, help="giây chờ dòng mới xuất hiện trên replica")
+    parser.add_argument("--dead-replica", default="127.0.0.1:1", help="địa chỉ replica không kết nối được")
+    parser.add_argument("--toggle-replication", action="store_true",
+                        help="dừng/chạy lại replication trên replica đầu tiên (cần quyền SUPER/REPLICATION ADMIN)")
+    args = parser.parse_args()
+
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"[{'ok' if ok else 'FAIL'}] {name}{': ' + detail if detail else ''}")
+        if not ok:
+            failures.append(name)
+
+    if not db.router.replicas:
+        sys.exit("Chưa cấu hình MYSQL_READ_REPLICAS")
+    router = db.ReadRouter(db.router.replicas, eject_seconds=60, read_your_writes=30)
+
+    with db.db_connection() as conn:
+        primary = server_id(conn)
+    ids = {}
+    for replica in router.replicas:
+        conn = replica.pool.acquire()
+        try:
+            info = server_id(conn)
+        finally:
+            replica.pool.release(conn)
+        ids[info["id"]] = replica.address
+        check(f"replica {replica.address} khác primary", info["id"] != primary["id"],
+              f"server_id {info['id']}, read_only {info['read_only']}")
+    check("mỗi replica một server", len(ids) == len(router.replicas))
+
+    served = Counter()
+    for _ in range(args.reads):
+        with router.connection() as conn:
+            served[server_id(conn)["id"]] += 1
+    check("đọc chỉ từ replica", primary["id"] not in served, f"{dict(served)}")
+    check("chia tải cho mọi replica", len(served) == len(router.replicas), f"{dict(served)}")
+
+    session = f"check_{uuid.uuid4().hex[:8]}"
+    with db.db_connection() as conn, conn.cursor() as cursor:
+        # user_id trong ai_kiosk.sql không có AUTO_INCREMENT
+        cursor.execute("INSERT INTO users (user_id, username, password_hash, role) "
+                       "SELECT COALESCE(MAX(user_id), 0) + 1, %s, %s, 'admin' FROM users", (session, "x"))
+        conn.commit()
+    written = time.monotonic()
+    router.note_write(session)
+    try:
+        with router.connection(session) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT @@server_id AS id, COUNT(*) AS n FROM users WHERE username = %s", (session,))
+            row = cursor.fetchone()
+        check("read-your-writes đọc từ primary và thấy dòng mới", row["id"] == primary["id"] and row["n"] == 1,
+              f"server_id {row['id']}, {row['n']} dòng")
+        for replica in router.replicas:
+            seen = None
+            while time.monotonic() - written < args.lag_timeout:
+                conn = replica.pool.acquire()
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT COUNT(*) AS n FROM users WHERE username = %s", (session,))
+                        if cursor.fetchone()["n"]:
+                            seen = time.monotonic() - written
+                            break
+                finally:
+                    replica.pool.release(conn)
+                time.sleep(0.05)
+            check(f"dòng mới có trên replica {replica.address}", seen is not None,
+                  f"sau {seen * 1000:.0f} ms" if seen is not None else f"chưa có sau {args.lag_timeout}s")
+    finally:
+        with db.db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM users WHERE username = %s", (session,))
+            conn.commit()
+
+    dead = db.Replica(args.dead_replica, size=2)
+    mixed = db.ReadRouter(router.replicas + [dead], eject_seconds=60)
+    errors = 0
+    for _ in range(args.reads):
+        try:
+            with mixed.connection() as conn:
+                server_id(conn)
+        except Exception:
+            errors += 1
+    check("replica chết bị loại, các lần đọc vẫn thành công", errors == 0 and not dead.healthy(),
+          f"{errors} lỗi, {mixed.stats()}")
+
+    router.check()
+    check("check(): mọi replica khoẻ", all(r.healthy() for r in router.replicas),
+          ", ".join(f"{r.address} lag {r.lag}" for r in router.replicas))
+
+    if args.toggle_replication:
+        replica = router.replicas[0]
+        conn = replica.pool.acquire()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("STOP SLAVE")
+            router.check()
+            check("dừng replication: replica bị loại", not replica.healthy(), str(replica.error))
+            with conn.cursor() as cursor:
+                cursor.execute("START SLAVE")
+        finally:
+            replica.pool.release(conn)
+        deadline = time.monotonic() + args.lag_timeout
+        while time.monotonic() < deadline:
+            router.check()
+            if replica.healthy():
+                break
+            time.sleep(0.5)
+        check("chạy lại replication: replica được nhận lại", replica.healthy(), f"lag {replica.lag}")
+
+    print(f"{len(failures)} routing check(s) failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
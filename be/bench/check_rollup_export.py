@@ -0,0 +1,151 @@
+"""Kiểm tra các sheet tổng hợp của export: đọc số đếm từ rollup phải giống đếm từ DataFrame.
+
+Hai cách main._build_export dựng sheet: rollup.export_counts (các bảng rollup) và
+export_sheets.counts_from_frame (DataFrame các dòng export). Dữ liệu datagen được thêm
+giá trị '' và NULL ở mọi cột chuỗi và các giá trị chỉ khác hoa/thường ('Nam'/'nam',
+'QR'/'qr'): NULL bị bỏ qua như pandas groupby, còn '' và từng cách viết là nhóm riêng.
+Mặc định chạy trên replica DuckDB tạm (view cùng cột với bảng rollup MySQL); với --mysql
+chạy trên MySQL đang cấu hình sau khi refresh rollup (không sửa dữ liệu reports).
+
+    python bench/check_rollup_export.py --rows 100000
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk_bench MYSQL_SSL=0 \\
+        python bench/check_rollup_export.py --mysql
+
+Dòng không có ngày không có trong rollup (export khi đó luôn đếm từ DataFrame) nên không
+được sinh ra. In một dòng ok/FAIL cho mỗi phạm vi × khoảng ngày × cách nhóm; thoát với
+mã 1 nếu có FAIL.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import datagen  # noqa: E402
+import db  # noqa: E402
+import export_sheets  # noqa: E402
+import replica  # noqa: E402
+import report_queries  # noqa: E402
+import report_rows  # noqa: E402
+import rollup  # noqa: E402
+from bench_replica import CITIES, WARDS  # noqa: E402
+
+TEXT_COLUMNS = ['procedure', 'age_group', 'gender', 'domain', 'auth_type']
+VARIANTS = {'gender': {'Nam': 'nam', 'Nữ': 'nữ'}, 'auth_type': {'QR': 'qr'}}
+RANGES = [(None, None), ("2024-03-01", "2024-06-30")]
+
+
+def with_blanks(frame, seed):
+    """Thêm '' , NULL và giá trị khác hoa/thường vào các cột chuỗi của một lô datagen."""
+    rng = np.random.default_rng(seed)
+    frame = frame.copy()
+    for column in TEXT_COLUMNS:
+        values = frame[column].to_numpy(dtype=object)
+        pick = rng.random(len(values))
+        for old, new in VARIANTS.get(column, {}).items():
+            values[(pick < 0.05) & (values == old)] = new
+        values[(pick >= 0.05) & (pick < 0.07)] = ''
+        values[(pick >= 0.07) & (pick < 0.09)] = None
+        frame[column] = values
+    return frame
+
+
+def load_duckdb(path, total):
+    rep = replica.Replica(path)
+    if not rep.open():
+        sys.exit(f"Không mở được DuckDB: {rep.error}")
+    geo = datagen.Geography(WARDS, CITIES)
+    wards, cities = geo.frames()
+    con = rep._db.cursor()
+    con.register("new_wards", wards)
+    con.execute("INSERT INTO wards SELECT * FROM new_wards")
+    con.register("new_cities", cities)
+    con.execute("INSERT INTO cities SELECT * FROM new_cities")
+    for i, frame in enumerate(datagen.frames(total, geo)):
+        con.register("new_reports", with_blanks(frame, i))
+        con.execute("INSERT INTO reports SELECT * FROM new_reports")
+    con.close()
+    rep.synced = True
+    return rep
+
+
+def scopes(cursor):
+    cursor.execute("SELECT ward_id, city_id FROM wards ORDER BY ward_id LIMIT 1")
+    ward = cursor.fetchone()
+    return [
+        {"role": "admin"},
+        {"role": "city", "city_id": ward['city_id']},
+        {"role": "ward", "ward_id": ward['ward_id']},
+    ]
+
+
+def differences(left, right):
+    errors = []
+    for key, _, _, _ in export_sheets.SUMMARY_SHEETS:
+        a, b = left[key].reset_index(drop=True), right[key].reset_index(drop=True)
+        if not a.astype(str).equals(b.astype(str)):
+            errors.append(f"{key}: rollup {len(a)} dòng, DataFrame {len(b)} dòng")
+    return errors
+
+
+def check(conn, report, label):
+    with conn.cursor() as cursor:
+        users = scopes(cursor)
+    for user in users:
+        for start, end in RANGES:
+            sql, params = report_queries.list_reports_query(user, 10 ** 9, 0, None, start, end)
+            columns, data = report_rows.fetch(conn, sql, params)
+            frame = report_rows.export_frame(columns, data)
+            where, where_params = report_queries.report_filter(user, None, start, end, business_hours=False)
+            with conn.cursor() as cursor:
+                counts = rollup.export_counts(cursor, where, where_params)
+            for group_by in ("Ngày", "Tuần"):
+                from_rollup = export_sheets.build_sheets(counts, group_by)
+                from_frame = export_sheets.build_sheets(export_sheets.counts_from_frame(frame), group_by)
+                report(f"{label} {user['role']} {start or ''}..{end or ''} {group_by}: {len(data)} dòng",
+                       differences(from_rollup, from_frame))
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="số dòng reports cho replica DuckDB")
+    parser.add_argument("--mysql", action="store_true", help="kiểm tra trên MySQL đang cấu hình")
+    args = parser.parse_args()
+
+    failures = 0
+
+    def report(name, errors):
+        nonlocal failures
+        print(f"[{'FAIL' if errors else 'ok'}] {name}")
+        for error in errors[:5]:
+            print(f"       {error}")
+        failures += bool(errors)
+
+    if args.mysql:
+        conn = db.get_connection()
+        try:
+            rollup.ensure_schema(conn)
+            rollup.refresh(conn, rollup.settle(conn))
+            check(conn, report, "mysql")
+        finally:
+            conn.close()
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            rep = load_duckdb(os.path.join(tmp, "check.duckdb"), args.rows)
+            conn = rep.connection()
+            check(conn, report, "duckdb")
+            conn.close()
+            rep._db.close()
+    print(f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,219 @@
+"""Kiểm tra độ chính xác của sketch KLL (sketches.py) và /reports/distribution so với phân vị pandas.
+
+1. sketch: với từng phân phối mẫu (nhị thức âm như số lượt in theo ngày, lognormal đuôi dài,
+   hằng số, vài giá trị), dựng sketch bằng update() và bằng cách gộp nhiều sketch nhỏ đã
+   qua to_bytes/from_bytes (như sketch ward × tháng gộp lên city/admin). n, min, max phải
+   chính xác; sketch chưa nén phải cho đúng pandas.Series.quantile; sketch đã nén phải có sai
+   số hạng (rank) của mọi phân vị trong --quantiles không vượt --max-rank-error.
+2. distribution: chạy distributions.distribution (by=ward và by=hour, admin/city/ward, có và
+   không có khoảng ngày) trên dữ liệu datagen và so từng box với phân vị pandas tính từ các
+   dòng reports gốc. Mặc định trên replica DuckDB tạm (đọc mẫu từ bảng gốc); với --mysql
+   trên MySQL đang cấu hình, đọc từ sketch đã lưu (chạy distributions.rebuild trước nếu có
+   --rebuild; --load nạp lại dữ liệu bằng datagen.load_mysql, xoá reports).
+
+    python bench/check_sketches.py --rows 200000
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk_bench MYSQL_SSL=0 \\
+        python bench/check_sketches.py --rows 1000000 --mysql --load
+
+In ra một dòng ok/FAIL cho mỗi trường hợp; thoát với mã 1 nếu có FAIL.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import datagen  # noqa: E402
+import db  # noqa: E402
+import distributions  # noqa: E402
+import replica  # noqa: E402
+import report_queries  # noqa: E402
+import rollup  # noqa: E402
+import sketches  # noqa: E402
+from bench_replica import CITIES, WARDS, load_duckdb  # noqa: E402
+
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+RANGES = [(None, None), ("2025-02-10", "2025-05-20"), ("2025-03-01", "2025-04-30"), ("2025-03-05", "2025-03-25")]
+
+
+def samples(rng, n):
+    return {
+        "negative_binomial": rng.negative_binomial(3, 0.05, n),
+        "lognormal": np.round(rng.lognormal(3, 1.2, n)).astype(int),
+        "constant": np.full(n, 7),
+        "few_values": rng.integers(0, 4, n),
+    }
+
+
+def rank_error(ordered, value, q):
+    """Khoảng cách từ q tới khoảng hạng (chuẩn hoá) mà value chiếm trong dữ liệu đã sắp xếp."""
+    lo = np.searchsorted(ordered, value, "left") / len(ordered)
+    hi = np.searchsorted(ordered, value, "right") / len(ordered)
+    return 0.0 if lo <= q <= hi else min(abs(q - lo), abs(q - hi))
+
+
+def compare(sketch, values, quantiles, max_rank_error):
+    """Danh sách lỗi của sketch so với mảng giá trị gốc, và sai số hạng lớn nhất."""
+    errors, worst = [], 0.0
+    ordered = np.sort(values)
+    if sketch.n != len(values) or sketch.min != ordered[0] or sketch.max != ordered[-1]:
+        errors.append(f"n/min/max {sketch.n}/{sketch.min}/{sketch.max} != "
+                      f"{len(values)}/{ordered[0]}/{ordered[-1]}")
+    series = pd.Series(ordered)
+    for q in quantiles:
+        value = sketch.quantile(q)
+        if sketch.exact:
+            if abs(value - series.quantile(q)) > 1e-9:
+                errors.append(f"q={q}: {value} != pandas {series.quantile(q)}")
+        else:
+            err = rank_error(ordered, value, q)
+            worst = max(worst, err)
+            if err > max_rank_error:
+                errors.append(f"q={q}: rank error {err:.4f}")
+    return errors, worst
+
+
+def check_sketches(args, report):
+    rng = np.random.default_rng(args.seed)
+    for n in args.sizes:
+        for name, values in samples(rng, n).items():
+            values = values.tolist()
+            streamed = sketches.KLL(seed=args.seed)
+            for value in values:
+                streamed.update(value)
+            merged = sketches.KLL(seed=args.seed)
+            for i in range(0, n, 31):
+                part = sketches.KLL()
+                for value in values[i:i + 31]:
+                    part.update(value)
+                merged.merge(sketches.KLL.from_bytes(part.to_bytes()))
+            for how, sketch in (("update", streamed), ("merge", merged)):
+                errors, worst = compare(sketch, values, args.quantiles, args.max_rank_error)
+                box = sketches.box_stats(sketch)
+                ordered = np.sort(values)
+                q1, q3 = np.quantile(ordered, [0.25, 0.75])
+                fence = sketches.WHISKER * (q3 - q1)
+                outside = int(((ordered < q1 - fence) | (ordered > q3 + fence)).sum())
+                # Số giá trị ngoài râu: sai lệch tối đa bằng sai số hạng ở hai đầu
+                if abs(box["outlier_count"] - outside) > max(2, 2 * args.max_rank_error * n):
+                    errors.append(f"outlier_count {box['outlier_count']} != {outside}")
+                report(f"sketch {name} n={n} {how} (retained {sum(len(lv) for lv in sketch.levels)}, "
+                       f"max rank error {worst:.4f})", errors)
+
+
+def reference(df, user, by, start, end):
+    """Mẫu chính xác theo nhóm (ward hoặc giờ) từ các dòng reports gốc."""
+    d = df
+    if user["role"] == "city":
+        d = d[d.city_id == user["city_id"]]
+    elif user["role"] == "ward":
+        d = d[d.ward_id == user["ward_id"]]
+    if start:
+        d = d[d.date >= pd.Timestamp(start)]
+    if end:
+        d = d[d.date <= pd.Timestamp(end)]
+    keys = ["ward_id", "city_id", "date"] + (["print_time"] if by == "hour" else [])
+    daily = d.groupby(keys)["weight"].sum().reset_index()
+    group = "ward_id" if by == "ward" else "print_time"
+    return {int(k): values.to_numpy() for k, values in daily.groupby(group)["weight"]}
+
+
+def check_distribution(args, report, cursor, raw, source, use_sketches, label):
+    df = pd.DataFrame.from_records(raw, columns=["ward_id", "city_id", "date", "print_time", "count"])  # dòng dict
+    df = df[df.date.notna() & df.print_time.between(*report_queries.BUSINESS_HOURS)]
+    df["date"] = pd.to_datetime(df["date"])
+    df["ward_id"] = df["ward_id"].fillna(0).astype(int)
+    df["city_id"] = df["city_id"].fillna(0).astype(int)
+    df["weight"] = df["count"].fillna(0).astype(int).replace(0, 1)
+    users = [{"role": "admin"}, {"role": "city", "city_id": int(df.city_id.iloc[0])},
+             {"role": "ward", "ward_id": int(df.ward_id.iloc[0])}]
+    for user in users:
+        for by in distributions.BY:
+            for start, end in RANGES:
+                started = time.perf_counter()
+                got = distributions.distribution(cursor, user, by, None, start, end, source, use_sketches)
+                ms = (time.perf_counter() - started) * 1000
+                expected = reference(df, user, by, start, end)
+                errors, worst = [], 0.0
+                if set(got) != set(expected):
+                    errors.append(f"groups differ: {sorted(set(got) ^ set(expected))[:10]}")
+                for key in set(got) & set(expected):
+                    box, ordered = got[key], np.sort(expected[key])
+                    if (box["n"], box["min"], box["max"]) != (len(ordered), ordered[0], ordered[-1]):
+                        errors.append(f"{key}: n/min/max {box['n']}/{box['min']}/{box['max']}")
+                    for q, field in ((0.25, "q1"), (0.5, "median"), (0.75, "q3")):
+                        if box["exact"]:
+                            if abs(box[field] - np.quantile(ordered, q)) > 0.01:
+                                errors.append(f"{key} {field}: {box[field]} != {np.quantile(ordered, q)}")
+                        else:
+                            worst = max(worst, rank_error(ordered, box[field], q))
+                if worst > args.max_rank_error:
+                    errors.append(f"max rank error {worst:.4f}")
+                report(f"distribution {label} {user['role']} by={by} {start or ''}..{end or ''}: "
+                       f"{len(got)} groups, max rank error {worst:.4f}, {ms:.0f} ms", errors)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[31, 500, 10000, 200000], help="số giá trị mỗi sketch")
+    parser.add_argument("--quantiles", type=float, nargs="+", default=QUANTILES)
+    parser.add_argument("--max-rank-error", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=200000, help="số dòng reports cho phần distribution (0 = bỏ qua)")
+    parser.add_argument("--mysql", action="store_true", help="kiểm tra trên MySQL đang cấu hình (đọc sketch đã lưu)")
+    parser.add_argument("--load", action="store_true", help="nạp dữ liệu datagen vào MySQL trước (xoá reports)")
+    parser.add_argument("--rebuild", action="store_true", help="chạy distributions.rebuild trước khi kiểm tra")
+    args = parser.parse_args()
+
+    failures = 0
+
+    def report(name, errors):
+        nonlocal failures
+        print(f"[{'FAIL' if errors else 'ok'}] {name}")
+        for error in errors[:5]:
+            print(f"       {error}")
+        failures += bool(errors)
+
+    check_sketches(args, report)
+    raw_sql = "SELECT ward_id, city_id, date, print_time, count FROM reports"
+    if args.rows and not args.mysql:
+        with tempfile.TemporaryDirectory() as tmp:
+            rep = load_duckdb(os.path.join(tmp, "check.duckdb"), args.rows)
+            conn = rep.connection()
+            with conn.cursor() as cursor:
+                cursor.execute(raw_sql)
+                raw = cursor.fetchall()
+                check_distribution(args, report, cursor, raw, replica.SOURCE, False, "duckdb")
+            conn.close()
+            rep._db.close()
+    if args.mysql:
+        conn = db.get_connection()
+        try:
+            if args.load:
+                datagen.load_mysql(conn, args.rows, datagen.Geography(WARDS, CITIES))
+            elif args.rebuild:
+                with conn.cursor() as cursor:
+                    rollup.refresh(conn, rollup.max_report_id(cursor))
+                distributions.rebuild(conn)
+            with conn.cursor() as cursor:
+                if not (rollup.is_current(cursor) and distributions.is_current(cursor)):
+                    sys.exit("Rollup/sketch chưa cập nhật: chạy với --rebuild")
+                cursor.execute(raw_sql)
+                raw = cursor.fetchall()
+                check_distribution(args, report, cursor, raw, rollup.ROLLUP, True, "mysql sketches")
+        finally:
+            conn.close()
+    print(f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,247 @@
+"""Sinh dữ liệu reports giả lập ở quy mô production và nạp vào MySQL/MariaDB local.
+
+Phân bố (cố định theo --seed, chạy lại cho cùng dữ liệu):
+- ward: kích thước lệch (lognormal, vài ward trung tâm rất đông), chia đều vào các city
+- ngày: ít lượt vào thứ 7, gần như không có chủ nhật, tăng dần ~30% theo thời gian
+- giờ: hai đỉnh sáng (9-10h) và chiều (14-15h), một phần nhỏ ngoài giờ làm việc (6h, 18-19h)
+- thủ tục: phân bố Zipf trên danh mục thủ tục thật, mỗi thủ tục thuộc một lĩnh vực
+- tuổi/giới tính/xác thực: lệch về nhóm tuổi lao động và CCCD, ~2% không có thông tin
+
+    python bench/datagen.py --rows 1000000 --csv /tmp/reports.csv      # chỉ sinh ra file CSV
+    MYSQLHOST=127.0.0.1 MYSQLUSER=root MYSQLPASSWORD=root MYSQLDATABASE=ai_kiosk_bench MYSQL_SSL=0 \\
+        python bench/datagen.py --rows 5000000 --wards 600 --cities 30 --schema ../ai_kiosk.sql --load
+
+--load XOÁ toàn bộ reports/wards/cities của database (chỉ dùng database thử), nạp dữ liệu
+sinh ra, tạo user bench_admin, bench_city_<id>, bench_ward_<id> (mật khẩu --password),
+chia partition tháng, dựng lại rollup và sketch phân phối. --schema nạp lại ai_kiosk.sql trước (database trống).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "0")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+REPORT_COLUMNS = ['id', 'ward_id', 'city_id', 'date', 'procedure', 'count', 'age_group', 'gender',
+                  'domain', 'auth_type', 'print_time']
+CHUNK = 500000
+USER_ID_BASE = 1000000   # user_id của user bench, tránh trùng user có sẵn
+
+# (lĩnh vực, thủ tục) theo thứ tự phổ biến giảm dần; trọng số Zipf theo thứ hạng
+PROCEDURES = [
+    ("Hộ tịch", "Cấp bản sao Giấy khai sinh"),
+    ("Hộ tịch", "Đăng ký khai sinh"),
+    ("Hộ tịch", "Xác nhận tình trạng hôn nhân"),
+    ("Đất đai", "Cấp giấy chứng nhận quyền sử dụng đất"),
+    ("Hộ tịch", "Đăng ký kết hôn"),
+    ("Tư pháp", "Chứng thực bản sao từ bản chính"),
+    ("Đất đai", "Đăng ký biến động đất đai"),
+    ("Hộ tịch", "Xác nhận tạm trú"),
+    ("Tư pháp", "Chứng thực chữ ký"),
+    ("Kinh doanh", "Đăng ký hộ kinh doanh"),
+    ("Hộ tịch", "Đăng ký khai tử"),
+    ("Y tế", "Cấp thẻ bảo hiểm y tế"),
+    ("Đất đai", "Chuyển mục đích sử dụng đất"),
+    ("Xây dựng", "Cấp phép xây dựng"),
+    ("Kinh doanh", "Cấp giấy phép kinh doanh"),
+    ("Giáo dục", "Chuyển trường"),
+    ("Hộ tịch", "Trích lục hộ tịch"),
+    ("Đất đai", "Tách thửa đất"),
+    ("Giao thông", "Đăng ký xe máy"),
+    ("Y tế", "Cấp giấy chứng sinh"),
+    ("Tư pháp", "Chứng thực hợp đồng, giao dịch"),
+    ("Giáo dục", "Xác nhận học sinh"),
+    ("Kinh doanh", "Đăng ký thành lập doanh nghiệp"),
+    ("Hộ tịch", "Thay đổi, cải chính hộ tịch"),
+    ("Xây dựng", "Cấp phép sửa chữa nhà ở"),
+    ("Giao thông", "Cấp phép sử dụng vỉa hè"),
+    ("Khoa học", "Đăng ký hợp đồng chuyển giao công nghệ"),
+    ("Y tế", "Cấp giấy phép hành nghề"),
+    ("Đất đai", "Giải quyết tranh chấp đất đai"),
+    ("Hộ tịch", "Đăng ký nhận cha, mẹ, con"),
+    ("Giáo dục", "Công nhận bằng tốt nghiệp"),
+    ("Khoa học", "Đăng ký kết quả nghiên cứu"),
+]
+HOUR_WEIGHTS = {6: 0.4, 7: 4, 8: 9, 9: 11, 10: 10, 11: 7, 12: 2, 13: 4, 14: 8, 15: 8, 16: 6, 17: 3,
+                18: 0.8, 19: 0.3}
+WEEKDAY_WEIGHTS = [1.0, 0.95, 0.95, 0.95, 1.05, 0.45, 0.05]   # thứ 2 .. chủ nhật
+AGE_GROUPS = {"<18": 0.08, "18-30": 0.32, "31-50": 0.40, ">50": 0.20}
+GENDERS = {"Nữ": 0.52, "Nam": 0.48}
+AUTH_TYPES = {"CCCD": 0.7, "QR": 0.3}
+MISSING = 0.02
+
+
+class Geography:
+    """wards ward (id 1..wards) chia vào cities city, kèm trọng số số lượt in của từng ward."""
+
+    def __init__(self, wards, cities, seed=0):
+        rng = np.random.default_rng(seed)
+        self.ward_ids = np.arange(1, wards + 1)
+        self.city_of = 1 + (self.ward_ids - 1) * cities // wards
+        weights = rng.lognormal(0, 0.9, wards)
+        self.weights = weights / weights.sum()
+        self.cities = cities
+
+    def frames(self):
+        wards = pd.DataFrame({"ward_id": self.ward_ids, "ward_name": [f"Phường {i}" for i in self.ward_ids],
+                              "city_id": self.city_of})
+        cities = pd.DataFrame({"city_id": np.arange(1, self.cities + 1),
+                               "city_name": [f"Thành phố {c}" for c in range(1, self.cities + 1)]})
+        return wards, cities
+
+
+def _choice(rng, options, n):
+    keys = list(options)
+    p = np.array(list(options.values()), dtype=float)
+    return np.array(keys, dtype=object)[rng.choice(len(keys), n, p=p / p.sum())]
+
+
+def _with_missing(rng, values):
+    values[rng.random(len(values)) < MISSING] = None
+    return values
+
+
+def make_frame(n, start_id, geo, first_day, days, seed):
+    """n dòng reports (id từ start_id) trong `days` ngày tính từ first_day."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(first_day, periods=days, freq="D")
+    day_weights = np.array([WEEKDAY_WEIGHTS[d.weekday()] for d in dates]) * np.linspace(1.0, 1.3, days)
+    ward_index = rng.choice(len(geo.ward_ids), n, p=geo.weights)
+    ranks = np.arange(1, len(PROCEDURES) + 1)
+    procedure = rng.choice(len(PROCEDURES), n, p=(1 / ranks ** 1.1) / (1 / ranks ** 1.1).sum())
+    hours = np.array(list(HOUR_WEIGHTS))
+    hour_p = np.array(list(HOUR_WEIGHTS.values()))
+    # Phần lớn mỗi lần in 1 phiếu, đôi khi vài phiếu; ~1% không ghi số lượng
+    count = np.minimum(rng.geometric(0.6, n), 10).astype(float)
+    count[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({
+        "id": np.arange(start_id, start_id + n),
+        "ward_id": geo.ward_ids[ward_index],
+        "city_id": geo.city_of[ward_index],
+        "date": dates[rng.choice(days, n, p=day_weights / day_weights.sum())],
+        "procedure": np.array([p for _, p in PROCEDURES], dtype=object)[procedure],
+        "count": pd.array(count, dtype="Int64"),
+        "age_group": _with_missing(rng, _choice(rng, AGE_GROUPS, n)),
+        "gender": _with_missing(rng, _choice(rng, GENDERS, n)),
+        "domain": np.array([d for d, _ in PROCEDURES], dtype=object)[procedure],
+        "auth_type": _choice(rng, AUTH_TYPES, n),
+        "print_time": hours[rng.choice(len(hours), n, p=hour_p / hour_p.sum())],
+    })
+
+
+def frames(total, geo, first_day="2024-01-01", days=730, seed=0, chunk=CHUNK):
+    """Các DataFrame CHUNK dòng nối tiếp (id 1..total); mỗi lô có seed riêng nên sinh được song song."""
+    for start in range(0, total, chunk):
+        yield make_frame(min(chunk, total - start), start + 1, geo, first_day, days, seed * 1000003 + start)
+
+
+def _rows(frame):
+    frame = frame.astype(object).where(frame.notna(), None)
+    if "date" in frame:
+        frame["date"] = [d.date() for d in frame["date"]]
+    return list(frame.itertuples(index=False, name=None))
+
+
+def bench_users(geo, password):
+    """(user_id, username, password_hash, role, ward_id, city_id) của các user dùng cho load test."""
+    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    users = [(USER_ID_BASE, "bench_admin", password_hash, "admin", None, None)]
+    users += [(USER_ID_BASE + c, f"bench_city_{c}", password_hash, "city", None, c)
+              for c in range(1, geo.cities + 1)]
+    users += [(USER_ID_BASE + geo.cities + 1 + int(w), f"bench_ward_{w}", password_hash, "ward", int(w), int(c))
+              for w, c in zip(geo.ward_ids, geo.city_of)]
+    return users
+
+
+def load_mysql(conn, total, geo, password="bench", progress=True, **kwargs):
+    """Thay dữ liệu reports/wards/cities bằng dữ liệu sinh ra và tạo user bench_*."""
+    import archive
+    import distributions
+    import migrate
+    import rollup
+
+    migrate.apply_all(conn)
+    wards, cities = geo.frames()
+    with conn.cursor() as cursor:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        cursor.execute("SET UNIQUE_CHECKS = 0")
+        cursor.execute("TRUNCATE TABLE reports")
+        cursor.execute("DELETE FROM users WHERE username LIKE %s", ("bench\\_%",))
+        cursor.execute("DELETE FROM wards")
+        cursor.execute("DELETE FROM cities")
+        cursor.executemany("INSERT INTO cities (city_id, city_name) VALUES (%s, %s)", _rows(cities))
+        cursor.executemany("INSERT INTO wards (ward_id, ward_name, city_id) VALUES (%s, %s, %s)", _rows(wards))
+        cursor.executemany(
+            "INSERT INTO users (user_id, username, password_hash, role, ward_id, city_id) VALUES (%s, %s, %s, %s, %s, %s)",
+            bench_users(geo, password)
+        )
+        conn.commit()
+        # Chia partition trước khi nạp (REORGANIZE trên bảng rỗng gần như tức thời)
+        cursor.execute("INSERT INTO reports (date) VALUES (%s)", (kwargs.get("first_day", "2024-01-01"),))
+        conn.commit()
+        archive.ensure_partitions(conn)
+        cursor.execute("TRUNCATE TABLE reports")
+
+        columns = ", ".join(f"`{c}`" for c in REPORT_COLUMNS)
+        sql = f"INSERT INTO reports ({columns}) VALUES ({', '.join(['%s'] * len(REPORT_COLUMNS))})"
+        started = time.perf_counter()
+        for frame in frames(total, geo, **kwargs):
+            rows = _rows(frame)
+            for i in range(0, len(rows), 5000):
+                cursor.executemany(sql, rows[i:i + 5000])
+            conn.commit()
+            if progress:
+                done = rows[-1][0]
+                print(f"{done} rows, {done / (time.perf_counter() - started):.0f} rows/s", file=sys.stderr)
+        cursor.execute("SET UNIQUE_CHECKS = 1")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    conn.commit()
+    rollup.ensure_schema(conn)
+    with conn.cursor() as cursor:
+        rollup.rebuild(conn, rollup.max_report_id(cursor))
+    distributions.rebuild(conn)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--wards", type=int, default=300)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--first-day", default="2024-01-01")
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="ghi dữ liệu ra file CSV (có dòng tiêu đề)")
+    parser.add_argument("--load", action="store_true", help="nạp vào MySQL đang cấu hình (xoá dữ liệu cũ)")
+    parser.add_argument("--schema", help="nạp lại ai_kiosk.sql trước khi --load (tạo bảng)")
+    parser.add_argument("--password", default="bench", help="mật khẩu của các user bench_*")
+    args = parser.parse_args()
+
+    geo = Geography(args.wards, args.cities, args.seed)
+    options = {"first_day": args.first_day, "days": args.days, "seed": args.seed}
+    started = time.perf_counter()
+    if args.csv:
+        for i, frame in enumerate(frames(args.rows, geo, **options)):
+            frame.to_csv(args.csv, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    if args.load:
+        import db
+        from check_query_plans import load_dump
+        conn = db.get_connection()
+        try:
+            if args.schema:
+                load_dump(conn, args.schema)
+            load_mysql(conn, args.rows, geo, args.password, **options)
+        finally:
+            conn.close()
+    print(json.dumps({"rows": args.rows, "wards": args.wards, "cities": args.cities, "seed": args.seed,
+                      "seconds": round(time.perf_counter() - started, 1)}))
+
+
+if __name__ == "__main__":
+    run()
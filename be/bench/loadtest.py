@@ -0,0 +1,237 @@
+"""Load test các API chính (/login, /reports, /reports/export, /users, /reports/summary).
+
+Chạy với server đang hoạt động trên dữ liệu của datagen.py (user bench_*, mật khẩu "bench"):
+
+    python bench/loadtest.py --url http://127.0.0.1:8000 --concurrency 16 --duration 30 \\
+        --workloads login,reports,export,users --output results/$(git rev-parse --short HEAD).json
+    python bench/loadtest.py ... --baseline results/<commit cũ>.json --max-regression 20
+
+Mỗi workload chạy riêng trong --duration giây (bỏ --warmup giây đầu) với --concurrency
+thread, mỗi thread một kết nối keep-alive, gửi request liên tục (closed loop) bằng token
+của các user trong --users xoay vòng. Kết quả in ra dạng JSON: request/giây, p50/p95/p99
+(ms), số lỗi và số byte mỗi workload, kèm commit git và cấu hình để so sánh giữa các lần chạy.
+Với --baseline: thêm % thay đổi so với file kết quả cũ; thoát với mã 1 nếu p95 của
+workload nào tăng quá --max-regression %.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest_ingest import login  # noqa: E402
+
+DEFAULT_USERS = "bench_admin:bench,bench_city_1:bench,bench_ward_1:bench"
+
+
+class Client:
+    """Một kết nối HTTP keep-alive (mỗi thread một client), tự kết nối lại khi lỗi."""
+
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        self._cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self._netloc = parsed.netloc
+        self._conn = None
+        self.retry_after = None   # header Retry-After của response gần nhất (429)
+
+    def request(self, method, path, body=None, headers=None):
+        """Gửi request, đọc hết body. Trả về (status, số byte)."""
+        if self._conn is None:
+            self._conn = self._cls(self._netloc, timeout=300)
+        try:
+            self._conn.request(method, path, body=body, headers=headers or {})
+            resp = self._conn.getresponse()
+            self.retry_after = resp.getheader("Retry-After")
+            size = len(resp.read())
+            return resp.status, size
+        except Exception:
+            self._conn.close()
+            self._conn = None
+            raise
+
+
+def _query(path, **params):
+    params = {k: v for k, v in params.items() if v is not None}
+    return f"{path}?{urllib.parse.urlencode(params)}" if params else path
+
+
+def workloads(args, accounts):
+    """name -> hàm(client, account) gửi một request của workload."""
+    def auth(account):
+        return {"Authorization": f"Bearer {account['token']}"}
+
+    def do_login(client, account):
+        body = urllib.parse.urlencode({"username": account["username"], "password": account["password"]})
+        return client.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def do_reports(client, account):
+        offset = random.randrange(0, args.max_offset + 1, args.limit) if args.max_offset else 0
+        return client.request("GET", _query("/reports", limit=args.limit, offset=offset, format=args.reports_format),
+                              headers=auth(account))
+
+    def do_export(client, account):
+        path = _query("/reports/export", format=args.export_format, limit=args.export_limit,
+                      start_date=args.start_date, end_date=args.end_date)
+        return client.request("GET", path, headers=auth(account))
+
+    def do_users(client, account):
+        return client.request("GET", "/users", headers=auth(account))
+
+    def do_summary(client, account):
+        path = _query("/reports/summary", start_date=args.start_date, end_date=args.end_date)
+        return client.request("GET", path, headers=auth(account))
+
+    return {"login": do_login, "reports": do_reports, "export": do_export, "users": do_users,
+            "summary": do_summary}
+
+
+def percentile(ordered, p):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2) if ordered else None
+
+
+def run_workload(url, fn, accounts, concurrency, duration, warmup):
+    latencies, statuses, totals, lock = [], {}, {"bytes": 0, "errors": 0}, threading.Lock()
+    started = time.perf_counter()
+    measure_from, stop_at = started + warmup, started + warmup + duration
+
+    def worker(index):
+        client = Client(url)
+        i = index
+        while True:
+            account = accounts[i % len(accounts)]
+            i += concurrency
+            begin = time.perf_counter()
+            if begin >= stop_at:
+                return
+            try:
+                status, size = fn(client, account)
+            except Exception as e:
+                status, size = f"error: {type(e).__name__}", 0
+            ms = (time.perf_counter() - begin) * 1000
+            if begin < measure_from:
+                continue
+            with lock:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 200:
+                    latencies.append(ms)
+                    totals["bytes"] += size
+                else:
+                    totals["errors"] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return {
+        "requests": len(latencies) + totals["errors"],
+        "errors": totals["errors"],
+        "statuses": statuses,
+        "rps": round(len(latencies) / duration, 2),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "mean": round(statistics.mean(latencies), 2) if latencies else None,
+            "max": round(latencies[-1], 2) if latencies else None,
+        },
+        "bytes_per_request": round(totals["bytes"] / len(latencies)) if latencies else None,
+    }
+
+
+def compare(results, baseline):
+    """% thay đổi của rps và p95 so với kết quả cũ (dương = tăng)."""
+    def change(new, old):
+        return round((new - old) / old * 100, 1) if new is not None and old else None
+
+    changes = {}
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old:
+            changes[name] = {
+                "rps_pct": change(result["rps"], old["rps"]),
+                "p95_pct": change(result["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+                "p99_pct": change(result["latency_ms"]["p99"], old["latency_ms"]["p99"]),
+            }
+    return changes
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", default=DEFAULT_USERS, help="username:password, phân cách bởi dấu phẩy")
+    parser.add_argument("--workloads", default="login,reports,export,users")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="giây đo mỗi workload")
+    parser.add_argument("--warmup", type=float, default=3, help="giây đầu không tính")
+    parser.add_argument("--limit", type=int, default=1000, help="limit của /reports")
+    parser.add_argument("--max-offset", type=int, default=20000, help="offset ngẫu nhiên của /reports (0 = luôn 0)")
+    parser.add_argument("--reports-format", default=None, help="rows/columnar/arrow (mặc định của server)")
+    parser.add_argument("--export-format", default="xlsx", choices=["xlsx", "csv"])
+    parser.add_argument("--export-limit", type=int, default=10000)
+    parser.add_argument("--start-date")
+    parser.add_argument("--end-date")
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    parser.add_argument("--baseline", help="file kết quả cũ để so sánh")
+    parser.add_argument("--max-regression", type=float, help="thoát mã 1 nếu p95 tăng quá %% này so với baseline")
+    args = parser.parse_args()
+
+    accounts = []
+    for item in args.users.split(","):
+        username, _, password = item.partition(":")
+        accounts.append({"username": username, "password": password,
+                         "token": login(args.url, username, password)})
+    available = workloads(args, accounts)
+    names = [n.strip() for n in args.workloads.split(",") if n.strip()]
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        sys.exit(f"Workload không hỗ trợ: {', '.join(unknown)} (có: {', '.join(available)})")
+
+    results = {}
+    for name in names:
+        results[name] = run_workload(args.url, available[name], accounts, args.concurrency,
+                                     args.duration, args.warmup)
+        print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": results,
+    }
+    failed = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        report["baseline_commit"] = baseline.get("commit")
+        report["changes"] = compare(results, baseline)
+        if args.max_regression is not None:
+            failed = [name for name, c in report["changes"].items()
+                      if c["p95_pct"] is not None and c["p95_pct"] > args.max_regression]
+            report["regressions"] = failed
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,239 @@
+"""Load test admission control: độ trễ của API rẻ (/login, /reports của ward...) khi có nhiều
+request nặng (admin export, tổng hợp toàn hệ thống) chạy cùng lúc.
+
+Chạy với server đang hoạt động trên dữ liệu của datagen.py (user bench_*, mật khẩu "bench"),
+nên tắt cache (REPORT_CACHE=0) để request nặng lần nào cũng phải tính lại:
+
+    python bench/loadtest.py ...   # (không bắt buộc) số liệu chung
+    python bench/loadtest_admission.py --url http://127.0.0.1:8000 --heavy-concurrency 16 \\
+        --slo-ms 300 --output results/admission_on.json
+    # so sánh: khởi động lại server với ADMISSION_ENABLED=0 rồi chạy lại (mong đợi vi phạm SLO)
+
+Hai pha, mỗi pha --duration giây (bỏ --warmup giây đầu):
+- baseline: chỉ --cheap-concurrency thread gửi liên tục các workload rẻ (--cheap-workloads)
+  bằng các user --cheap-users;
+- overload: như baseline, thêm --heavy-concurrency thread gửi request nặng (--heavy-workloads)
+  bằng các user --heavy-users. Mỗi request tổng hợp dùng một khoảng ngày ngẫu nhiên để không
+  trúng cache. Với --honor-retry-after, thread nặng nhận 429 sẽ chờ theo Retry-After.
+
+Export tự bị giới hạn bởi export_executor (EXPORT_EXECUTOR_WORKERS thread): thread nặng chỉ
+gửi export phần lớn thời gian nằm chờ export trước đó, nên --heavy-workloads summary_all,
+distribution cho thấy rõ nhất tác động lên connection/thread DB dùng chung.
+
+Kết quả JSON: p50/p95/p99 từng workload rẻ ở mỗi pha, số request nặng theo status (200/429)
+và phân bố Retry-After. Thoát với mã 1 nếu p95 của workload rẻ nào trong pha overload vượt
+--slo-ms hoặc có request rẻ bị từ chối (429) hay lỗi.
+"""
+import argparse
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import Client, git_commit, percentile  # noqa: E402
+from loadtest_ingest import login  # noqa: E402
+
+CHEAP_USERS = "bench_ward_1:bench,bench_ward_2:bench,bench_ward_3:bench"
+HEAVY_USERS = "bench_admin:bench,bench_city_1:bench"
+
+
+def _random_range(rng, first, days):
+    start = first + datetime.timedelta(days=rng.randrange(days))
+    end = start + datetime.timedelta(days=rng.randrange(28, 180))
+    return start.isoformat(), end.isoformat()
+
+
+def workloads(args):
+    """name -> hàm(client, account, rng) gửi một request."""
+    first = datetime.date.fromisoformat(args.first_date)
+
+    def auth(account):
+        return {"Authorization": f"Bearer {account['token']}"}
+
+    def query(path, **params):
+        return f"{path}?{urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})}"
+
+    def do_login(client, account, rng):
+        body = urllib.parse.urlencode({"username": account["username"], "password": account["password"]})
+        return client.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def do_reports(client, account, rng):
+        return client.request("GET", query("/reports", limit=args.limit), headers=auth(account))
+
+    def do_users(client, account, rng):
+        return client.request("GET", "/users", headers=auth(account))
+
+    def do_summary(client, account, rng):
+        start, end = _random_range(rng, first, args.days)
+        return client.request("GET", query("/reports/summary", start_date=start, end_date=end),
+                              headers=auth(account))
+
+    def do_summary_all(client, account, rng):
+        # Không lọc ngày: chi phí lớn nhất (cache có thể trả ngay nếu đang bật)
+        return client.request("GET", query("/reports/summary", top_k=rng.randrange(1, 100)), headers=auth(account))
+
+    def do_distribution(client, account, rng):
+        start, end = _random_range(rng, first, args.days)
+        return client.request("GET", query("/reports/distribution", by="hour", start_date=start, end_date=end),
+                              headers=auth(account))
+
+    def do_export(client, account, rng):
+        return client.request("GET", query("/reports/export", format="csv", limit=args.export_limit),
+                              headers=auth(account))
+
+    return {"login": do_login, "reports": do_reports, "users": do_users, "summary": do_summary,
+            "summary_all": do_summary_all, "distribution": do_distribution, "export": do_export}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.retry_after = Counter()
+
+    def add(self, name, status, ms, retry_after=None):
+        with self.lock:
+            self.statuses.setdefault(name, Counter())[str(status)] += 1
+            if status == 200:
+                self.latencies.setdefault(name, []).append(ms)
+            if retry_after is not None:
+                self.retry_after[retry_after] += 1
+
+    def summary(self, duration):
+        result = {}
+        for name, statuses in sorted(self.statuses.items()):
+            ordered = sorted(self.latencies.get(name, []))
+            result[name] = {
+                "statuses": dict(statuses),
+                "ok_rps": round(len(ordered) / duration, 2),
+                "latency_ms": {"p50": percentile(ordered, 0.5), "p95": percentile(ordered, 0.95),
+                               "p99": percentile(ordered, 0.99),
+                               "max": round(ordered[-1], 2) if ordered else None},
+            }
+        return result
+
+
+def _loop(url, fns, accounts, recorder, measure_from, stop_at, seed, honor_retry_after=False):
+    client, rng = Client(url), random.Random(seed)
+    i = seed
+    while True:
+        name, fn = fns[i % len(fns)]
+        account = accounts[i % len(accounts)]
+        i += 1
+        begin = time.perf_counter()
+        if begin >= stop_at:
+            return
+        try:
+            status, _ = fn(client, account, rng)
+        except Exception as e:
+            status = f"error: {type(e).__name__}"
+        ms = (time.perf_counter() - begin) * 1000
+        retry_after = client.retry_after if status == 429 else None
+        if begin >= measure_from:
+            recorder.add(name, status, ms, retry_after)
+        if retry_after and honor_retry_after:
+            time.sleep(min(float(retry_after), max(0, stop_at - time.perf_counter())))
+
+
+def run_phase(args, available, cheap_accounts, heavy_accounts, heavy):
+    cheap, heavy_recorder = Recorder(), Recorder()
+    started = time.perf_counter()
+    measure_from, stop_at = started + args.warmup, started + args.warmup + args.duration
+    cheap_fns = [(n, available[n]) for n in args.cheap_workloads]
+    heavy_fns = [(n, available[n]) for n in args.heavy_workloads]
+    threads = [threading.Thread(target=_loop, daemon=True,
+                                args=(args.url, cheap_fns, cheap_accounts, cheap, measure_from, stop_at, i))
+               for i in range(args.cheap_concurrency)]
+    if heavy:
+        threads += [threading.Thread(target=_loop, daemon=True,
+                                     args=(args.url, heavy_fns, heavy_accounts, heavy_recorder, measure_from,
+                                           stop_at, 1000 + i, args.honor_retry_after))
+                    for i in range(args.heavy_concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    result = {"cheap": cheap.summary(args.duration)}
+    if heavy:
+        result["heavy"] = heavy_recorder.summary(args.duration)
+        result["retry_after_seconds"] = dict(sorted(heavy_recorder.retry_after.items()))
+    return result
+
+
+def _accounts(url, users):
+    accounts = []
+    for item in users.split(","):
+        username, _, password = item.partition(":")
+        accounts.append({"username": username, "password": password, "token": login(url, username, password)})
+    return accounts
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--cheap-users", default=CHEAP_USERS)
+    parser.add_argument("--heavy-users", default=HEAVY_USERS)
+    parser.add_argument("--cheap-workloads", default="login,reports,summary")
+    parser.add_argument("--heavy-workloads", default="export,summary,distribution")
+    parser.add_argument("--cheap-concurrency", type=int, default=4)
+    parser.add_argument("--heavy-concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="giây đo mỗi pha")
+    parser.add_argument("--warmup", type=float, default=3, help="giây đầu không tính")
+    parser.add_argument("--limit", type=int, default=100, help="limit của /reports (workload rẻ)")
+    parser.add_argument("--export-limit", type=int, default=200000)
+    parser.add_argument("--first-date", default="2024-01-01", help="ngày đầu dữ liệu (khoảng ngày ngẫu nhiên)")
+    parser.add_argument("--days", type=int, default=540, help="số ngày chọn ngẫu nhiên ngày bắt đầu")
+    parser.add_argument("--slo-ms", type=float, default=300, help="p95 tối đa của workload rẻ khi quá tải")
+    parser.add_argument("--honor-retry-after", action="store_true", help="thread nặng chờ theo Retry-After")
+    parser.add_argument("--skip-baseline", action="store_true")
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+    args.cheap_workloads = [n.strip() for n in args.cheap_workloads.split(",") if n.strip()]
+    args.heavy_workloads = [n.strip() for n in args.heavy_workloads.split(",") if n.strip()]
+
+    available = workloads(args)
+    unknown = [n for n in args.cheap_workloads + args.heavy_workloads if n not in available]
+    if unknown:
+        sys.exit(f"Workload không hỗ trợ: {', '.join(unknown)} (có: {', '.join(available)})")
+    cheap_accounts, heavy_accounts = _accounts(args.url, args.cheap_users), _accounts(args.url, args.heavy_users)
+
+    phases = {}
+    if not args.skip_baseline:
+        phases["baseline"] = run_phase(args, available, cheap_accounts, heavy_accounts, heavy=False)
+        print(f"baseline: {json.dumps(phases['baseline'])}", file=sys.stderr)
+    phases["overload"] = run_phase(args, available, cheap_accounts, heavy_accounts, heavy=True)
+    print(f"overload: {json.dumps(phases['overload'])}", file=sys.stderr)
+
+    violations = []
+    for name, result in phases["overload"]["cheap"].items():
+        p95 = result["latency_ms"]["p95"]
+        if p95 is None or p95 > args.slo_ms:
+            violations.append(f"{name}: p95 {p95} ms > {args.slo_ms} ms")
+        rejected = sum(n for status, n in result["statuses"].items() if status != "200")
+        if rejected:
+            violations.append(f"{name}: {rejected} request không thành công {result['statuses']}")
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "phases": phases,
+        "slo_violations": violations,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,152 @@
+"""Phát lại các dòng reports trong ai_kiosk.sql vào /reports/ingest với tốc độ cấu hình được.
+
+Mỗi dòng được gửi kèm event_id = "sql-<id>[-<vòng>]", nên chạy lại cùng vòng sẽ thấy
+toàn bộ là bản trùng (kiểm tra idempotency). Cần một user có quyền ghi cho các ward
+trong dump (admin ghi được mọi ward):
+
+    python bench/loadtest_ingest.py --url http://127.0.0.1:8000 --username admin --password ... \\
+        --rate 5000 --batch 500 --workers 4 --format jsonl --rounds 3
+
+Kết quả in ra dạng JSON: số sự kiện/giây đạt được, độ trễ mỗi lô (p50/p95/p99) và
+số dòng thêm mới/trùng.
+"""
+import argparse
+import ast
+import csv
+import io
+import json
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DUMP = Path(__file__).resolve().parent.parent.parent / "ai_kiosk.sql"
+FIELDS = ["event_id", "ward_id", "date", "procedure", "count", "age_group", "gender", "domain", "auth_type", "print_time"]
+INSERT_RE = re.compile(r"INSERT INTO `reports` \(([^)]*)\) VALUES\s*(.*?);\s*$", re.S | re.M)
+
+
+def load_rows(path):
+    """Đọc các dòng reports từ file dump (mỗi dòng một tuple trong INSERT ... VALUES)."""
+    rows = []
+    for columns, values in INSERT_RE.findall(Path(path).read_text(encoding="utf-8")):
+        names = [c.strip(" `") for c in columns.split(",")]
+        for line in values.splitlines():
+            line = line.strip().rstrip(",;")
+            if not line.startswith("("):
+                continue
+            rows.append(dict(zip(names, ast.literal_eval(line.replace("NULL", "None")))))
+    return rows
+
+
+def to_events(rows, round_no):
+    suffix = f"-{round_no}" if round_no else ""
+    return [{
+        "event_id": f"sql-{row['id']}{suffix}", "ward_id": row["ward_id"], "date": row["date"],
+        "procedure": row["procedure"], "count": row["count"] or 1, "age_group": row["age_group"],
+        "gender": row["gender"], "domain": row["domain"], "auth_type": row["auth_type"],
+        "print_time": row["print_time"],
+    } for row in rows if row["date"] and row["print_time"] is not None and row["procedure"]]
+
+
+def encode(batch, fmt):
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.DictWriter(out, FIELDS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(batch)
+        return out.getvalue().encode(), "text/csv"
+    if fmt == "json":
+        return json.dumps(batch, ensure_ascii=False).encode(), "application/json"
+    return "\n".join(json.dumps(e, ensure_ascii=False) for e in batch).encode(), "application/x-ndjson"
+
+
+def login(url, username, password):
+    data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    with urllib.request.urlopen(urllib.request.Request(f"{url}/login", data=data)) as resp:
+        return json.load(resp)["access_token"]
+
+
+def post(url, token, body, content_type):
+    req = urllib.request.Request(f"{url}/reports/ingest", data=body, method="POST", headers={
+        "Authorization": f"Bearer {token}", "Content-Type": content_type,
+    })
+    start = time.perf_counter()
+    with urllib.request.urlopen(req) as resp:
+        result = json.load(resp)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--dump", default=str(DUMP))
+    parser.add_argument("--rate", type=float, default=2000, help="sự kiện/giây mục tiêu (0 = không giới hạn)")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--format", choices=["jsonl", "csv", "json"], default="jsonl")
+    parser.add_argument("--rounds", type=int, default=1, help="số vòng phát lại (mỗi vòng có event_id riêng)")
+    parser.add_argument("--same-ids", action="store_true", help="các vòng dùng cùng event_id (đo trùng lặp)")
+    args = parser.parse_args()
+
+    rows = load_rows(args.dump)
+    token = login(args.url, args.username, args.password)
+    batches = []
+    for round_no in range(args.rounds):
+        events = to_events(rows, 0 if args.same_ids else round_no)
+        batches += [encode(events[i:i + args.batch], args.format) for i in range(0, len(events), args.batch)]
+    print(f"{len(rows)} rows from dump, {len(batches)} batches", file=sys.stderr)
+
+    latencies, totals, lock = [], {"received": 0, "inserted": 0, "duplicates": 0, "errors": 0}, threading.Lock()
+    interval = args.batch / args.rate if args.rate else 0
+    started = time.perf_counter()
+
+    def send(index, body, content_type):
+        # Giãn đều thời điểm gửi để đạt đúng tốc độ mục tiêu
+        delay = started + index * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            ms, result = post(args.url, token, body, content_type)
+        except Exception as e:
+            print(f"batch {index}: {e}", file=sys.stderr)
+            with lock:
+                totals["errors"] += 1
+            return
+        with lock:
+            latencies.append(ms)
+            for key in ("received", "inserted", "duplicates"):
+                totals[key] += result[key]
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for index, (body, content_type) in enumerate(batches):
+            pool.submit(send, index, body, content_type)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "format": args.format,
+        "target_rate": args.rate,
+        "batches": len(batches),
+        "elapsed_s": round(elapsed, 2),
+        "events_per_s": round(totals["received"] / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99), "mean": round(statistics.mean(latencies), 2),
+        } if latencies else None,
+        **totals,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,183 @@
+"""Cache response JSON cho các API đọc báo cáo (/reports, /reports/summary).
+
+Khoá cache gồm phiên bản dữ liệu (MAX(reports.id) + watermark rollup), tên API,
+phạm vi quyền (report_queries.scope_key) và tham số truy vấn. Khi kiosk thêm dòng
+mới hoặc rollup được cập nhật thì phiên bản đổi, các entry cũ không còn được đọc
+tới và bị LRU/TTL loại dần.
+
+Mặc định cache nằm trong process (LRU giới hạn số entry và tổng dung lượng).
+Đặt REPORT_CACHE_REDIS_URL (và cài gói redis) để dùng chung giữa các worker.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import archive
+import replica
+import report_queries
+import rollup
+
+CACHE_ENABLED = os.getenv("REPORT_CACHE", "1") != "0"
+MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", 512))
+MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+TTL = float(os.getenv("REPORT_CACHE_TTL", 300))                       # giây, chặn trên cho entry
+VERSION_INTERVAL = float(os.getenv("REPORT_CACHE_VERSION_INTERVAL", 1))  # giây giữa 2 lần đọc phiên bản
+REDIS_URL = os.getenv("REPORT_CACHE_REDIS_URL")
+
+
+class LRUCache:
+    """LRU thread-safe giới hạn theo số entry và tổng số byte của value."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()    # key -> (value, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        # Value quá lớn (ví dụ /reports limit lớn) không cache để không đẩy hết entry khác
+        if len(value) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._bytes += len(value)
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        value, _ = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._data), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class RedisCache:
+    """Backend Redis (hoặc server tương thích), entry hết hạn theo TTL của Redis."""
+
+    def __init__(self, url, ttl=TTL, prefix="kiosk:report:"):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self._client.get(self.prefix + key)
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self._client.set(self.prefix + key, value, ex=max(int(self.ttl), 1))
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+def _make_backend():
+    if REDIS_URL:
+        try:
+            return RedisCache(REDIS_URL)
+        except ImportError:
+            print("REPORT_CACHE_REDIS_URL được đặt nhưng chưa cài gói redis, dùng cache trong process")
+    return LRUCache()
+
+
+backend = _make_backend()
+
+_version_lock = threading.Lock()
+_versions = {}    # server -> (phiên bản, thời điểm đọc)
+
+
+def data_version(conn):
+    """Phiên bản dữ liệu báo cáo trên server của `conn`: đổi khi có dòng reports mới, rollup
+    được cập nhật hoặc partition cũ được archive; với replica DuckDB là watermark đồng bộ.
+
+    Đọc trên chính connection sẽ tính dữ liệu (và trong cùng transaction nếu chưa commit):
+    read replica trễ không lưu dữ liệu cũ dưới phiên bản của server khác. Mỗi server đọc
+    tối đa mỗi VERSION_INTERVAL giây (MAX(id) dùng khoá chính, rất rẻ).
+    """
+    if replica.is_replica(conn):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT last_report_id FROM replica_state")
+            return f"replica:{cursor.fetchone()['last_report_id']}"
+    server = (getattr(conn, "host", None), getattr(conn, "port", None))
+    with _version_lock:
+        version, read_at = _versions.get(server, (None, 0.0))
+        if version is not None and time.monotonic() - read_at < VERSION_INTERVAL:
+            return version
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM reports")
+        max_id = cursor.fetchone()['max_id']
+        version = f"{max_id}:{rollup.watermark(cursor)}:{archive.generation(cursor)}"
+    with _version_lock:
+        _versions[server] = (version, time.monotonic())
+    return version
+
+
+def invalidate_version():
+    """Buộc lần đọc sau lấy lại phiên bản từ DB (gọi sau khi ghi dữ liệu mới)."""
+    with _version_lock:
+        _versions.clear()
+
+
+def make_key(version, name, user, params):
+    """Khoá cache: phiên bản dữ liệu + API + phạm vi quyền + tham số (đã sắp xếp)."""
+    raw = json.dumps([version, name, report_queries.scope_key(user), sorted(params.items())],
+                     default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, tag):
+    """So khớp header If-None-Match (có thể là danh sách hoặc '*', bỏ qua tiền tố W/)."""
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == tag for c in candidates)
@@ -1,25 +1,477 @@
+"""Connection MySQL: pool cho primary (MYSQLHOST) và các read replica (MYSQL_READ_REPLICAS).
+
+- db_connection(): primary, cho mọi lệnh ghi (user, ingest, rollup...) và truy vấn cần dữ
+  liệu mới nhất.
+- read_connection(session): replica khoẻ đang ít connection được mượn nhất; không có replica
+  (hoặc tất cả đang bị loại) thì dùng primary. Replica bị loại MYSQL_REPLICA_EJECT_SECONDS
+  giây khi mất kết nối, và bởi thread kiểm tra định kỳ (start_health_check) khi trễ
+  replication quá MYSQL_REPLICA_MAX_LAG giây hoặc replication đã dừng.
+- note_write(session...): sau khi ghi, các lần đọc của session đó (username) dùng primary
+  trong MYSQL_READ_YOUR_WRITES giây (0 = tắt), để thấy ngay thay đổi của chính mình. Ghi
+  nhận nằm trong từng process (mỗi worker gunicorn một bản).
+- pinned(conn): trong khối này read_connection() của thread hiện tại trả lại `conn`, để
+  phiên bản cache và dữ liệu được đọc trên cùng một connection (xem main._cached_body).
+
+Replica dùng cùng user/mật khẩu/database/SSL với primary.
+"""
 import os
+import time
+import threading
 import pymysql
-from contextlib import contextmanager
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+import metrics
+
+# Cấu hình pool (đọc từ biến môi trường, có giá trị mặc định)
+POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 16))
+# Chia POOL_SIZE: export_executor giữ tối đa EXPORT_CONNECTIONS, các thread nền (rollup/sketch refresh,
+# replica sync, live poller, nạp ward map) mỗi thread một connection; phần còn lại cho db_executor
+EXPORT_CONNECTIONS = int(os.getenv("EXPORT_EXECUTOR_WORKERS", 2))
+BACKGROUND_CONNECTIONS = int(os.getenv("MYSQL_BACKGROUND_CONNECTIONS", 4))
+REQUEST_CONNECTIONS = max(1, POOL_SIZE - EXPORT_CONNECTIONS - BACKGROUND_CONNECTIONS)
+POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", 30))        # giây chờ tối đa khi mượn connection
+POOL_RECYCLE = float(os.getenv("MYSQL_POOL_RECYCLE", 1800))      # tuổi thọ tối đa của 1 connection
+POOL_IDLE_TIMEOUT = float(os.getenv("MYSQL_POOL_IDLE_TIMEOUT", 300))  # đóng connection nằm chờ quá lâu
+POOL_PING_AFTER = float(os.getenv("MYSQL_POOL_PING_AFTER", 30))  # ping kiểm tra nếu idle lâu hơn
+
+# Read replica: "host[:port],host[:port]"
+READ_REPLICAS = [item.strip() for item in os.getenv("MYSQL_READ_REPLICAS", "").split(",") if item.strip()]
+REPLICA_POOL_SIZE = int(os.getenv("MYSQL_REPLICA_POOL_SIZE", POOL_SIZE))
+REPLICA_EJECT_SECONDS = float(os.getenv("MYSQL_REPLICA_EJECT_SECONDS", 30))
+REPLICA_MAX_LAG = float(os.getenv("MYSQL_REPLICA_MAX_LAG", 30))            # giây
+REPLICA_CHECK_INTERVAL = float(os.getenv("MYSQL_REPLICA_CHECK_INTERVAL", 5))
+READ_YOUR_WRITES = float(os.getenv("MYSQL_READ_YOUR_WRITES", 5))           # giây, 0 = tắt
+# Lỗi mất kết nối (không phải lỗi của câu truy vấn): loại replica
+CONNECTION_ERRORS = {2003, 2006, 2013, 2055}
+
+
+class _TimedConnection(pymysql.connections.Connection):
+    """Connection ghi số liệu mọi truy vấn (metrics.db_query): mọi loại cursor đều đi qua query()."""
+
+    def query(self, sql, unbuffered=False):
+        started = time.perf_counter()
+        rows = super().query(sql, unbuffered)
+        # Cursor không buffer: chưa đọc dòng nào, thời gian chỉ gồm phần thực thi
+        metrics.observe_query(sql, time.perf_counter() - started, None if unbuffered else rows)
+        return rows
+
 
-def get_connection():
+def get_connection(host=None, port=None):
+    # MYSQL_SSL=0 cho MySQL/MariaDB chạy local (không có chứng chỉ TLS)
+    ssl_options = {} if os.getenv("MYSQL_SSL", "1") == "0" else {
+        "ssl_verify_identity": True,
+        "ssl": {
+            "ca": "/etc/ssl/certs/ca-certificates.crt"
+        }
+    }
+    started = time.perf_counter()
     try:
-        connection = pymysql.connect(
-            host=os.getenv("MYSQLHOST"),
+        connection = _TimedConnection(
+            host=host or os.getenv("MYSQLHOST"),
             user=os.getenv("MYSQLUSER"),
             password=os.getenv("MYSQLPASSWORD"),
             database=os.getenv("MYSQLDATABASE"),
-            port=int(os.getenv("MYSQLPORT", 3306)),
+            port=port or int(os.getenv("MYSQLPORT", 3306)),
             charset='utf8mb4',
             cursorclass=pymysql.cursors.DictCursor,
             connect_timeout=10,
-            ssl_verify_identity=True,
-            ssl={
-                "ca": "/etc/ssl/certs/ca-certificates.crt"
-            }
+            **ssl_options
         )
+        metrics.db_connect.observe(time.perf_counter() - started)
         return connection
     except Exception as e:
         print(f"Database connection error: {e}")
         raise Exception(f"Không thể kết nối database: {str(e)}")
 
+
+class PoolTimeout(Exception):
+    """Hết thời gian chờ mượn connection từ pool."""
+
+
+class ConnectionPool:
+    """Pool connection giới hạn kích thước, tái sử dụng connection TLS giữa các request.
+
+    Connection được tạo lazy; khi mượn ra sẽ bị thay mới nếu quá tuổi (recycle),
+    nằm chờ quá lâu (idle_timeout) hoặc ping thất bại.
+    """
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, ping_after=POOL_PING_AFTER):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = deque()      # (conn, created_at, last_used)
+        self._born = {}           # id(conn) -> created_at của connection đang cho mượn
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+        self._timeouts = 0
+
+    def _discard(self, conn):
+        self._recycled += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if now - created_at > self.recycle or now - last_used > self.idle_timeout:
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return conn.open
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._in_use + len(self._idle) < self.size:
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"Không mượn được connection sau {self.timeout}s (pool size {self.size})")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+        # Kiểm tra/tạo connection ngoài lock để không chặn các thread khác
+        try:
+            if entry is not None:
+                conn, created_at, last_used = entry
+                if self._is_usable(conn, created_at, last_used):
+                    self._born[id(conn)] = created_at
+                    return conn
+                self._discard(conn)
+            conn = self._connect()
+            with self._cond:
+                self._created += 1
+            self._born[id(conn)] = time.monotonic()
+            return conn
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard=False):
+        created_at = self._born.pop(id(conn), 0)
+        if not discard:
+            # Kết thúc transaction còn dở để request sau không thấy snapshot cũ
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or not conn.open:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "created": self._created,
+                "recycled": self._recycled,
+                "timeouts": self._timeouts,
+            }
+
+
+pool = ConnectionPool(get_connection)
+
+
+@contextmanager
+def db_connection():
+    """Mượn connection từ pool và luôn trả lại, kể cả khi handler ném exception."""
+    conn = pool.acquire()
+    broken = False
+    try:
+        yield conn
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.release(conn, discard=broken)
+
+
+class Replica:
+    """Một read replica và pool connection riêng của nó."""
+
+    def __init__(self, address, size=REPLICA_POOL_SIZE):
+        host, _, port = address.partition(":")
+        self.address = address
+        self.pool = ConnectionPool(partial(get_connection, host, int(port or 3306)), size=size)
+        self.ejected_until = 0.0
+        self.lag = None           # giây trễ replication ở lần kiểm tra gần nhất
+        self.error = None
+        self.reads = 0
+        self.ejections = 0
+
+    def healthy(self, now=None):
+        return (time.monotonic() if now is None else now) >= self.ejected_until
+
+    def describe(self):
+        return {"address": self.address, "healthy": self.healthy(), "lag_seconds": self.lag,
+                "reads": self.reads, "ejections": self.ejections, "error": self.error,
+                "pool": self.pool.stats()}
+
+
+def _is_connection_error(e):
+    if isinstance(e, pymysql.err.InterfaceError):
+        return True
+    return isinstance(e, pymysql.err.OperationalError) and bool(e.args) and e.args[0] in CONNECTION_ERRORS
+
+
+def replication_lag(cursor):
+    """Số giây replica trễ so với primary; None nếu replication không chạy. Ném lỗi nếu không phải replica."""
+    try:
+        cursor.execute("SHOW REPLICA STATUS")        # MySQL 8.0.22+
+    except pymysql.err.ProgrammingError:
+        cursor.execute("SHOW SLAVE STATUS")          # MariaDB, MySQL cũ
+    row = cursor.fetchone()
+    if not row:
+        raise ValueError("Server không phải replica")
+    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)
+
+
+class ReadRouter:
+    """Chọn nơi đọc: replica khoẻ đang mượn ít connection nhất (xoay vòng khi bằng nhau), không có thì primary."""
+
+    def __init__(self, replicas, eject_seconds=REPLICA_EJECT_SECONDS, max_lag=REPLICA_MAX_LAG,
+                 read_your_writes=READ_YOUR_WRITES):
+        self.replicas = replicas
+        self.eject_seconds = eject_seconds
+        self.max_lag = max_lag
+        self.read_your_writes = read_your_writes
+        self._lock = threading.Lock()
+        self._writes = {}         # session -> thời điểm (monotonic) hết đọc từ primary
+        self._turn = 0
+        self._primary_reads = 0
+        self._session_reads = 0
+
+    def note_write(self, *sessions):
+        if not self.replicas or self.read_your_writes <= 0:
+            return
+        until = time.monotonic() + self.read_your_writes
+        with self._lock:
+            for session in sessions:
+                if session is not None:
+                    self._writes[session] = until
+            if len(self._writes) > 10000:
+                now = time.monotonic()
+                self._writes = {k: v for k, v in self._writes.items() if v > now}
+
+    def _recent_writer(self, session):
+        if session is None:
+            return False
+        with self._lock:
+            until = self._writes.get(session)
+            if until is not None and until <= time.monotonic():
+                del self._writes[session]
+                until = None
+        return until is not None
+
+    def choose(self, session=None):
+        """Replica để đọc, hoặc None nếu phải đọc từ primary."""
+        if not self.replicas:
+            return None
+        if self._recent_writer(session):
+            self._session_reads += 1
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._turn += 1
+            candidates = [r for r in self.replicas if r.healthy(now)]
+            if not candidates:
+                self._primary_reads += 1
+                return None
+            start = self._turn % len(candidates)
+            ordered = candidates[start:] + candidates[:start]
+            replica = min(ordered, key=lambda r: r.pool.in_use)
+            replica.reads += 1
+            return replica
+
+    def eject(self, replica, reason):
+        with self._lock:
+            if not replica.healthy():
+                return
+            replica.ejected_until = time.monotonic() + self.eject_seconds
+            replica.ejections += 1
+            replica.error = str(reason)
+        print(f"Read replica {replica.address} ejected for {self.eject_seconds:g}s: {reason}")
+
+    @contextmanager
+    def connection(self, session=None):
+        replica = self.choose(session)
+        conn = None
+        if replica is not None:
+            try:
+                conn = replica.pool.acquire()
+            except PoolTimeout:
+                raise
+            except Exception as e:
+                # Không kết nối được: loại replica, lần này đọc từ primary
+                self.eject(replica, e)
+        if conn is None:
+            with db_connection() as conn:
+                yield conn
+            return
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+            broken = True
+            if _is_connection_error(e):
+                self.eject(replica, e)
+            raise
+        finally:
+            replica.pool.release(conn, discard=broken)
+
+    def check(self):
+        """Ping từng replica (kể cả đang bị loại) và đọc độ trễ replication; loại hoặc nhận lại."""
+        for replica in self.replicas:
+            try:
+                problem = self._check_one(replica)
+            except Exception as e:
+                problem = e
+            if problem is not None:
+                self.eject(replica, problem)
+            elif not replica.healthy():
+                with self._lock:
+                    replica.ejected_until = 0.0
+                    replica.error = None
+                lag = "?" if replica.lag is None else f"{replica.lag:g}"
+                print(f"Read replica {replica.address} back in rotation (lag {lag}s)")
+
+    def _check_one(self, replica):
+        # Trả về lý do loại replica, None nếu dùng được
+        conn = replica.pool.acquire()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    lag = replication_lag(cursor)
+                except (pymysql.err.OperationalError, pymysql.err.ProgrammingError) as e:
+                    if _is_connection_error(e):
+                        broken = True
+                        return e
+                    # Thiếu quyền REPLICATION CLIENT: chỉ kiểm tra kết nối
+                    cursor.execute("SELECT 1")
+                    replica.lag = None
+                    return None
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+            broken = True
+            return e
+        finally:
+            replica.pool.release(conn, discard=broken)
+        replica.lag = lag
+        if lag is None:
+            return "replication đã dừng"
+        if lag > self.max_lag:
+            return f"trễ replication {lag:g}s > {self.max_lag:g}s"
+        return None
+
+    def start_health_check(self, interval=REPLICA_CHECK_INTERVAL):
+        """Kiểm tra replica định kỳ trên thread nền (chỉ khi có replica). Trả về Event để dừng."""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.check()
+                except Exception as e:
+                    print(f"Read replica check error: {e}")
+
+        if self.replicas and interval > 0:
+            threading.Thread(target=loop, daemon=True, name="replica-health").start()
+        return stop
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "replicas": len(self.replicas),
+            "healthy": sum(r.healthy(now) for r in self.replicas),
+            "replica_reads": sum(r.reads for r in self.replicas),
+            "primary_reads": self._primary_reads,
+            "read_your_writes_reads": self._session_reads,
+            "ejections": sum(r.ejections for r in self.replicas),
+        }
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.close()
+
+
+router = ReadRouter([Replica(address) for address in READ_REPLICAS])
+_pinned = threading.local()
+
+
+@contextmanager
+def pinned(conn):
+    """Ghim `conn` cho thread hiện tại: read_connection() (và replica.report_connection()) trả
+    lại chính connection này thay vì mượn connection khác. Không đóng/trả `conn`."""
+    previous = getattr(_pinned, "conn", None)
+    _pinned.conn = conn
+    try:
+        yield conn
+    finally:
+        _pinned.conn = previous
+
+
+def pinned_connection():
+    return getattr(_pinned, "conn", None)
+
+
+def read_connection(session=None):
+    """Connection chỉ đọc (replica nếu có, xem ReadRouter). session: username, cho read-your-writes."""
+    conn = pinned_connection()
+    # Connection DuckDB (replica.py) không đọc được bảng ngoài reports: không dùng thay MySQL
+    if conn is not None and session is None and not getattr(conn, "replica", False):
+        return nullcontext(conn)
+    return router.connection(session)
+
+
+def note_write(*sessions):
+    """Gọi sau khi commit thay đổi của các session (username) này, xem READ_YOUR_WRITES."""
+    router.note_write(*sessions)
+
+
+def get_db():
+    """FastAPI dependency: `conn = Depends(get_db)`."""
+    with db_connection() as conn:
+        yield conn
@@ -0,0 +1,294 @@
+"""Thống kê phân phối số lượt in theo ngày (box plot) theo ward hoặc theo giờ.
+
+Mỗi mẫu là số lượt in (có trọng số count, như /reports/summary) của một ward trong một ngày:
+- by=ward: với mỗi ward, phân phối số lượt in theo ngày của ward đó;
+- by=hour: với mỗi giờ, phân phối số lượt in trong giờ đó theo từng ward × ngày.
+Ngày (giờ) không có lượt in nào không phải là mẫu, giống box plot ở frontend.
+
+Các mẫu được giữ sẵn trong sketch KLL (sketches.py) theo tháng, bảng report_sketch_monthly:
+mức ward (kind day/hour), mức city và toàn bộ (kind hour, gộp từ sketch của các ward).
+Sau mỗi lần rollup refresh, sketch của các ward/tháng có dữ liệu mới được dựng lại từ
+rollup rồi gộp lên city và toàn bộ. Truy vấn gộp sketch của các tháng nằm trọn trong
+khoảng ngày ở mức thấp nhất phủ được phạm vi quyền (admin xem theo giờ chỉ đọc một sketch
+mỗi tháng × giờ); các ngày lẻ ở hai đầu khoảng được đọc chính xác từ nguồn tổng hợp.
+Sketch chưa theo kịp rollup (hoặc đang dùng replica DuckDB): mọi mẫu đọc từ nguồn tổng hợp.
+
+    python distributions.py rebuild
+"""
+import datetime
+import sys
+from collections import defaultdict
+
+import pymysql
+
+import rollup
+import sketches
+from db import db_connection
+from report_queries import BUSINESS_HOURS, report_filter, scope_filter
+
+TABLE = "report_sketch_monthly"
+STATE_NAME = "sketches"   # dòng watermark trong rollup_state
+BY = ("ward", "hour")
+# by -> loại rollup đọc mẫu
+KINDS = {"ward": "daily", "hour": "hourly"}
+IN_CHUNK = 500            # số ward mỗi truy vấn IN (...)
+
+_schema_ready = False
+
+
+def ensure_schema(conn):
+    global _schema_ready
+    rollup.ensure_schema(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS `{TABLE}` (
+              `level` varchar(8) NOT NULL,
+              `kind` varchar(8) NOT NULL,
+              `month` date NOT NULL,
+              `city_id` int(11) NOT NULL,
+              `ward_id` int(11) NOT NULL,
+              `print_time` int(11) NOT NULL,
+              `n` int(11) NOT NULL,
+              `sketch` mediumblob NOT NULL,
+              PRIMARY KEY (`level`, `kind`, `month`, `city_id`, `ward_id`, `print_time`),
+              KEY `ward_month` (`ward_id`, `month`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cursor.execute(
+            f"INSERT IGNORE INTO `{rollup.STATE_TABLE}` (`name`, `last_report_id`) VALUES (%s, 0)",
+            (STATE_NAME,)
+        )
+    conn.commit()
+    _schema_ready = True
+
+
+def _values_sql(kind, source, where):
+    # Một dòng mỗi ward × ngày (× giờ): số lượt in của ngày (giờ) đó
+    hour, group_hour = ("r.print_time", ", r.print_time") if kind == "hourly" else ("0", "")
+    return f"""
+        SELECT COALESCE(r.ward_id, 0) AS ward_id, COALESCE(r.city_id, 0) AS city_id,
+               {hour} AS hour, {source.weighted} AS value
+        FROM {source.table(kind)} r
+        WHERE {where} AND r.date IS NOT NULL
+        GROUP BY COALESCE(r.ward_id, 0), COALESCE(r.city_id, 0), r.date{group_hour}
+    """
+
+
+def _next_month(day):
+    return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _chunks(items, size=IN_CHUNK):
+    items = sorted(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _store(cursor, level, kind, month, rows, where, params):
+    # Thay toàn bộ sketch của (level, kind, month) khớp where bằng rows [(city, ward, giờ, sketch)]
+    cursor.execute(f"DELETE FROM `{TABLE}` WHERE level = %s AND kind = %s AND month = %s AND {where}",
+                   (level, kind, month, *params))
+    cursor.executemany(
+        f"INSERT INTO `{TABLE}` (level, kind, month, city_id, ward_id, print_time, n, sketch) "
+        f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        [(level, kind, month, city, ward, hour, sketch.n, sketch.to_bytes()) for city, ward, hour, sketch in rows]
+    )
+
+
+def _merged(cursor, level, month, where, params, key):
+    # Gộp sketch giờ của level theo key(dòng) -> {khoá: KLL}
+    cursor.execute(f"SELECT city_id, ward_id, print_time, sketch FROM `{TABLE}` "
+                   f"WHERE level = %s AND kind = 'hour' AND month = %s AND {where}", (level, month, *params))
+    merged = defaultdict(sketches.KLL)
+    for row in cursor.fetchall():
+        merged[key(row)].merge(sketches.KLL.from_bytes(row['sketch']))
+    return merged
+
+
+def _build_month(cursor, month, ward_ids):
+    """Dựng lại sketch của các ward trong tháng từ rollup, rồi gộp lại mức city và toàn bộ."""
+    end = _next_month(month)
+    cities = set()
+    for wards in _chunks(ward_ids):
+        marks = ", ".join(["%s"] * len(wards))
+        for kind, name in (("daily", "day"), ("hourly", "hour")):
+            cursor.execute(_values_sql(kind, rollup.ROLLUP, f"r.ward_id IN ({marks}) AND r.date >= %s AND r.date < %s"),
+                           (*wards, month, end))
+            groups = defaultdict(sketches.KLL)
+            for row in cursor.fetchall():
+                groups[(row['city_id'], row['ward_id'], row['hour'])].update(int(row['value']))
+                cities.add(row['city_id'])
+            _store(cursor, "ward", name, month, [(*key, sketch) for key, sketch in groups.items()],
+                   f"ward_id IN ({marks})", wards)
+    for chunk in _chunks(cities):
+        marks = ", ".join(["%s"] * len(chunk))
+        merged = _merged(cursor, "ward", month, f"city_id IN ({marks})", chunk,
+                         lambda row: (row['city_id'], row['print_time']))
+        _store(cursor, "city", "hour", month, [(city, 0, hour, sketch) for (city, hour), sketch in merged.items()],
+               f"city_id IN ({marks})", chunk)
+    merged = _merged(cursor, "city", month, "1 = 1", (), lambda row: row['print_time'])
+    _store(cursor, "all", "hour", month, [(0, 0, hour, sketch) for hour, sketch in merged.items()], "1 = 1", ())
+
+
+def refresh(conn, batch_size=rollup.BATCH_SIZE):
+    """Dựng lại sketch của các ward/tháng có dòng reports mới đã vào rollup. Trả về watermark mới.
+
+    Chỉ quét id tới rollup.watermark: rollup chỉ tiến tới id đã ổn định (rollup.SettledId),
+    nên dòng id nhỏ commit muộn vẫn nằm sau watermark và được quét ở lần sau, không bị bỏ
+    qua như khi quét tới MAX(id).
+    """
+    if not _schema_ready:
+        ensure_schema(conn)
+    with conn.cursor() as cursor:
+        # Khoá dòng trạng thái để nhiều worker không dựng trùng
+        cursor.execute(
+            f"SELECT last_report_id FROM `{rollup.STATE_TABLE}` WHERE name = %s FOR UPDATE",
+            (STATE_NAME,)
+        )
+        last_id = cursor.fetchone()['last_report_id']
+        upto = rollup.watermark(cursor) or 0
+        touched = defaultdict(set)   # tháng -> ward_id
+        while last_id < upto:
+            batch_end = min(last_id + batch_size, upto)
+            cursor.execute("""
+                SELECT DISTINCT COALESCE(r.ward_id, 0) AS ward_id, DATE_FORMAT(r.date, '%%Y-%%m-01') AS month
+                FROM reports r
+                WHERE r.id > %s AND r.id <= %s AND r.date IS NOT NULL AND r.print_time BETWEEN %s AND %s
+            """, (last_id, batch_end, *BUSINESS_HOURS))
+            for row in cursor.fetchall():
+                touched[datetime.date.fromisoformat(row['month'])].add(row['ward_id'])
+            last_id = batch_end
+        for month in sorted(touched):
+            _build_month(cursor, month, touched[month])
+        cursor.execute(
+            f"UPDATE `{rollup.STATE_TABLE}` SET last_report_id = %s, refreshed_at = UTC_TIMESTAMP() WHERE name = %s",
+            (last_id, STATE_NAME)
+        )
+    conn.commit()
+    if touched:
+        print(f"Sketches: rebuilt {sum(len(w) for w in touched.values())} ward-month(s)")
+    return last_id
+
+
+def rebuild(conn):
+    """Dựng lại toàn bộ sketch từ rollup (mọi ward/tháng đang có trong rollup)."""
+    ensure_schema(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT 1 FROM `{rollup.STATE_TABLE}` WHERE name = %s FOR UPDATE", (STATE_NAME,))
+        cursor.execute(f"DELETE FROM `{TABLE}`")
+        upto = rollup.watermark(cursor) or 0
+        cursor.execute(f"""
+            SELECT DISTINCT ward_id, DATE_FORMAT(date, '%Y-%m-01') AS month
+            FROM `{rollup.ROLLUPS['daily'][0]}`
+        """)
+        touched = defaultdict(set)
+        for row in cursor.fetchall():
+            touched[datetime.date.fromisoformat(row['month'])].add(row['ward_id'])
+        for month in sorted(touched):
+            _build_month(cursor, month, touched[month])
+        cursor.execute(f"UPDATE `{rollup.STATE_TABLE}` SET last_report_id = %s WHERE name = %s", (upto, STATE_NAME))
+    conn.commit()
+    return upto
+
+
+def is_current(cursor):
+    """Sketch đã theo kịp rollup (dùng khi rollup phủ khoảng ngày, xem rollup.source_for)."""
+    try:
+        cursor.execute(f"SELECT last_report_id FROM `{rollup.STATE_TABLE}` WHERE name = %s", (STATE_NAME,))
+    except pymysql.err.ProgrammingError:
+        return False
+    row = cursor.fetchone()
+    return row is not None and row['last_report_id'] >= (rollup.watermark(cursor) or 0)
+
+
+def _split(start_date, end_date):
+    """Chia khoảng ngày thành ([tháng đầu, tháng sau tháng cuối) đọc từ sketch, hoặc None)
+    và các khoảng ngày lẻ [(từ, đến)] đọc chính xác."""
+    start = datetime.date.fromisoformat(start_date) if start_date else None
+    end = datetime.date.fromisoformat(end_date) if end_date else None
+    first = None if start is None else (start if start.day == 1 else _next_month(start))
+    stop = None
+    if end is not None:
+        stop = _next_month(end) if (end + datetime.timedelta(days=1)).day == 1 else end.replace(day=1)
+    if first is not None and stop is not None and first >= stop:
+        return None, [(start_date, end_date)]
+    edges = []
+    if start is not None and first > start:
+        edges.append((start.isoformat(), (first - datetime.timedelta(days=1)).isoformat()))
+    if end is not None and stop <= end:
+        edges.append((stop.isoformat(), end.isoformat()))
+    return (first, stop), edges
+
+
+def _sketch_filter(user, by, ward_id):
+    # Mức sketch thấp nhất phủ đúng phạm vi quyền: theo giờ mà không lọc ward thì đọc
+    # sketch đã gộp của city (user city) hoặc toàn bộ (admin)
+    if by == "hour" and ward_id is None and user["role"] == "admin":
+        return "all", "hour", [], []
+    if by == "hour" and user["role"] == "city" and not ward_id:
+        return "city", "hour", ["r.city_id = %s"], [user["city_id"]]
+    clauses, params = scope_filter(user, ward_id)
+    return "ward", "day" if by == "ward" else "hour", clauses, params
+
+
+def distribution(cursor, user, by, ward_id=None, start_date=None, end_date=None,
+                 source=rollup.ROLLUP, use_sketches=True):
+    """Box plot theo ward hoặc giờ: {ward_id | giờ: sketches.box_stats(...)}.
+
+    use_sketches=False (sketch chưa theo kịp, replica): mọi mẫu đọc từ source.
+    """
+    key = "ward_id" if by == "ward" else "hour"
+    groups = defaultdict(sketches.KLL)
+    months, edges = _split(start_date, end_date) if use_sketches else (None, [(start_date, end_date)])
+    if months is not None:
+        level, kind, clauses, params = _sketch_filter(user, by, ward_id)
+        clauses = clauses + ["r.level = %s", "r.kind = %s"]
+        params = params + [level, kind]
+        first, stop = months
+        if first is not None:
+            clauses.append("r.month >= %s")
+            params.append(first)
+        if stop is not None:
+            clauses.append("r.month < %s")
+            params.append(stop)
+        cursor.execute(f"""
+            SELECT r.ward_id, r.print_time AS hour, r.sketch
+            FROM `{TABLE}` r
+            WHERE {' AND '.join(clauses)}
+        """, params)
+        for row in cursor.fetchall():
+            groups[row[key]].merge(sketches.KLL.from_bytes(row['sketch']))
+    for start, end in edges:
+        where, params = report_filter(user, ward_id, start, end, business_hours=source.business_hours)
+        # Các phần của SplitSource rời nhau theo ngày: mỗi dòng vẫn là một mẫu ward × ngày
+        for part, part_where, part_params in source.parts(where, params):
+            cursor.execute(_values_sql(KINDS[by], part, part_where), part_params)
+            for row in cursor.fetchall():
+                groups[row[key]].update(int(row['value']))
+    return {group: sketches.box_stats(sketch) for group, sketch in sorted(groups.items())}
+
+
+def query(cursor, user, by, ward_id=None, start_date=None, end_date=None, source=rollup.ROLLUP,
+          use_sketches=True):
+    """Dữ liệu của /reports/distribution: danh sách box theo ward (kèm ward_name) hoặc theo giờ."""
+    stats = distribution(cursor, user, by, ward_id, start_date, end_date, source, use_sketches)
+    if by == "hour":
+        return [{"hour": hour, **box} for hour, box in stats.items()]
+    names = {}
+    for wards in _chunks(stats):
+        cursor.execute(f"SELECT ward_id, ward_name FROM wards WHERE ward_id IN ({', '.join(['%s'] * len(wards))})",
+                       wards)
+        names.update((row['ward_id'], row['ward_name']) for row in cursor.fetchall())
+    return [{"ward_id": ward, "ward_name": names.get(ward), **box} for ward, box in stats.items()]
+
+
+rollup.after_refresh(refresh)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "refresh"
+    if command not in ("refresh", "rebuild"):
+        sys.exit("Cách dùng: python distributions.py [refresh|rebuild]")
+    with db_connection() as conn:
+        last_id = rebuild(conn) if command == "rebuild" else refresh(conn)
+    print(f"Sketches {command} xong, watermark reports.id = {last_id}")
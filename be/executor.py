@@ -0,0 +1,57 @@
+import os
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import metrics
+from db import EXPORT_CONNECTIONS, REQUEST_CONNECTIONS
+
+# Thread pool riêng cho truy vấn DB (PyMySQL là blocking), giới hạn theo phần pool dành cho request
+# (db.REQUEST_CONNECTIONS), để export và thread nền luôn còn connection
+DB_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", REQUEST_CONNECTIONS))
+# Thread pool riêng cho export (pandas + ghi file), để export chậm không chiếm hết worker của /reports
+EXPORT_WORKERS = EXPORT_CONNECTIONS
+
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+# Process pool dựng nội dung CSV của export (việc nặng CPU, giữ GIL nếu chạy bằng thread).
+# 0/1 = tắt, render ngay trên thread export. Dùng chung cho mọi export đang chạy.
+RENDER_PROCESSES = int(os.getenv("EXPORT_RENDER_PROCESSES", min(4, os.cpu_count() or 1)))
+_render_executor = None
+_render_lock = threading.Lock()
+
+
+async def run_db(fn, *args, **kwargs):
+    """Chạy hàm blocking (truy vấn DB) trên db_executor, không chặn event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, metrics.track(partial(fn, *args, **kwargs)))
+
+
+async def run_export(fn, *args, **kwargs):
+    """Chạy công việc export (DB + pandas) trên export_executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(export_executor, metrics.track(partial(fn, *args, **kwargs)))
+
+
+def render_executor():
+    """Process pool render export (tạo khi cần lần đầu), None nếu tắt."""
+    global _render_executor
+    if RENDER_PROCESSES <= 1:
+        return None
+    with _render_lock:
+        if _render_executor is None:
+            # spawn thay vì fork: process server đang có nhiều thread (pool DB, replica, SSE)
+            _render_executor = ProcessPoolExecutor(
+                max_workers=RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _render_executor
+
+
+def shutdown():
+    db_executor.shutdown(wait=False, cancel_futures=True)
+    export_executor.shutdown(wait=False, cancel_futures=True)
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,165 @@
+"""Hàng đợi export bất đồng bộ: tạo job, theo dõi tiến độ, tải file khi xong.
+
+Mỗi bộ tham số export (phạm vi quyền, ward_id, khoảng ngày, group_by, format, limit,
+offset) ứng với một lần dựng file (_Build). Nhiều job cùng khoá dùng chung một lần
+dựng và một file trong kho artifact, file bị xoá sau EXPORT_ARTIFACT_TTL giây.
+
+Trạng thái nằm trong bộ nhớ của từng process: khi chạy nhiều worker, client phải
+được định tuyến về đúng worker đã tạo job (hoặc chạy 1 worker cho API export).
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from executor import export_executor
+
+ARTIFACT_DIR = os.getenv("EXPORT_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "kiosk_exports"))
+ARTIFACT_TTL = float(os.getenv("EXPORT_ARTIFACT_TTL", 600))      # giây giữ file đã dựng
+JOBS_PER_USER = int(os.getenv("EXPORT_JOBS_PER_USER", 2))        # số job đang chạy tối đa của 1 user
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class TooManyJobs(Exception):
+    """User đã có đủ số job export đang chờ/chạy."""
+
+
+class _Build:
+    """Một lần dựng file export, dùng chung bởi mọi job có cùng khoá."""
+
+    def __init__(self, key):
+        self.key = key
+        self.status = QUEUED
+        self.rows = 0
+        self.total = None
+        self.error = None
+        self.path = None
+        self.media_type = None
+        self.filename = None
+        self.finished_at = None
+
+    def expired(self, now):
+        return self.finished_at is not None and now - self.finished_at > ARTIFACT_TTL
+
+
+class ExportJobs:
+    """Quản lý job export chạy trên export_executor (giới hạn số thread)."""
+
+    def __init__(self, executor=export_executor, artifact_dir=ARTIFACT_DIR,
+                 per_user=JOBS_PER_USER):
+        self.executor = executor
+        self.artifact_dir = artifact_dir
+        self.per_user = per_user
+        self._lock = threading.Lock()
+        self._builds = {}     # khoá -> _Build
+        self._jobs = {}       # job_id -> (username, created_at, _Build)
+
+    def submit(self, user, key, build_fn):
+        """Tạo job cho user. build_fn(progress) trả về (đường dẫn, media type, tên file)."""
+        with self._lock:
+            self._evict(time.monotonic())
+            active = sum(
+                1 for owner, _, build in self._jobs.values()
+                if owner == user["username"] and build.status in (QUEUED, RUNNING)
+            )
+            if active >= self.per_user:
+                raise TooManyJobs(f"Tối đa {self.per_user} export đang chạy cho mỗi user")
+            build = self._builds.get(key)
+            if build is None or build.status == FAILED:
+                build = self._builds[key] = _Build(key)
+                self.executor.submit(self._run, build, build_fn)
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = (user["username"], datetime.datetime.now().isoformat(timespec="seconds"), build)
+        return job_id
+
+    def _run(self, build, build_fn):
+        build.status = RUNNING
+
+        def progress(rows, total=None):
+            build.rows = rows
+            if total is not None:
+                build.total = total
+
+        try:
+            path, media_type, filename = build_fn(progress)
+            os.makedirs(self.artifact_dir, exist_ok=True)
+            target = os.path.join(self.artifact_dir, uuid.uuid4().hex + os.path.splitext(path)[1])
+            shutil.move(path, target)
+            build.path, build.media_type, build.filename = target, media_type, filename
+            build.status = DONE
+        except Exception as e:
+            print(f"Export job error: {str(e)}")
+            build.error = getattr(e, "detail", None) or "Export báo cáo thất bại"
+            build.status = FAILED
+        finally:
+            build.finished_at = time.monotonic()
+
+    def _evict(self, now):
+        # Gọi khi đang giữ lock: xoá file hết hạn và các job trỏ tới nó
+        for key, build in list(self._builds.items()):
+            if build.expired(now):
+                del self._builds[key]
+                if build.path and os.path.exists(build.path):
+                    os.remove(build.path)
+        for job_id, (_, _, build) in list(self._jobs.items()):
+            if build.expired(now):
+                del self._jobs[job_id]
+
+    def _entry(self, job_id, user):
+        # Chỉ chủ job (hoặc admin) mới xem/tải được job
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._jobs.get(job_id)
+        if entry is None or (entry[0] != user["username"] and user["role"] != "admin"):
+            return None
+        return entry
+
+    def get(self, job_id, user):
+        """Trả về _Build của job, None nếu không có hoặc không thuộc user."""
+        entry = self._entry(job_id, user)
+        return entry[2] if entry else None
+
+    def describe(self, job_id, user):
+        entry = self._entry(job_id, user)
+        if entry is None:
+            return None
+        _, created_at, build = entry
+        percent = None
+        if build.status == DONE:
+            percent = 100.0
+        elif build.total:
+            percent = round(min(build.rows / build.total, 1) * 100, 1)
+        return {
+            "job_id": job_id,
+            "status": build.status,
+            "rows": build.rows,
+            "total": build.total,
+            "percent": percent,
+            "error": build.error,
+            "created_at": created_at,
+            "download_url": f"/reports/export/jobs/{job_id}/download" if build.status == DONE else None,
+        }
+
+    def stats(self):
+        with self._lock:
+            builds = list(self._builds.values())
+            return {
+                "jobs": len(self._jobs),
+                "builds": {s: sum(b.status == s for b in builds) for s in (QUEUED, RUNNING, DONE, FAILED)},
+            }
+
+    def close(self):
+        """Xoá các file đã dựng (gọi khi tắt app)."""
+        with self._lock:
+            for build in self._builds.values():
+                if build.path and os.path.exists(build.path):
+                    os.remove(build.path)
+            self._builds.clear()
+            self._jobs.clear()
+
+
+jobs = ExportJobs()
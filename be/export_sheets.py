@@ -0,0 +1,206 @@
+from collections import Counter
+
+# Các bảng tổng hợp của file export được dựng từ các Series đếm số lượt in
+# (theo ngày, giờ, lĩnh vực, ...). Nguồn đếm có thể là DataFrame dữ liệu gốc
+# (counts_from_frame), các bảng rollup (rollup.export_counts) hoặc luồng dòng
+# dữ liệu khi export streaming (CountAccumulator).
+# numpy/pandas được import trong từng hàm: chỉ nạp khi có export đầu tiên.
+
+# (khoá trong build_sheets, tên sheet Excel, tên file CSV, bỏ qua file CSV khi rỗng)
+SUMMARY_SHEETS = [
+    ('so_luot_in', 'Số lượt in', 'so_luot_in.csv', False),
+    ('linh_vuc', 'Lĩnh vực', 'linh_vuc.csv', False),
+    ('top_thu_tuc', 'Top thủ tục', 'top_thu_tuc.csv', False),
+    ('in_theo_gio', 'In theo giờ', 'in_theo_gio.csv', False),
+    ('tuoi_gioitinh', 'Tuổi & Giới tính', 'tuoi_gioitinh.csv', True),
+    ('xac_thuc', 'Xác thực', 'xac_thuc.csv', True),
+]
+
+
+def _codes(column):
+    # Mã số nguyên theo thứ tự đã sắp xếp (giống thứ tự groupby), -1 cho giá trị rỗng
+    import pandas as pd
+    return pd.factorize(column, sort=True)
+
+
+def _marginal(codes, uniques, name):
+    # factorize chỉ trả về các giá trị có xuất hiện nên mọi nhóm đều có số đếm > 0
+    import numpy as np
+    import pandas as pd
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return pd.Series(counts, index=pd.Index(uniques, name=name), dtype='int64')
+
+
+def counts_from_frame(df_data):
+    """Đếm số dòng theo từng chiều từ DataFrame dữ liệu export.
+
+    Mỗi cột chỉ được băm một lần (factorize), mọi bảng đếm sau đó là np.bincount
+    trên mã số nguyên; kết quả giống hệt groupby(...).size() của từng cột.
+    """
+    import numpy as np
+    import pandas as pd
+
+    date_codes, dates = _codes(df_data['date'])
+    hour_codes, hours = _codes(df_data['hour'])
+    age_codes, age_groups = _codes(df_data['age_group'])
+    gender_codes, genders = _codes(df_data['gender'])
+    n_dates, n_genders = len(dates), len(genders)
+
+    # Số ngày có in theo giờ: số cặp (giờ, ngày) khác nhau của mỗi giờ
+    both = (hour_codes >= 0) & (date_codes >= 0)
+    pairs = np.bincount(hour_codes[both].astype('int64') * n_dates + date_codes[both],
+                        minlength=len(hours) * n_dates)
+    hour_days = (pairs.reshape(len(hours), n_dates) > 0).sum(axis=1)
+
+    # Tuổi × giới tính: chỉ giữ các cặp có xuất hiện, như groupby 2 cột
+    both = (age_codes >= 0) & (gender_codes >= 0)
+    pair_counts = np.bincount(age_codes[both].astype('int64') * n_genders + gender_codes[both],
+                              minlength=len(age_groups) * n_genders)
+    seen = np.flatnonzero(pair_counts)
+    age_gender = pd.Series(pair_counts[seen], index=pd.MultiIndex.from_arrays(
+        [age_groups[seen // max(n_genders, 1)], genders[seen % max(n_genders, 1)]],
+        names=['age_group', 'gender'],
+    ), dtype='int64')
+
+    return {
+        'date': _marginal(date_codes, dates, 'date'),
+        'hour': _marginal(hour_codes, hours, 'hour'),
+        'hour_days': pd.Series(hour_days, index=pd.Index(hours, name='hour'), dtype='int64'),
+        'domain': _marginal(*_codes(df_data['domain']), 'domain'),
+        'procedure': _marginal(*_codes(df_data['procedure']), 'procedure'),
+        'age_gender': age_gender,
+        'auth_type': _marginal(*_codes(df_data['auth_type']), 'auth_type'),
+    }
+
+
+def _series(counter, name):
+    import pandas as pd
+
+    keys = sorted(counter)
+    if isinstance(name, list):
+        index = pd.MultiIndex.from_tuples(keys, names=name) if keys else pd.MultiIndex.from_arrays([[], []], names=name)
+    else:
+        index = pd.Index(keys, name=name)
+    return pd.Series([counter[k] for k in keys], index=index, dtype='int64')
+
+
+class CountAccumulator:
+    """Đếm dần từng dòng (dict đã xử lý) với bộ nhớ chỉ phụ thuộc số giá trị khác nhau.
+
+    counts() cho kết quả giống counts_from_frame trên DataFrame của cùng các dòng:
+    khoá None bị bỏ qua như pandas groupby.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.date = Counter()
+        self.hour = Counter()
+        self.hour_dates = set()
+        self.domain = Counter()
+        self.procedure = Counter()
+        self.age_gender = Counter()
+        self.auth_type = Counter()
+
+    def add(self, row):
+        self.total += 1
+        date, hour = row.get('date'), row.get('hour')
+        if date is not None:
+            self.date[date] += 1
+        if hour is not None:
+            self.hour[hour] += 1
+            if date is not None:
+                self.hour_dates.add((hour, date))
+        for key in ('domain', 'procedure', 'auth_type'):
+            value = row.get(key)
+            if value is not None:
+                getattr(self, key)[value] += 1
+        age_group, gender = row.get('age_group'), row.get('gender')
+        if age_group is not None and gender is not None:
+            self.age_gender[(age_group, gender)] += 1
+
+    def counts(self):
+        hour_days = Counter({hour: 0 for hour in self.hour})
+        for hour, _ in self.hour_dates:
+            hour_days[hour] += 1
+        return {
+            'date': _series(self.date, 'date'),
+            'hour': _series(self.hour, 'hour'),
+            'hour_days': _series(hour_days, 'hour'),
+            'domain': _series(self.domain, 'domain'),
+            'procedure': _series(self.procedure, 'procedure'),
+            'age_gender': _series(self.age_gender, ['age_group', 'gender']),
+            'auth_type': _series(self.auth_type, 'auth_type'),
+        }
+
+
+def so_luot_in_sheet(date_counts, group_by):
+    # Số lượt in theo ngày/tuần
+    import pandas as pd
+
+    if group_by == "Tuần":
+        weeks = pd.to_datetime(date_counts.index.to_series(), format='%Y-%m-%d').dt.strftime('%G-[W]%V')
+        so_luot_in = date_counts.groupby(weeks.values).sum().rename_axis('week').reset_index(name='Số lượt in')
+        # Chuỗi 'YYYY-Www-d' không phải dạng ngày nên Từ/Đến để trống, giống hệt file export gốc
+        # (pandas 2 không tự đọc được dạng này); giữ format cố định để pandas không đoán từng dòng
+        so_luot_in['Từ'] = pd.to_datetime(so_luot_in['week'].str[:4] + '-W' + so_luot_in['week'].str[-2:] + '-1', format='%Y-%m-%d', errors='coerce').dt.strftime('%d/%m')
+        so_luot_in['Đến'] = pd.to_datetime(so_luot_in['week'].str[:4] + '-W' + so_luot_in['week'].str[-2:] + '-7', format='%Y-%m-%d', errors='coerce').dt.strftime('%d/%m')
+        so_luot_in = so_luot_in.rename(columns={'week': 'Tuần'})
+        return so_luot_in[['Tuần', 'Từ', 'Đến', 'Số lượt in']]
+    so_luot_in = date_counts.rename_axis('date').reset_index(name='Số lượt in')
+    return so_luot_in.rename(columns={'date': 'Ngày'})
+
+
+def linh_vuc_sheet(domain_counts):
+    # Lĩnh vực
+    linh_vuc = domain_counts.rename_axis('domain').reset_index(name='Tần suất')
+    return linh_vuc.rename(columns={'domain': 'Lĩnh vực'})
+
+
+def top_thu_tuc_sheet(procedure_counts):
+    # Top thủ tục
+    top_thu_tuc = procedure_counts.rename_axis('procedure').reset_index(name='Tần suất')
+    top_thu_tuc = top_thu_tuc.rename(columns={'procedure': 'Tên thủ tục'})
+    return top_thu_tuc.sort_values('Tần suất', ascending=False).head(8)
+
+
+def in_theo_gio_sheet(hour_counts, hour_days):
+    # In theo giờ
+    import pandas as pd
+
+    in_theo_gio = pd.DataFrame({
+        'Trung_binh': hour_counts,
+        'Tong_so_luot': hour_counts,
+        'So_ngay_co_in': hour_days,
+    }).rename_axis('hour')
+    return in_theo_gio.reset_index().rename(columns={
+        'hour': 'Giờ',
+        'Trung_binh': 'Trung bình',
+        'Tong_so_luot': 'Tổng số lượt',
+        'So_ngay_co_in': 'Số ngày có in'
+    })
+
+
+def tuoi_gioitinh_sheet(age_gender_counts):
+    # Tuổi & Giới tính
+    tuoi_gioitinh = age_gender_counts.unstack(fill_value=0)
+    tuoi_gioitinh['Tổng'] = tuoi_gioitinh.sum(axis=1)
+    return tuoi_gioitinh.reset_index().rename(columns={'age_group': 'Nhóm tuổi', 'male': 'Nam', 'female': 'Nữ', 'nam': 'Nam', 'nữ': 'Nữ', 'nu': 'Nữ'})
+
+
+def xac_thuc_sheet(auth_counts):
+    # Xác thực
+    xac_thuc = auth_counts.rename_axis('auth_type').reset_index(name='Số lượng')
+    xac_thuc['Tỷ lệ (%)'] = (xac_thuc['Số lượng'] / xac_thuc['Số lượng'].sum() * 100).round(1)
+    return xac_thuc.rename(columns={'auth_type': 'Loại xác thực'})
+
+
+def build_sheets(counts, group_by):
+    """Trả về các bảng tổng hợp theo đúng thứ tự sheet của file export."""
+    return {
+        'so_luot_in': so_luot_in_sheet(counts['date'], group_by),
+        'linh_vuc': linh_vuc_sheet(counts['domain']),
+        'top_thu_tuc': top_thu_tuc_sheet(counts['procedure']),
+        'in_theo_gio': in_theo_gio_sheet(counts['hour'], counts['hour_days']),
+        'tuoi_gioitinh': tuoi_gioitinh_sheet(counts['age_gender']),
+        'xac_thuc': xac_thuc_sheet(counts['auth_type']),
+    }
@@ -0,0 +1,247 @@
+"""Export streaming: đọc reports bằng cursor không buffer và ghi từng dòng ra file.
+
+Bộ nhớ không phụ thuộc số dòng: dòng dữ liệu được ghi thẳng vào sheet Data
+(xlsxwriter constant_memory) hoặc data.csv trong file zip, các bảng tổng hợp được
+đếm dần bằng export_sheets.CountAccumulator rồi ghi sau cùng.
+
+File zip CSV được ghi theo pipeline: các lô RENDER_CHUNK_ROWS dòng được dựng thành CSV
+trong process pool (executor.render_executor), một thread riêng nén và ghi các lô theo
+đúng thứ tự (zlib nhả GIL), trong khi thread export tiếp tục đọc dữ liệu. Mọi entry
+được ghi từ bộ nhớ vào file tạm riêng của từng export.
+
+pandas và xlsxwriter chỉ được import khi ghi file (export đầu tiên), không phải lúc khởi động.
+"""
+import csv
+import io
+import itertools
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+
+import executor
+import export_sheets
+
+# Export qua DataFrame (buffer toàn bộ) chỉ dùng tới ngưỡng này, lớn hơn thì streaming
+BUFFERED_EXPORT_LIMIT = 10000
+FETCH_SIZE = 2000
+EXCEL_MAX_ROWS = 1048576
+# Số dòng mỗi lô CSV gửi sang process render
+RENDER_CHUNK_ROWS = int(os.getenv("EXPORT_RENDER_CHUNK_ROWS", 20000))
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MEDIA_TYPE = "application/zip"
+# Giống định dạng header pandas.to_excel
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+
+def _batches(cursor, tail=None):
+    """Các lô dòng từ cursor, sau đó (nếu có) các lô tail(số dòng đã đọc) nối tiếp."""
+    n = 0
+    while True:
+        batch = cursor.fetchmany(FETCH_SIZE)
+        if not batch:
+            break
+        n += len(batch)
+        yield batch
+    if tail is not None:
+        yield from tail(n)
+
+
+def _prepared_rows(batches, group_by, acc, progress=None):
+    """Xử lý từng dòng giống export buffer (hour, date dạng chuỗi, tuần) và đếm vào acc."""
+    for batch in batches:
+        if progress is not None:
+            progress(acc.total)
+        for row in batch:
+            print_time = row.get('print_time')
+            row['hour'] = int(print_time) if print_time is not None else None
+            if hasattr(row.get('date'), 'strftime'):
+                if group_by == "Tuần":
+                    row['week'] = row['date'].strftime('%G-[W]%V')
+                row['date'] = row['date'].strftime('%Y-%m-%d')
+            elif group_by == "Tuần":
+                row['week'] = None
+            acc.add(row)
+            yield row
+    if progress is not None:
+        progress(acc.total)
+
+
+def _cell(value):
+    import pandas as pd
+
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _write_frame(worksheet, df, header_format):
+    worksheet.write_row(0, 0, [str(c) for c in df.columns], header_format)
+    for i, values in enumerate(df.itertuples(index=False), start=1):
+        worksheet.write_row(i, 0, [_cell(v) for v in values])
+
+
+def _write_xlsx(path, rows, acc, group_by):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    header_format = workbook.add_format(HEADER_FORMAT)
+    worksheet = workbook.add_worksheet('Data')
+    columns, r, part = None, 0, 1
+    for row in rows:
+        if columns is None:
+            columns = list(row)
+            worksheet.write_row(0, 0, columns, header_format)
+            r = 1
+        elif r >= EXCEL_MAX_ROWS:
+            # Vượt giới hạn dòng của Excel: chuyển sang sheet Data 2, Data 3, ...
+            part += 1
+            worksheet = workbook.add_worksheet(f'Data {part}')
+            worksheet.write_row(0, 0, columns, header_format)
+            r = 1
+        worksheet.write_row(r, 0, [row[c] for c in columns])
+        r += 1
+    if acc.total:
+        sheets = export_sheets.build_sheets(acc.counts(), group_by)
+        for key, sheet_name, _, _ in export_sheets.SUMMARY_SHEETS:
+            _write_frame(workbook.add_worksheet(sheet_name), sheets[key], header_format)
+    workbook.close()
+
+
+def _render_rows(header, rows):
+    """CSV (UTF-8) của một lô dòng (list giá trị), dòng tiêu đề nếu header khác None. Chạy trong process render."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _render_frame(df, header):
+    """CSV (UTF-8) của một phần DataFrame, giống df.to_csv(index=False)."""
+    return df.to_csv(index=False, header=header).encode('utf-8')
+
+
+def _row_jobs(rows):
+    # Gom các dòng dict thành lô list giá trị theo thứ tự cột của dòng đầu tiên
+    columns = header = None
+    chunk = []
+    for row in rows:
+        if columns is None:
+            columns = header = list(row)
+        chunk.append([row[c] for c in columns])
+        if len(chunk) >= RENDER_CHUNK_ROWS:
+            yield _render_rows, header, chunk
+            header, chunk = None, []
+    if chunk:
+        yield _render_rows, header, chunk
+
+
+def _frame_jobs(df):
+    for start in range(0, max(len(df), 1), RENDER_CHUNK_ROWS):
+        yield _render_frame, df.iloc[start:start + RENDER_CHUNK_ROWS], start == 0
+
+
+def _write_entry(zipf, name, jobs):
+    """Ghi entry name của zip từ các lô (hàm render, tham số...) theo đúng thứ tự.
+
+    Có từ 2 lô trở lên và process pool đang bật: render song song trong pool, nén và ghi
+    trên một thread riêng, giới hạn số lô đang xử lý để bộ nhớ không tăng theo số dòng.
+    """
+    pool = executor.render_executor()
+    jobs = iter(jobs)
+    head = list(itertools.islice(jobs, 2))
+    with zipf.open(name, 'w', force_zip64=True) as raw:
+        if pool is None or len(head) < 2:
+            for fn, *args in itertools.chain(head, jobs):
+                raw.write(fn(*args))
+            return
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-zip") as zipper:
+            for fn, *args in itertools.chain(head, jobs):
+                rendered = pool.submit(fn, *args)
+                pending.append(zipper.submit(lambda rendered=rendered: raw.write(rendered.result())))
+                while len(pending) > 2 * executor.RENDER_PROCESSES:
+                    pending.popleft().result()
+            while pending:
+                pending.popleft().result()
+
+
+def _write_sheets(zipf, sheets):
+    for key, _, csv_name, skip_empty in export_sheets.SUMMARY_SHEETS:
+        if skip_empty and sheets[key].empty:
+            continue
+        zipf.writestr(csv_name, sheets[key].to_csv(index=False))
+
+
+def _write_csv_zip(path, rows, acc, group_by):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        _write_entry(zipf, 'data.csv', _row_jobs(rows))
+        if acc.total:
+            _write_sheets(zipf, export_sheets.build_sheets(acc.counts(), group_by))
+
+
+def frames_to_csv_zip(df_data, sheets):
+    """Ghi export buffer (DataFrame dữ liệu + các bảng tổng hợp) ra file zip tạm. Trả về đường dẫn."""
+    fd, path = tempfile.mkstemp(suffix=".zip", prefix="export_")
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            _write_entry(zipf, 'data.csv', _frame_jobs(df_data))
+            _write_sheets(zipf, sheets)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def _write_empty_xlsx(path):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path)
+    workbook.add_worksheet('Data')
+    workbook.close()
+
+
+def export_to_file(conn, sql, params, group_by, format, progress=None, tail=None):
+    """Chạy truy vấn export và ghi ra file tạm. Trả về (đường dẫn, media type, tên file).
+
+    progress(số dòng đã ghi) được gọi sau mỗi lô FETCH_SIZE dòng.
+    tail(số dòng đã đọc) trả về các lô dòng (dict) ghi tiếp sau kết quả truy vấn
+    (dữ liệu archive, xem archive.tail).
+    Người gọi chịu trách nhiệm xoá file sau khi gửi xong.
+    """
+    acc = export_sheets.CountAccumulator()
+    suffix = ".zip" if format == "csv" else ".xlsx"
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="export_")
+    os.close(fd)
+    try:
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            # Ghi file chậm hơn MySQL gửi dữ liệu: nới timeout để server không cắt kết nối
+            cursor.execute("SET SESSION net_write_timeout = 600")
+            cursor.execute(sql, tuple(params))
+            rows = _prepared_rows(_batches(cursor, tail), group_by, acc, progress)
+            if format == "csv":
+                _write_csv_zip(path, rows, acc, group_by)
+            else:
+                _write_xlsx(path, rows, acc, group_by)
+        print(f"Export (streaming): {acc.total} rows")
+        if acc.total == 0:
+            # Giống export buffer: không có dữ liệu thì trả file Excel rỗng
+            os.remove(path)
+            fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="export_")
+            os.close(fd)
+            _write_empty_xlsx(path)
+            return path, XLSX_MEDIA_TYPE, "dashboard_inphieu.xlsx"
+        if format == "csv":
+            return path, ZIP_MEDIA_TYPE, "dashboard_inphieu.zip"
+        return path, XLSX_MEDIA_TYPE, "dashboard_inphieu.xlsx"
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
@@ -0,0 +1,46 @@
+"""Cấu hình gunicorn: nhiều worker uvicorn prefork dùng chung app đã import sẵn ở master.
+
+    gunicorn main:app -c gunicorn.conf.py        (Procfile)
+
+- preload_app: master import main một lần rồi fork, các worker dùng chung (copy-on-write)
+  bộ nhớ của code đã nạp; worker mới khởi động ngay, không import lại.
+- WEB_CONCURRENCY: số worker (mặc định 1, xem bên dưới). PORT: cổng lắng nghe.
+- PRELOAD_EXPORT=1: nạp luôn pandas/numpy/xlsxwriter ở master trước khi fork. Khởi động
+  chậm hơn nhưng export đầu tiên của mỗi worker không phải chờ import, và phần bộ nhớ
+  của các thư viện này được dùng chung giữa các worker thay vì mỗi worker một bản.
+
+Mỗi worker là một process riêng: connection pool (MYSQL_POOL_SIZE), cache trong process,
+job export nền, giới hạn admission control và /metrics là của từng worker. Vì vậy mặc định
+chỉ 1 worker: với nhiều worker, job export nền (/reports/export/jobs) trả 404 khi request
+rơi vào worker khác, replica DuckDB chỉ mở được bởi một process (các worker khác dùng
+MySQL) và giới hạn admission nhân theo số worker. Chỉ tăng WEB_CONCURRENCY khi client
+không dùng job export và đã chia lại MYSQL_POOL_SIZE/ADMISSION_* cho từng worker.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Export lớn chạy trên thread pool, event loop vẫn trả heartbeat nên giữ timeout mặc định
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+PRELOAD_EXPORT = os.getenv("PRELOAD_EXPORT", "0") == "1"
+
+
+def on_starting(server):
+    if PRELOAD_EXPORT:
+        import numpy  # noqa: F401
+        import pandas  # noqa: F401
+        import xlsxwriter  # noqa: F401
+        server.log.info("Preloaded export stack (pandas, numpy, xlsxwriter)")
+
+
+def when_ready(server):
+    # App đã import xong, chưa fork: chuyển các object hiện có ra khỏi vùng GC theo dõi để
+    # lần thu gom rác trong worker không ghi vào (và làm copy) các trang nhớ dùng chung
+    gc.freeze()
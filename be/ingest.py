@@ -0,0 +1,155 @@
+"""Nhận dữ liệu in phiếu từ kiosk theo lô (JSON lines, CSV hoặc mảng JSON) và ghi vào reports.
+
+Mỗi sự kiện được kiểm tra bằng Pydantic, ward_id được đối chiếu với phạm vi quyền
+của user gửi, rồi cả lô được ghi bằng executemany (INSERT nhiều dòng) trong một
+transaction. Sự kiện gửi lại bị bỏ qua nhờ ingest_key (migrations/0002_report_ingest_key.sql).
+Khoá duy nhất là (ingest_key, date) nên chỉ chống trùng trong MySQL: sự kiện có ngày thuộc
+tháng đã archive bị từ chối (check_dates với archive.ingest_cutoff).
+"""
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+from typing import Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+MAX_EVENTS = int(os.getenv("INGEST_MAX_EVENTS", 5000))   # số sự kiện tối đa mỗi request
+
+INSERT_SQL = """
+    INSERT INTO reports
+        (ward_id, city_id, date, `procedure`, count, age_group, gender, domain, auth_type, print_time, ingest_key)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE id = id
+"""
+
+
+class IngestError(Exception):
+    """Lô dữ liệu không hợp lệ. `errors` là danh sách lỗi theo vị trí sự kiện."""
+
+    def __init__(self, message, errors=None, status_code=422):
+        super().__init__(message)
+        self.errors = errors or []
+        self.status_code = status_code
+
+
+class PrintEvent(BaseModel):
+    event_id: Optional[str] = Field(None, min_length=1, max_length=128)
+    ward_id: Optional[int] = None
+    date: datetime.date
+    procedure: str = Field(..., max_length=255)
+    count: int = Field(1, ge=1, le=1000)
+    age_group: Optional[str] = Field(None, max_length=16)
+    gender: Optional[str] = Field(None, max_length=8)
+    domain: Optional[str] = Field(None, max_length=255)
+    auth_type: Optional[str] = Field(None, max_length=32)
+    print_time: int = Field(..., ge=0, le=23)
+
+
+def parse_body(body, content_type):
+    """Tách body thành danh sách dict thô theo Content-Type."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    text = body.decode("utf-8-sig")
+    try:
+        if content_type == "text/csv":
+            # Ô rỗng trong CSV nghĩa là không có giá trị (dùng mặc định của PrintEvent)
+            return [{k: v for k, v in row.items() if v != ""}
+                    for row in csv.DictReader(io.StringIO(text))]
+        if content_type == "application/json":
+            items = json.loads(text)
+            if not isinstance(items, list):
+                raise IngestError("Body JSON phải là mảng sự kiện")
+            return items
+        # Mặc định: JSON lines (application/x-ndjson, application/jsonl)
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    except (ValueError, csv.Error) as e:
+        raise IngestError(f"Không đọc được dữ liệu: {e}", status_code=400)
+
+
+def validate(items):
+    if not items:
+        raise IngestError("Lô dữ liệu rỗng", status_code=400)
+    if len(items) > MAX_EVENTS:
+        raise IngestError(f"Tối đa {MAX_EVENTS} sự kiện mỗi request", status_code=413)
+    events, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            events.append(PrintEvent.model_validate(item))
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.errors(include_url=False, include_context=False)})
+    if errors:
+        raise IngestError(f"{len(errors)} sự kiện không hợp lệ", errors[:100])
+    return events
+
+
+def resolve_wards(events, user, city_of):
+    """Gán ward_id/city_id cho từng sự kiện theo phạm vi quyền của user.
+
+    Ward user chỉ gửi được cho ward của mình (ward_id bỏ trống = ward của user);
+    city user cho các ward trong city; admin cho mọi ward.
+    """
+    resolved, errors = [], []
+    for index, event in enumerate(events):
+        ward_id = event.ward_id
+        if user["role"] == "ward":
+            ward_id = ward_id if ward_id is not None else user.get("ward_id")
+            if ward_id != user.get("ward_id"):
+                errors.append({"index": index, "errors": f"Ward {ward_id} không phải ward của bạn"})
+                continue
+        elif ward_id is None:
+            errors.append({"index": index, "errors": "Thiếu ward_id"})
+            continue
+        try:
+            city_id = city_of(ward_id)
+        except KeyError:
+            errors.append({"index": index, "errors": f"Ward {ward_id} không tồn tại"})
+            continue
+        if user["role"] == "city" and city_id != user.get("city_id"):
+            errors.append({"index": index, "errors": f"Ward {ward_id} không thuộc city {user.get('city_id')} của bạn"})
+            continue
+        resolved.append((event, ward_id, city_id))
+    if errors:
+        raise IngestError(f"{len(errors)} sự kiện không hợp lệ", errors[:100])
+    return resolved
+
+
+def check_dates(resolved, cutoff):
+    """Từ chối sự kiện có ngày trước `cutoff` (tháng đã archive hoặc quá hạn giữ lại)."""
+    errors = [
+        {"index": index, "errors": f"Ngày {e.date} thuộc tháng đã lưu trữ (chỉ nhận từ {cutoff})"}
+        for index, (e, _, _) in enumerate(resolved) if e.date < cutoff
+    ]
+    if errors:
+        raise IngestError(f"{len(errors)} sự kiện không hợp lệ", errors[:100])
+
+
+def ingest_key(ward_id, event_id, batch_key, index):
+    """Khoá idempotency: event_id của kiosk, hoặc Idempotency-Key của lô + vị trí."""
+    if event_id is not None:
+        raw = f"{ward_id}:{event_id}"
+    elif batch_key:
+        raw = f"{ward_id}:{batch_key}:{index}"
+    else:
+        return None
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def insert_events(conn, resolved, batch_key=None):
+    """Ghi các sự kiện trong một transaction. Trả về số dòng thực sự được thêm."""
+    rows = [
+        (ward_id, city_id, e.date, e.procedure, e.count, e.age_group, e.gender, e.domain,
+         e.auth_type, e.print_time, ingest_key(ward_id, e.event_id, batch_key, index))
+        for index, (e, ward_id, city_id) in enumerate(resolved)
+    ]
+    try:
+        with conn.cursor() as cursor:
+            # PyMySQL gộp executemany INSERT ... VALUES thành câu INSERT nhiều dòng;
+            # dòng trùng ingest_key không đổi gì nên affected rows = số dòng mới
+            inserted = cursor.executemany(INSERT_SQL, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted or 0
@@ -0,0 +1,254 @@
+"""Đẩy cập nhật dashboard theo thời gian thực qua Server-Sent Events (/reports/live).
+
+Mỗi worker có một Broadcaster: một task duy nhất đọc các dòng reports mới theo id
+(chỉ khi có client đang theo dõi), gộp thành delta tổng hợp (lượt in theo ngày, giờ,
+lĩnh vực, thủ tục — có trọng số count như /reports/summary) cho từng phạm vi quyền
+đang có người nghe, mã hoá JSON một lần cho mỗi phạm vi rồi chia cho các client.
+
+id của reports được cấp theo thứ tự INSERT chứ không theo thứ tự commit: mỗi lần đọc chỉ
+quét các id lớn hơn id lớn nhất đã thấy, và ghi lại các khoảng id bị thiếu bên dưới. Các
+khoảng này được đọc lại (id BETWEEN, theo khoá chính) ở các lần sau cho tới khi id đã ổn
+định (rollup.SettledId), nên dòng có id nhỏ commit muộn vẫn được gửi mà không phải đọc
+lại các dòng đã gửi.
+
+Mỗi client có hàng đợi giới hạn: client đọc chậm bị xoá hàng đợi và nhận sự kiện
+`resync` (tải lại toàn bộ qua /reports/summary) thay vì làm server giữ dữ liệu vô hạn.
+"""
+import asyncio
+import os
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+
+import orjson
+
+import rollup
+from db import db_connection
+from executor import run_db
+from report_queries import BUSINESS_HOURS
+
+POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", 2))     # giây giữa 2 lần đọc dòng mới
+HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", 15))            # giây, comment giữ kết nối
+QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", 32))            # số sự kiện chờ tối đa mỗi client
+MAX_CLIENTS = int(os.getenv("LIVE_MAX_CLIENTS", 1000))        # số kết nối tối đa mỗi worker
+FETCH_SIZE = 5000
+GAP_CHUNK = 200                                               # số khoảng id thiếu mỗi truy vấn đọc lại
+
+SELECT_SQL = "SELECT id, ward_id, city_id, date, `procedure`, count, domain, print_time FROM reports"
+
+HEARTBEAT_EVENT = b": ping\n\n"
+RESYNC_EVENT = b"event: resync\ndata: {}\n\n"
+
+
+class TooManyClients(Exception):
+    """Worker đã đủ MAX_CLIENTS kết nối live."""
+
+
+def sse(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+class _Delta:
+    """Số lượt in mới của một phạm vi trong một lần đọc."""
+
+    def __init__(self):
+        self.prints = 0
+        self.dates = Counter()
+        self.hours = Counter()
+        self.domains = Counter()
+        self.procedures = Counter()
+
+    def add(self, row, weight):
+        self.prints += weight
+        self.dates[row['date'].isoformat() if row['date'] else None] += weight
+        self.hours[row['print_time']] += weight
+        if row['domain']:
+            self.domains[row['domain']] += weight
+        self.procedures[row['procedure'] or 'Không xác định'] += weight
+
+    def payload(self, scope, last_id):
+        return {
+            "scope": list(scope),
+            "last_id": last_id,
+            "prints": self.prints,
+            "dates": dict(self.dates),
+            "hours": {str(h): n for h, n in sorted(self.hours.items())},
+            "domains": dict(self.domains),
+            "procedures": dict(self.procedures),
+        }
+
+
+def row_scopes(row):
+    """Các phạm vi (giống report_queries.scope_key) nhìn thấy một dòng reports."""
+    return (("ward", row['ward_id']), ("city", row['city_id']), ("admin",))
+
+
+class Broadcaster:
+    def __init__(self):
+        self._subs = defaultdict(set)   # phạm vi -> tập hàng đợi client
+        self._lagged = set()            # hàng đợi đang chờ client đọc sự kiện resync
+        self._seen_id = None            # id lớn nhất đã gửi: mọi id nhỏ hơn đã gửi hoặc nằm trong _gaps
+        self._gaps = []                 # các khoảng (lo, hi) id chưa thấy, trên id đã ổn định, tăng dần
+        self._settled = None
+        self._loop = None
+        self._wake = None
+        self._task = None
+        self.clients = 0
+        self.resyncs = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def notify(self):
+        """Có dữ liệu mới (gọi được từ thread khác, ví dụ ingest): đọc ngay không chờ interval."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def subscribe(self, scope):
+        if self.clients >= MAX_CLIENTS:
+            raise TooManyClients(f"Tối đa {MAX_CLIENTS} kết nối live mỗi worker")
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self._subs[scope].add(queue)
+        self.clients += 1
+        return queue
+
+    def unsubscribe(self, scope, queue):
+        subs = self._subs.get(scope)
+        if subs and queue in subs:
+            subs.discard(queue)
+            self._lagged.discard(queue)
+            self.clients -= 1
+            if not subs:
+                del self._subs[scope]
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._subs:
+                # Không ai nghe: không đọc DB, lần sau bắt đầu lại từ MAX(id) hiện tại
+                self._seen_id = None
+                continue
+            try:
+                rows = await run_db(self._fetch)
+            except Exception as e:
+                print(f"Live poll error: {e}")
+                continue
+            if rows:
+                self._publish(rows)
+
+    def _fetch(self):
+        with db_connection() as conn, conn.cursor() as cursor:
+            max_id = rollup.max_report_id(cursor)
+            if self._seen_id is None:
+                self._seen_id = max_id
+                self._gaps = []
+                self._settled = rollup.SettledId()
+                self._settled.observe(max_id)
+                return []
+            settled = self._settled.observe(max_id)
+            # id thiếu đã ổn định: giao dịch giữ nó đã rollback (hoặc id bị bỏ qua), không chờ nữa
+            self._gaps = [(max(lo, settled + 1), hi) for lo, hi in self._gaps if hi > settled]
+            rows = self._fetch_gaps(cursor) if self._gaps else []
+            while True:
+                # Quét theo khoá chính từ id lớn nhất đã thấy: một truy vấn cho cả worker, không theo client
+                cursor.execute(SELECT_SQL + " WHERE id > %s ORDER BY id LIMIT %s", (self._seen_id, FETCH_SIZE))
+                batch = cursor.fetchall()
+                expected = self._seen_id + 1
+                for row in batch:
+                    if row['id'] > max(expected, settled + 1):
+                        self._gaps.append((max(expected, settled + 1), row['id'] - 1))
+                    expected = row['id'] + 1
+                rows += batch
+                if batch:
+                    self._seen_id = batch[-1]['id']
+                if len(batch) < FETCH_SIZE:
+                    break
+        return rows
+
+    def _fetch_gaps(self, cursor):
+        """Đọc lại các khoảng id còn thiếu (dòng commit muộn), thu hẹp khoảng theo dòng tìm thấy."""
+        rows = []
+        for i in range(0, len(self._gaps), GAP_CHUNK):
+            chunk = self._gaps[i:i + GAP_CHUNK]
+            cursor.execute(
+                SELECT_SQL + " WHERE " + " OR ".join(["id BETWEEN %s AND %s"] * len(chunk)),
+                [value for gap in chunk for value in gap]
+            )
+            rows += cursor.fetchall()
+        if rows:
+            found = sorted(row['id'] for row in rows)
+            gaps = []
+            for lo, hi in self._gaps:
+                for found_id in found[bisect_left(found, lo):bisect_right(found, hi)]:
+                    if found_id > lo:
+                        gaps.append((lo, found_id - 1))
+                    lo = found_id + 1
+                if lo <= hi:
+                    gaps.append((lo, hi))
+            self._gaps = gaps
+        return rows
+
+    def _publish(self, rows):
+        deltas = {}
+        for row in rows:
+            if row['print_time'] is None or not BUSINESS_HOURS[0] <= row['print_time'] <= BUSINESS_HOURS[1]:
+                continue
+            weight = row['count'] or 1
+            for scope in row_scopes(row):
+                if scope in self._subs:
+                    deltas.setdefault(scope, _Delta()).add(row, weight)
+        for scope, delta in deltas.items():
+            message = sse("delta", delta.payload(scope, self._seen_id))
+            for queue in list(self._subs.get(scope, ())):
+                self._offer(queue, message)
+
+    def _offer(self, queue, message):
+        if queue in self._lagged:
+            if not queue.empty():
+                # Client chưa đọc resync: delta này đã nằm trong lần tải lại sắp tới
+                return
+            self._lagged.discard(queue)
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Client không đọc kịp: bỏ các delta đang chờ, báo client tải lại toàn bộ
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC_EVENT)
+            self._lagged.add(queue)
+            self.resyncs += 1
+
+    def stats(self):
+        return {"clients": self.clients, "scopes": len(self._subs), "last_id": self._seen_id,
+                "settled_id": self._settled.value if self._settled else None,
+                "gaps": len(self._gaps), "pending": sum(hi - lo + 1 for lo, hi in self._gaps),
+                "resyncs": self.resyncs}
+
+
+broadcaster = Broadcaster()
+
+
+async def event_stream(request, scope):
+    """Generator SSE cho một client: delta của phạm vi, heartbeat khi không có dữ liệu."""
+    queue = broadcaster.subscribe(scope)
+    try:
+        yield b"retry: 5000\n\n" + sse("hello", {"scope": list(scope)})
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                message = HEARTBEAT_EVENT
+            if await request.is_disconnected():
+                return
+            yield message
+    finally:
+        broadcaster.unsubscribe(scope, queue)
@@ -1,21 +1,41 @@
 # ====== 1. Import và cấu hình app, bảo mật ======
-from fastapi import FastAPI, Depends, HTTPException, Query
+import time
+_import_started = time.perf_counter()   # thời gian import app: xem metrics.process_stats
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Header, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse, FileResponse, Response, PlainTextResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Optional
+from functools import partial
 import jwt
 import hashlib
 import datetime
-import pandas as pd
-import io
-import zipfile
-from db import get_connection
+import orjson
+from db import db_connection, read_connection, note_write, pinned, pool, router as read_router
+import cache
+import auth_cache
+import report_queries
+import report_rows
+import rollup
+import distributions
+import export_sheets
+import export_stream
+import export_jobs
+import ingest
+import archive
+import replica
+import live
+import metrics
+import admission
+from executor import run_db, run_export, shutdown as shutdown_executors
 
 import tempfile
 import os
-import xlsxwriter
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -34,6 +54,32 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.on_event("startup")
+async def _startup():
+    started = time.perf_counter()
+    app.state.rollup_stop = rollup.start_background_refresh()
+    app.state.ward_map_stop = auth_cache.wards.start_background_refresh()
+    app.state.replica_stop = replica.start_background_sync()
+    app.state.read_replica_stop = read_router.start_health_check()
+    live.broadcaster.start()
+    metrics.record_startup(round(time.perf_counter() - started, 3))
+    stats = metrics.process_stats()
+    print(f"Worker {stats['pid']} ready: import {stats['import_seconds']}s"
+          f"{' (preloaded)' if stats['preloaded'] else ''}, startup {stats['startup_seconds']}s, "
+          f"RSS {stats.get('rss_bytes', stats.get('max_rss_bytes', 0)) / 2**20:.0f} MB")
+
+@app.on_event("shutdown")
+async def _shutdown():
+    app.state.rollup_stop.set()
+    app.state.ward_map_stop.set()
+    app.state.replica_stop.set()
+    app.state.read_replica_stop.set()
+    await live.broadcaster.stop()
+    shutdown_executors()
+    export_jobs.jobs.close()
+    pool.close()
+    read_router.close()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # hoặc ["*"] nếu bạn chấp nhận toàn bộ
@@ -42,20 +88,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class _GZipJSON:
+    """Nén gzip response JSON của API. Bỏ qua file export (xlsx/zip đã nén sẵn) và luồng SSE."""
+
+    def __init__(self, app):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=1024, compresslevel=6)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(("/reports/export", "/reports/live")):
+            return await self.gzip(scope, receive, send)
+        await self.app(scope, receive, send)
+
+app.add_middleware(_GZipJSON)
+
+class _Metrics:
+    """Đo thời gian mỗi request theo route (metrics.requests, xem /metrics).
+
+    Admin gửi header "X-Profile: 1": request vẫn chạy bình thường nhưng response được
+    thay bằng profile lấy mẫu stack (collapsed stack, text), header X-Profile-Status
+    là status gốc. Luồng SSE và chính /metrics không được đo.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(("/reports/live", "/metrics")):
+            return await self.app(scope, receive, send)
+        profile = _profile_requested(scope)
+        status = 500
+        started = time.perf_counter()
+        token = metrics.current_request.set(scope)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            if not profile:
+                await send(message)
+
+        try:
+            if not profile:
+                await self.app(scope, receive, send_wrapper)
+            else:
+                with metrics.Sampler().running() as sampler:
+                    await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.current_request.reset(token)
+            metrics.observe_request(scope, status, elapsed)
+        if profile:
+            header = (f"# {scope['method']} {scope['path']}: {elapsed * 1000:.1f} ms, "
+                      f"{sampler.samples} samples every {sampler.interval * 1000:g} ms\n")
+            response = PlainTextResponse(header + sampler.collapsed(), headers={"X-Profile-Status": str(status)})
+            await response(scope, receive, send)
+
+def _profile_requested(scope):
+    headers = dict(scope["headers"])
+    if headers.get(b"x-profile") not in (b"1", b"true"):
+        return False
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        return _decode_token(authorization[7:])["role"] == "admin"
+    except HTTPException:
+        return False
+
+app.add_middleware(_Metrics)
+
+@app.exception_handler(admission.Overloaded)
+async def _overloaded(request: Request, exc: admission.Overloaded):
+    # Admission control từ chối request nặng (xem admission.py)
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
 # ====== 2. Định nghĩa bảo mật JWT với OAuth2 ======
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 # ====== 3. API Đăng nhập (login, trả về access token) ======
+def _find_user(username):
+    # Replica, trừ khi user này vừa đổi mật khẩu/được tạo (read-your-writes)
+    with read_connection(username) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
+            return cursor.fetchone()
+
 @app.post("/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     username = form_data.username
     password = form_data.password
 
-    conn = get_connection()
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
-        user = cursor.fetchone()
-    conn.close()
+    user = await run_db(_find_user, username)
 
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
@@ -77,10 +202,18 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 
 # ====== 4. Middleware: Lấy thông tin user từ token (và kiểm tra hạn token) ======
 def get_current_user(token: str = Depends(oauth2_scheme)):
+    return _decode_token(token)
+
+def _decode_token(token):
+    # Token đã verify trước đó (và chưa tới exp) thì không cần decode lại
+    payload = auth_cache.tokens.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         if not all(key in payload for key in ["user_id", "username", "role"]):
             raise HTTPException(status_code=401, detail="Invalid token format")
+        auth_cache.tokens.put(token, payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -92,9 +225,11 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
 # ====== 5. API Xem danh sách user (READ, phân quyền cấp bậc) ======
 @app.get("/users", summary="Danh sách user theo phân quyền")
 async def get_users(user: dict = Depends(get_current_user)):
+    return await run_db(_fetch_users, user)
+
+def _fetch_users(user):
     try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
+        with read_connection(user["username"]) as conn, conn.cursor() as cursor:
             if user["role"] == "admin":
                 # Admin lấy toàn bộ user hệ thống
                 cursor.execute("SELECT * FROM users ORDER BY user_id")
@@ -114,8 +249,6 @@ async def get_users(user: dict = Depends(get_current_user)):
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
 
 # ====== 6. API Tạo user mới (CREATE - chỉ dành cho admin) ======
 class UserCreate(BaseModel):
@@ -149,8 +282,13 @@ async def create_user(
         raise HTTPException(status_code=400, detail="Role không hợp lệ")
 
     password_hash = hashlib.sha256(user_data.password.encode()).hexdigest()
-    conn = get_connection()
-    with conn.cursor() as cursor:
+    await run_db(_insert_user, user_data, password_hash)
+    # Admin thấy ngay user mới trong /users, user mới đăng nhập được ngay
+    note_write(user["username"], user_data.username)
+    return {"msg": "User created successfully"}
+
+def _insert_user(user_data, password_hash):
+    with db_connection() as conn, conn.cursor() as cursor:
         try:
             # Sửa lỗi: Thêm user_id là AUTO_INCREMENT, không truyền vào INSERT
             cursor.execute(
@@ -161,8 +299,6 @@ async def create_user(
         except Exception as e:
             conn.rollback()
             raise HTTPException(status_code=400, detail=f"Error: {e}")
-    conn.close()
-    return {"msg": "User created successfully"}
 
 # ====== 7. API Xóa user (DELETE - chỉ dành cho admin) ======
 @app.delete("/users/{user_id}", summary="Admin xóa user")
@@ -172,12 +308,17 @@ async def delete_user(
 ):
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Only admin can delete user")
-    conn = get_connection()
-    with conn.cursor() as cursor:
+    deleted = await run_db(_delete_user, user_id)
+    note_write(user["username"], deleted)
+    return {"msg": "User deleted successfully"}
+
+def _delete_user(user_id):
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT username FROM users WHERE user_id=%s", (user_id,))
+        row = cursor.fetchone()
         cursor.execute("DELETE FROM users WHERE user_id=%s", (user_id,))
         conn.commit()
-    conn.close()
-    return {"msg": "User deleted successfully"}
+        return row["username"] if row else None
 
 # ====== 8. API Đổi mật khẩu (ai cũng được quyền đổi mật khẩu chính mình) ======
 class ChangePasswordRequest(BaseModel):
@@ -189,8 +330,12 @@ async def change_password(
     req: ChangePasswordRequest,
     user: dict = Depends(get_current_user)
 ):
-    conn = get_connection()
-    with conn.cursor() as cursor:
+    await run_db(_change_password, user, req)
+    note_write(user["username"])
+    return {"msg": "Password changed successfully"}
+
+def _change_password(user, req):
+    with db_connection() as conn, conn.cursor() as cursor:
         cursor.execute("SELECT password_hash FROM users WHERE user_id=%s", (user["user_id"],))
         row = cursor.fetchone()
         if not row:
@@ -203,75 +348,97 @@ async def change_password(
         new_hash = hashlib.sha256(req.new_password.encode()).hexdigest()
         cursor.execute("UPDATE users SET password_hash=%s WHERE user_id=%s", (new_hash, user["user_id"]))
         conn.commit()
-    conn.close()
-    return {"msg": "Password changed successfully"}
 
 # ====== 9. API Xem báo cáo (READ ONLY, phân trang, phân quyền) ======
+def _json_bytes(result):
+    # compute() có thể trả sẵn bytes JSON (/reports) hoặc dict
+    if isinstance(result, bytes):
+        return result
+    with metrics.stage("serialize"):
+        return orjson.dumps(jsonable_encoder(result))
+
+def _data_version():
+    # Phiên bản của nguồn job export đọc (replica DuckDB hoặc MySQL)
+    with replica.report_connection() as conn:
+        return cache.data_version(conn)
+
+def _cached_body(name, user, params, compute, connect=replica.report_connection):
+    # Response JSON (bytes) theo phiên bản dữ liệu hiện tại, tính lại nếu cache chưa có
+    # (compute=None: chỉ đọc cache, None nếu chưa có)
+    if not cache.CACHE_ENABLED:
+        return _json_bytes(compute()) if compute else None
+    # compute mở connection bằng connect (report_connection/read_connection) và nhận lại đúng
+    # connection đã đọc phiên bản (pinned): read replica trễ không lưu dữ liệu cũ dưới phiên bản mới
+    with connect() as conn, pinned(conn):
+        key = cache.make_key(cache.data_version(conn), name, user, params)
+        body = cache.backend.get(key)
+        if body is None and compute:
+            body = _json_bytes(compute())
+            cache.backend.set(key, body)
+    return body
+
+async def _cached_response(name, user, params, if_none_match, compute, media_type="application/json",
+                           vary="Authorization", cost=0, connect=replica.report_connection):
+    """Đọc qua cache; trả 304 (không body) nếu ETag client gửi lên vẫn khớp.
+
+    cost: chi phí ước lượng (admission.estimate); request nặng chỉ qua admission control
+    khi cache chưa có kết quả. connect: nguồn compute đọc (phiên bản đọc trên cùng connection).
+    """
+    heavy = not admission.controller.is_small(cost)
+    body = None
+    if not heavy or cache.CACHE_ENABLED:
+        body = await run_db(_cached_body, name, user, params, None if heavy else compute, connect)
+    if body is None:
+        async with admission.controller.admit(user, cost):
+            body = await run_db(_cached_body, name, user, params, compute, connect)
+    tag = cache.etag(body)
+    # private: response phụ thuộc user (Authorization); no-cache: luôn kiểm tra lại bằng ETag
+    headers = {"ETag": tag, "Cache-Control": "private, no-cache", "Vary": vary}
+    if cache.etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
 @app.get("/reports", summary="Xem báo cáo theo phân quyền, có phân trang")
 async def get_reports(
     user: dict = Depends(get_current_user),
     limit: int = Query(1000, ge=1, le=10000),
     offset: int = Query(0, ge=0),
-    all: bool = Query(False)
+    all: bool = Query(False),
+    cursor: str = Query(None, description="Token next_cursor của trang trước (phân trang keyset, bỏ qua offset)"),
+    format: str = Query(None, description="rows (mặc định), columnar hoặc arrow; không có thì theo header Accept"),
+    accept: str = Header(None),
+    if_none_match: str = Header(None)
 ):
+    fmt = report_rows.negotiate(accept, format)
+    if fmt is None:
+        raise HTTPException(status_code=406, detail="Định dạng hỗ trợ: " + ", ".join(
+            media for name, media in report_rows.MEDIA_TYPES.items()
+            if name != "arrow" or report_rows.ARROW_AVAILABLE))
+    after = None
+    if cursor:
+        try:
+            after = report_queries.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    params = {"limit": limit, "offset": offset, "cursor": cursor, "format": fmt}
+    # Trang theo offset phải đọc bỏ qua offset dòng; keyset chỉ đọc limit dòng
+    cost = admission.estimate(user, rows=limit + (0 if after else offset), weight=0)
+    return await _cached_response(
+        "reports", user, params, if_none_match, partial(_query_reports, user, limit, offset, after, fmt),
+        media_type=report_rows.MEDIA_TYPES[fmt], vary="Authorization, Accept", cost=cost,
+        connect=read_connection
+    )
+
+def _query_reports(user, limit, offset, after=None, fmt="rows"):
+    started = time.perf_counter()
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        # Chỉ lấy các cột cần thiết, không lặp cột
-        base_columns = """
-            r.id, r.ward_id, r.city_id, r.date, r.procedure, r.count, r.age_group, r.gender, r.domain, r.auth_type, r.print_time, w.ward_name
-        """
-        if user["role"] == "admin":
-            sql = f"""
-                SELECT {base_columns}
-                FROM reports r
-                LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                WHERE r.print_time BETWEEN 7 AND 17
-                ORDER BY r.date DESC, r.print_time ASC
-                LIMIT %s OFFSET %s
-            """
-            params = (limit, offset)
-        elif user["role"] == "city":
-            sql = f"""
-                SELECT {base_columns}
-                FROM reports r
-                LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                WHERE r.city_id = %s 
-                AND r.print_time BETWEEN 7 AND 17
-                ORDER BY r.date DESC, r.print_time ASC
-                LIMIT %s OFFSET %s
-            """
-            params = (user['city_id'], limit, offset)
-        else:
-            sql = f"""
-                SELECT {base_columns}
-                FROM reports r
-                LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                WHERE r.ward_id = %s 
-                AND r.print_time BETWEEN 7 AND 17
-                ORDER BY r.date DESC, r.print_time ASC
-                LIMIT %s OFFSET %s
-            """
-            params = (user['ward_id'], limit, offset)
-        cursor.execute(sql, params)
-        data = cursor.fetchall()
-        processed_data = []
-        for row in data:
-            if row:
-                processed_row = dict(row)
-                processed_row['hour'] = int(processed_row.get('print_time', 0))
-                if processed_row.get('date'):
-                    processed_row['date'] = processed_row['date'].strftime('%Y-%m-%d') if hasattr(processed_row['date'], 'strftime') else processed_row['date']
-                if 'gender' not in processed_row:
-                    processed_row['gender'] = None
-                processed_data.append(processed_row)
-        final_response = {
-            "success": True,
-            "data": processed_data,
-            "total": len(processed_data)
-        }
-        print("Reports API response:", final_response)
-        return final_response
+        with read_connection() as conn:
+            sql, params = report_queries.list_reports_query(user, limit, offset, after=after)
+            columns, rows = report_rows.fetch(conn, sql, params)
+        with metrics.stage("serialize"):
+            body = report_rows.render(fmt, columns, rows, limit)
+        print(f"Reports API: {len(rows)} rows ({fmt}), {len(body)} bytes, {(time.perf_counter() - started) * 1000:.1f} ms")
+        return body
     except Exception as e:
         print(f"Database error: {str(e)}")
         raise HTTPException(
@@ -283,298 +450,474 @@ async def get_reports(
 @app.get("/reports/export", summary="Xuất báo cáo (Excel/CSV) theo phân quyền")
 async def export_reports(
     user: dict = Depends(get_current_user),
-    limit: int = Query(10000, ge=1, le=10000),
+    limit: int = Query(10000, ge=1),
     offset: int = Query(0, ge=0),
     group_by: str = Query("Ngày"),
     start_date: str = Query(None),
     end_date: str = Query(None),
     ward_id: int = Query(None),
-    format: str = Query("xlsx")
+    format: str = Query("xlsx"),
+    stream: bool = Query(False)
 ):
+    # Admin export không có ward_id quét toàn bộ bảng reports: giới hạn qua admission control
+    cost = admission.estimate(user, ward_id, *_export_dates(start_date, end_date), rows=limit)
+    async with admission.controller.admit(user, cost):
+        # Truy vấn + pandas + ghi file chạy trên export_executor riêng
+        return await run_export(
+            _build_export, user, limit, offset, group_by, start_date, end_date, ward_id, format, stream
+        )
+
+def _file_response(file_path, media_type, filename):
+    # Xoá file tạm sau khi đã gửi xong cho client
+    return FileResponse(
+        file_path,
+        media_type=media_type,
+        filename=filename,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+        background=BackgroundTask(os.remove, file_path)
+    )
+
+def _check_ward_access(user, ward_id):
+    if user["role"] == "city" and ward_id is not None and ward_id > 0:
+        # City user muốn export báo cáo của ward cụ thể trong city của mình
+        # Kiểm tra ward có thuộc city không (bản đồ ward -> city trong bộ nhớ)
+        try:
+            ward_city_id = auth_cache.wards.city_of(ward_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Ward {ward_id} không tồn tại")
+
+        if ward_city_id != user['city_id']:
+            raise HTTPException(status_code=403, detail=f"Ward {ward_id} không thuộc city {user['city_id']} của bạn")
+
+def _export_dates(start_date, end_date):
+    # Export chỉ lọc theo ngày khi có đủ cả hai mốc
+    return (start_date, end_date) if start_date and end_date else (None, None)
+
+def _build_export(user, limit, offset, group_by, start_date, end_date, ward_id, format, stream=False):
+    # pandas chỉ được nạp ở export đầu tiên (hoặc khi preload, xem gunicorn.conf.py)
+    import pandas as pd
+
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        base_columns = """
-            r.id, r.ward_id, r.city_id, r.date, r.procedure, r.count, r.age_group, r.gender, r.domain, r.auth_type, r.print_time, w.ward_name
-        """
-        
-        print(f"Export request - User role: {user['role']}, ward_id param: {ward_id}, user ward_id: {user.get('ward_id')}, user city_id: {user.get('city_id')}")
-        
-        # Xử lý logic phân quyền
-        if user["role"] == "admin":
-            if ward_id is not None:
-                # Admin muốn export báo cáo của ward cụ thể
-                sql = f"""
-                    SELECT {base_columns}
-                    FROM reports r
-                    LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                    WHERE r.ward_id = %s AND r.print_time BETWEEN 7 AND 17
-                """
-                params = [ward_id]
-                print(f"Admin exporting for ward_id: {ward_id}")
-            else:
-                # Admin export toàn bộ
-                sql = f"""
-                    SELECT {base_columns}
-                    FROM reports r
-                    LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                    WHERE r.print_time BETWEEN 7 AND 17
-                """
-                params = []
-                print("Admin exporting all data")
-                
-        elif user["role"] == "city":
-            if ward_id is not None and ward_id > 0:
-                # City user muốn export báo cáo của ward cụ thể trong city của mình
-                # Kiểm tra ward có thuộc city không
-                cursor.execute("SELECT city_id FROM wards WHERE ward_id = %s", (ward_id,))
-                ward_info = cursor.fetchone()
-                
-                if not ward_info:
-                    raise HTTPException(status_code=404, detail=f"Ward {ward_id} không tồn tại")
-                
-                if ward_info['city_id'] != user['city_id']:
-                    raise HTTPException(status_code=403, detail=f"Ward {ward_id} không thuộc city {user['city_id']} của bạn")
-                
-                sql = f"""
-                    SELECT {base_columns}
-                    FROM reports r
-                    LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                    WHERE r.ward_id = %s AND r.city_id = %s AND r.print_time BETWEEN 7 AND 17
-                """
-                params = [ward_id, user['city_id']]
-                print(f"✅ City user exporting for ward_id: {ward_id} in city: {user['city_id']}")
+        # Replica DuckDB (nếu bật) đã có cả dữ liệu archive và các view rollup
+        with replica.report_connection() as conn:
+            on_replica = replica.is_replica(conn)
+            cursor = conn.cursor()
+
+            # Xử lý logic phân quyền
+            _check_ward_access(user, ward_id)
+
+            # Thêm lọc theo ngày nếu có (chỉ khi có đủ cả hai mốc)
+            dates = _export_dates(start_date, end_date)
+            sql, params = report_queries.list_reports_query(user, limit, offset, ward_id, *dates)
+
+            # Export lớn: đọc bằng cursor không buffer và ghi thẳng ra file, không dựng DataFrame
+            # Khoảng ngày đã archive: đọc tiếp từ file Parquet sau khi hết dòng trong MySQL
+            if stream or limit > export_stream.BUFFERED_EXPORT_LIMIT:
+                cursor.close()
+                tail = None if on_replica else partial(
+                    archive.tail, conn, user, limit, offset, ward_id, *dates, as_dicts=True)
+                with metrics.stage("export_stream"):
+                    exported = export_stream.export_to_file(conn, sql, params, group_by, format, tail=tail)
+                return _file_response(*exported)
+
+            columns, data = report_rows.fetch(conn, sql, params)
+            archived = [] if on_replica else [
+                row for batch in archive.tail(conn, user, limit, offset, ward_id, *dates, len(data)) for row in batch
+            ]
+            if archived:
+                print(f"Export: {len(archived)} rows from archive")
+                data = list(data) + archived
+
+            # Dựng DataFrame thẳng từ tuple (theo cột), không tạo dict cho từng dòng
+            pandas_started = time.perf_counter()
+            df_data = report_rows.export_frame(columns, data)
+            # --- Chuẩn bị các bảng dữ liệu cho từng sheet ---
+            # Xử lý trùng cột: chỉ giữ lại các cột gốc, loại bỏ cột bắt đầu bằng "r."
+            if not df_data.empty:
+                # Loại bỏ các cột bắt đầu bằng "r."
+                df_data = df_data.loc[:, ~df_data.columns.str.startswith('r.')]
+                # Nếu có các cột trùng tên (ví dụ: 'domain' và '.domain'), chỉ giữ lại 'domain'
+                for col in df_data.columns:
+                    if col.startswith('.'):
+                        base_col = col[1:]
+                        if base_col in df_data.columns:
+                            df_data = df_data.drop(columns=[col])
+                        else:
+                            df_data = df_data.rename(columns={col: base_col})
+            # Các bảng tổng hợp (Số lượt in, Lĩnh vực, Top thủ tục, In theo giờ, Tuổi & Giới tính, Xác thực)
+            so_luot_in = linh_vuc = top_thu_tuc = in_theo_gio = tuoi_gioitinh = xac_thuc = pd.DataFrame()
+            if not df_data.empty:
+                if group_by == "Tuần":
+                    df_data['week'] = pd.to_datetime(df_data['date'], format='%Y-%m-%d').dt.strftime('%G-[W]%V')
+                counts = None
+                # Truy vấn không bị cắt bởi limit/offset thì đọc số đếm từ rollup (nếu rollup đã có
+                # mọi dòng của khoảng ngày); DataFrame đã gồm cả dòng archive nên hai cách cho cùng kết quả.
+                # Rollup không có dòng thiếu ngày, các dòng đó chỉ đếm được từ DataFrame
+                if (offset == 0 and len(data) < limit and df_data['date'].notna().all()
+                        and (on_replica or rollup.covers(cursor, user, ward_id, *dates))):
+                    rollup_where, rollup_params = report_queries.report_filter(
+                        user, ward_id, *dates, business_hours=False
+                    )
+                    counts = rollup.export_counts(cursor, rollup_where, rollup_params)
+                    print("Export: summary sheets from rollup")
+                if counts is None:
+                    counts = export_sheets.counts_from_frame(df_data)
+                sheets = export_sheets.build_sheets(counts, group_by)
+                so_luot_in = sheets['so_luot_in']
+                linh_vuc = sheets['linh_vuc']
+                top_thu_tuc = sheets['top_thu_tuc']
+                in_theo_gio = sheets['in_theo_gio']
+                tuoi_gioitinh = sheets['tuoi_gioitinh']
+                xac_thuc = sheets['xac_thuc']
+
+            # Thời gian pandas (gồm cả đọc số đếm từ rollup nếu có)
+            metrics.observe_stage("pandas", time.perf_counter() - pandas_started)
+
+            # Đảm bảo các bảng không bị lỗi khi rỗng
+            if df_data is None or not isinstance(df_data, pd.DataFrame):
+                df_data = pd.DataFrame()
+            if 'so_luot_in' not in locals() or so_luot_in is None:
+                so_luot_in = pd.DataFrame()
+            if 'linh_vuc' not in locals() or linh_vuc is None:
+                linh_vuc = pd.DataFrame()
+            if 'top_thu_tuc' not in locals() or top_thu_tuc is None:
+                top_thu_tuc = pd.DataFrame()
+            if 'in_theo_gio' not in locals() or in_theo_gio is None:
+                in_theo_gio = pd.DataFrame()
+            if 'tuoi_gioitinh' not in locals() or tuoi_gioitinh is None:
+                tuoi_gioitinh = pd.DataFrame()
+            if 'xac_thuc' not in locals() or xac_thuc is None:
+                xac_thuc = pd.DataFrame()
+
+            # Nếu không có dữ liệu, trả về file rỗng
+            if df_data.empty:
+                print("Export: Không có dữ liệu báo cáo, trả về file rỗng.")
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
+                    file_path = tmp.name
+                    with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
+                        pd.DataFrame().to_excel(writer, sheet_name='Data', index=False)
+                return _file_response(file_path, export_stream.XLSX_MEDIA_TYPE, "dashboard_inphieu.xlsx")
+
+            if format == "csv":
+                # --- Ghi file ZIP chứa nhiều file CSV (từ bộ nhớ, không tạo file trong thư mục làm việc) ---
+                sheets = {
+                    'so_luot_in': so_luot_in, 'linh_vuc': linh_vuc, 'top_thu_tuc': top_thu_tuc,
+                    'in_theo_gio': in_theo_gio, 'tuoi_gioitinh': tuoi_gioitinh, 'xac_thuc': xac_thuc,
+                }
+                with metrics.stage("export_write"):
+                    zip_path = export_stream.frames_to_csv_zip(df_data, sheets)
+                return _file_response(zip_path, export_stream.ZIP_MEDIA_TYPE, "dashboard_inphieu.zip")
             else:
-                # City user export toàn bộ city
-                sql = f"""
-                    SELECT {base_columns}
-                    FROM reports r
-                    LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                    WHERE r.city_id = %s AND r.print_time BETWEEN 7 AND 17
-                """
-                params = [user['city_id']]
-                print(f"✅ City user exporting all data for city: {user['city_id']}")
-                
-        else:  # ward role
-            # Ward user chỉ được export dữ liệu của ward mình
-            sql = f"""
-                SELECT {base_columns}
-                FROM reports r
-                LEFT JOIN wards w ON r.ward_id = w.ward_id 
-                WHERE r.ward_id = %s AND r.print_time BETWEEN 7 AND 17
-            """
-            params = [user['ward_id']]
-            print(f"Ward user exporting for own ward: {user['ward_id']}")
-
-        # Thêm lọc theo ngày nếu có
-        if start_date and end_date:
-            sql += " AND DATE(r.date) >= %s AND DATE(r.date) <= %s"
-            params.extend([start_date, end_date])
-            
-        sql += " ORDER BY r.date DESC, r.print_time ASC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
-
-        print(f"Final SQL: {sql}")
-        print(f"Final params: {params}")
-
-        cursor.execute(sql, tuple(params))
-        data = cursor.fetchall()
-        print(f"Query returned {len(data)} rows")
-
-        # Sửa lỗi 500: phải tạo processed_data từ data trước khi tạo DataFrame
-        processed_data = []
-        for row in data:
-            if row:
-                processed_row = dict(row)
-                processed_row['hour'] = int(processed_row.get('print_time', 0)) if processed_row.get('print_time') is not None else None
-                if processed_row.get('date'):
-                    processed_row['date'] = processed_row['date'].strftime('%Y-%m-%d') if hasattr(processed_row['date'], 'strftime') else processed_row['date']
-                if 'gender' not in processed_row:
-                    processed_row['gender'] = None
-                processed_data.append(processed_row)
-
-        df_data = pd.DataFrame(processed_data)
-        # --- Chuẩn bị các bảng dữ liệu cho từng sheet ---
-        # Xử lý trùng cột: chỉ giữ lại các cột gốc, loại bỏ cột bắt đầu bằng "r."
-        if not df_data.empty:
-            # Loại bỏ các cột bắt đầu bằng "r."
-            df_data = df_data.loc[:, ~df_data.columns.str.startswith('r.')]
-            # Nếu có các cột trùng tên (ví dụ: 'domain' và '.domain'), chỉ giữ lại 'domain'
-            for col in df_data.columns:
-                if col.startswith('.'):
-                    base_col = col[1:]
-                    if base_col in df_data.columns:
-                        df_data = df_data.drop(columns=[col])
-                    else:
-                        df_data = df_data.rename(columns={col: base_col})
-        # Số lượt in theo ngày/tuần
-        if not df_data.empty:
-            if group_by == "Tuần":
-                df_data['week'] = pd.to_datetime(df_data['date']).dt.strftime('%G-[W]%V')
-                so_luot_in = df_data.groupby('week').size().reset_index(name='Số lượt in')
-                so_luot_in['Từ'] = pd.to_datetime(so_luot_in['week'].str[:4] + '-W' + so_luot_in['week'].str[-2:] + '-1', errors='coerce').dt.strftime('%d/%m')
-                so_luot_in['Đến'] = pd.to_datetime(so_luot_in['week'].str[:4] + '-W' + so_luot_in['week'].str[-2:] + '-7', errors='coerce').dt.strftime('%d/%m')
-                so_luot_in = so_luot_in.rename(columns={'week': 'Tuần'})
-                so_luot_in = so_luot_in[['Tuần', 'Từ', 'Đến', 'Số lượt in']]
+                # --- Ghi file Excel nhiều sheet như cũ ---
+                with metrics.stage("export_write"), tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
+                    file_path = tmp.name
+                    with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
+                        df_data.to_excel(writer, sheet_name='Data', index=False)
+                        so_luot_in.to_excel(writer, sheet_name='Số lượt in', index=False)
+                        linh_vuc.to_excel(writer, sheet_name='Lĩnh vực', index=False)
+                        top_thu_tuc.to_excel(writer, sheet_name='Top thủ tục', index=False)
+                        in_theo_gio.to_excel(writer, sheet_name='In theo giờ', index=False)
+                        tuoi_gioitinh.to_excel(writer, sheet_name='Tuổi & Giới tính', index=False)
+                        xac_thuc.to_excel(writer, sheet_name='Xác thực', index=False)
+                return _file_response(file_path, export_stream.XLSX_MEDIA_TYPE, "dashboard_inphieu.xlsx")
+    except Exception as e:
+        print(f"Export error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Export báo cáo thất bại")
+
+# ====== 11. API Tổng hợp báo cáo cho dashboard (GROUP BY trên server) ======
+def _query_summary(user, names, ward_id, start_date, end_date, group_by, top_k):
+    if user["role"] not in ("admin", "city", "ward"):
+        raise HTTPException(status_code=403, detail="Invalid role")
+    try:
+        with replica.report_connection() as conn, conn.cursor() as cursor:
+            # Replica DuckDB: GROUP BY trực tiếp. MySQL: rollup cho các ngày rollup đã có đủ
+            # dòng, bảng gốc cho phần còn lại của khoảng ngày (rollup.source_for)
+            if replica.is_replica(conn):
+                source = replica.SOURCE
             else:
-                so_luot_in = df_data.groupby('date').size().reset_index(name='Số lượt in')
-                so_luot_in = so_luot_in.rename(columns={'date': 'Ngày'})
-        else:
-            so_luot_in = pd.DataFrame()
-
-        # Lĩnh vực
-        if not df_data.empty and 'domain' in df_data.columns:
-            linh_vuc = df_data.groupby('domain').size().reset_index(name='Tần suất')
-            linh_vuc = linh_vuc.rename(columns={'domain': 'Lĩnh vực'})
-        else:
-            linh_vuc = pd.DataFrame()
-
-        # Top thủ tục
-        if not df_data.empty and 'procedure' in df_data.columns:
-            top_thu_tuc = df_data.groupby('procedure').size().reset_index(name='Tần suất')
-            top_thu_tuc = top_thu_tuc.rename(columns={'procedure': 'Tên thủ tục'})
-            top_thu_tuc = top_thu_tuc.sort_values('Tần suất', ascending=False).head(8)
-        else:
-            top_thu_tuc = pd.DataFrame()
-
-        # In theo giờ
-        if not df_data.empty and 'hour' in df_data.columns:
-            in_theo_gio = df_data.groupby('hour').agg(
-                Trung_binh=('hour', 'count'),
-                Tong_so_luot=('hour', 'size'),
-                So_ngay_co_in=('date', pd.Series.nunique)
-            ).reset_index().rename(columns={
-                'hour': 'Giờ',
-                'Trung_binh': 'Trung bình',
-                'Tong_so_luot': 'Tổng số lượt',
-                'So_ngay_co_in': 'Số ngày có in'
-            })
-        else:
-            in_theo_gio = pd.DataFrame()
-
-        # Tuổi & Giới tính
-        if not df_data.empty and 'age_group' in df_data.columns and 'gender' in df_data.columns:
-            tuoi_gioitinh = df_data.groupby(['age_group', 'gender']).size().unstack(fill_value=0)
-            tuoi_gioitinh['Tổng'] = tuoi_gioitinh.sum(axis=1)
-            tuoi_gioitinh = tuoi_gioitinh.reset_index().rename(columns={'age_group': 'Nhóm tuổi', 'male': 'Nam', 'female': 'Nữ', 'nam': 'Nam', 'nữ': 'Nữ', 'nu': 'Nữ'})
-        else:
-            tuoi_gioitinh = pd.DataFrame()
-
-        # Xác thực
-        if not df_data.empty and 'auth_type' in df_data.columns:
-            xac_thuc = df_data.groupby('auth_type').size().reset_index(name='Số lượng')
-            xac_thuc['Tỷ lệ (%)'] = (xac_thuc['Số lượng'] / xac_thuc['Số lượng'].sum() * 100).round(1)
-            xac_thuc = xac_thuc.rename(columns={'auth_type': 'Loại xác thực'})
-        else:
-            xac_thuc = pd.DataFrame()
-
-        # Debug: log số lượng dòng từng bảng
-        print("Export: df_data rows:", len(df_data))
-        print("Export: processed_data rows:", len(processed_data))
-
-        # Đảm bảo các bảng không bị lỗi khi rỗng
-        if df_data is None or not isinstance(df_data, pd.DataFrame):
-            df_data = pd.DataFrame()
-        if 'so_luot_in' not in locals() or so_luot_in is None:
-            so_luot_in = pd.DataFrame()
-        if 'linh_vuc' not in locals() or linh_vuc is None:
-            linh_vuc = pd.DataFrame()
-        if 'top_thu_tuc' not in locals() or top_thu_tuc is None:
-            top_thu_tuc = pd.DataFrame()
-        if 'in_theo_gio' not in locals() or in_theo_gio is None:
-            in_theo_gio = pd.DataFrame()
-        if 'tuoi_gioitinh' not in locals() or tuoi_gioitinh is None:
-            tuoi_gioitinh = pd.DataFrame()
-        if 'xac_thuc' not in locals() or xac_thuc is None:
-            xac_thuc = pd.DataFrame()
-
-        # Nếu không có dữ liệu, trả về file rỗng
-        if df_data.empty:
-            print("Export: Không có dữ liệu báo cáo, trả về file rỗng.")
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-                file_path = tmp.name
-                with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-                    pd.DataFrame().to_excel(writer, sheet_name='Data', index=False)
-            filename = "dashboard_inphieu.xlsx"
-            return FileResponse(
-                file_path,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                filename=filename,
-                headers={"Content-Disposition": f"attachment; filename={filename}"}
+                source = rollup.source_for(cursor, user, ward_id, start_date, end_date)
+            where, params = report_queries.report_filter(
+                user, ward_id, start_date, end_date, business_hours=source.business_hours
             )
+            data = report_queries.run_summaries(cursor, where, params, names, group_by, top_k, source)
+        return {"success": True, "data": data}
+    except Exception as e:
+        print(f"Summary error: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail={"success": False, "message": "Lỗi khi tổng hợp dữ liệu"}
+        )
 
-        if format == "csv":
-            # --- Ghi file ZIP chứa nhiều file CSV ---
-            # Đảm bảo import tempfile ở đầu file, KHÔNG import lại trong block này
-            import os
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp_zip:
-                with zipfile.ZipFile(tmp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    # Data sheet
-                    df_data.to_csv("data.csv", index=False)
-                    zipf.write("data.csv")
-                    os.remove("data.csv")
-                    # Số lượt in
-                    so_luot_in.to_csv("so_luot_in.csv", index=False)
-                    zipf.write("so_luot_in.csv")
-                    os.remove("so_luot_in.csv")
-                    # Lĩnh vực
-                    linh_vuc.to_csv("linh_vuc.csv", index=False)
-                    zipf.write("linh_vuc.csv")
-                    os.remove("linh_vuc.csv")
-                    # Top thủ tục
-                    top_thu_tuc.to_csv("top_thu_tuc.csv", index=False)
-                    zipf.write("top_thu_tuc.csv")
-                    os.remove("top_thu_tuc.csv")
-                    # In theo giờ
-                    in_theo_gio.to_csv("in_theo_gio.csv", index=False)
-                    zipf.write("in_theo_gio.csv")
-                    os.remove("in_theo_gio.csv")
-                    # Tuổi & Giới tính
-                    if not tuoi_gioitinh.empty:
-                        tuoi_gioitinh.to_csv("tuoi_gioitinh.csv", index=False)
-                        zipf.write("tuoi_gioitinh.csv")
-                        os.remove("tuoi_gioitinh.csv")
-                    # Xác thực
-                    if not xac_thuc.empty:
-                        xac_thuc.to_csv("xac_thuc.csv", index=False)
-                        zipf.write("xac_thuc.csv")
-                        os.remove("xac_thuc.csv")
-                filename = "dashboard_inphieu.zip"
-                return FileResponse(
-                    tmp_zip.name,
-                    media_type="application/zip",
-                    filename=filename,
-                    headers={"Content-Disposition": f"attachment; filename={filename}"}
-                )
-        else:
-            # --- Ghi file Excel nhiều sheet như cũ ---
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-                file_path = tmp.name
-                with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-                    df_data.to_excel(writer, sheet_name='Data', index=False)
-                    so_luot_in.to_excel(writer, sheet_name='Số lượt in', index=False)
-                    linh_vuc.to_excel(writer, sheet_name='Lĩnh vực', index=False)
-                    top_thu_tuc.to_excel(writer, sheet_name='Top thủ tục', index=False)
-                    in_theo_gio.to_excel(writer, sheet_name='In theo giờ', index=False)
-                    tuoi_gioitinh.to_excel(writer, sheet_name='Tuổi & Giới tính', index=False)
-                    xac_thuc.to_excel(writer, sheet_name='Xác thực', index=False)
-            filename = "dashboard_inphieu.xlsx"
-            return FileResponse(
-                file_path,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                filename=filename,
-                headers={"Content-Disposition": f"attachment; filename={filename}"}
-            )
+@app.get("/reports/summary", summary="Tổng hợp toàn bộ số liệu dashboard theo phân quyền")
+async def get_reports_summary(
+    user: dict = Depends(get_current_user),
+    ward_id: int = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    group_by: str = Query("Ngày"),
+    top_k: int = Query(8, ge=1, le=100),
+    include: str = Query(None, description="Danh sách phân cách bởi dấu phẩy, mặc định lấy tất cả"),
+    if_none_match: str = Header(None)
+):
+    names = [n.strip() for n in include.split(",") if n.strip()] if include else list(report_queries.SUMMARIES)
+    unknown = [n for n in names if n not in report_queries.SUMMARIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Không hỗ trợ: {', '.join(unknown)}")
+    params = {"names": names, "ward_id": ward_id, "start_date": start_date, "end_date": end_date,
+              "group_by": group_by, "top_k": top_k}
+    return await _cached_response(
+        "summary", user, params, if_none_match,
+        partial(_query_summary, user, names, ward_id, start_date, end_date, group_by, top_k),
+        cost=admission.estimate(user, ward_id, start_date, end_date, weight=admission.AGGREGATE_WEIGHT)
+    )
+
+@app.get("/reports/summary/{name}", summary="Một bảng tổng hợp dashboard theo phân quyền")
+async def get_reports_summary_item(
+    name: str,
+    user: dict = Depends(get_current_user),
+    ward_id: int = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    group_by: str = Query("Ngày"),
+    top_k: int = Query(8, ge=1, le=100),
+    if_none_match: str = Header(None)
+):
+    if name not in report_queries.SUMMARIES:
+        raise HTTPException(status_code=404, detail=f"Không có bảng tổng hợp '{name}'")
+
+    def compute():
+        result = _query_summary(user, [name], ward_id, start_date, end_date, group_by, top_k)
+        return {"success": True, "data": result["data"][name]}
+
+    params = {"name": name, "ward_id": ward_id, "start_date": start_date, "end_date": end_date,
+              "group_by": group_by, "top_k": top_k}
+    cost = admission.estimate(user, ward_id, start_date, end_date,
+                              weight=admission.AGGREGATE_WEIGHT / len(report_queries.SUMMARIES))
+    return await _cached_response("summary-item", user, params, if_none_match, compute, cost=cost)
+
+def _query_distribution(user, by, ward_id, start_date, end_date):
+    if user["role"] not in ("admin", "city", "ward"):
+        raise HTTPException(status_code=403, detail="Invalid role")
+    try:
+        with replica.report_connection() as conn, conn.cursor() as cursor:
+            # Sketch chỉ có trên MySQL và chỉ dùng khi rollup phủ cả khoảng ngày và sketch đã
+            # theo kịp rollup; ngược lại đọc mẫu chính xác từ nguồn tổng hợp như /reports/summary
+            if replica.is_replica(conn):
+                source, use_sketches = replica.SOURCE, False
+            else:
+                source = rollup.source_for(cursor, user, ward_id, start_date, end_date)
+                use_sketches = source is rollup.ROLLUP and distributions.is_current(cursor)
+            data = distributions.query(cursor, user, by, ward_id, start_date, end_date, source, use_sketches)
+        return {"success": True, "data": data}
     except Exception as e:
-        print(f"Export error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Export báo cáo thất bại")
-    finally:
+        print(f"Distribution error: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail={"success": False, "message": "Lỗi khi tổng hợp dữ liệu"}
+        )
+
+@app.get("/reports/distribution", summary="Phân phối số lượt in theo ngày (box plot) theo ward hoặc giờ")
+async def get_reports_distribution(
+    user: dict = Depends(get_current_user),
+    by: str = Query("ward", description="ward: phân phối theo ngày của từng ward; hour: theo ward × ngày của từng giờ"),
+    ward_id: int = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    if_none_match: str = Header(None)
+):
+    if by not in distributions.BY:
+        raise HTTPException(status_code=400, detail=f"Không hỗ trợ: {by} (có: {', '.join(distributions.BY)})")
+    for value in (start_date, end_date):
+        try:
+            if value:
+                datetime.date.fromisoformat(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Ngày không hợp lệ: {value}")
+    params = {"by": by, "ward_id": ward_id, "start_date": start_date, "end_date": end_date}
+    return await _cached_response(
+        "distribution", user, params, if_none_match,
+        partial(_query_distribution, user, by, ward_id, start_date, end_date),
+        cost=admission.estimate(user, ward_id, start_date, end_date, weight=admission.AGGREGATE_WEIGHT)
+    )
+
+# ====== 12. API Export bất đồng bộ (job) ======
+@app.post("/reports/export/jobs", status_code=202, summary="Tạo job xuất báo cáo chạy nền")
+async def create_export_job(
+    user: dict = Depends(get_current_user),
+    limit: int = Query(10000, ge=1),
+    offset: int = Query(0, ge=0),
+    group_by: str = Query("Ngày"),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    ward_id: int = Query(None),
+    format: str = Query("xlsx")
+):
+    # Kiểm tra quyền ngay khi tạo job để lỗi 403/404 trả về trực tiếp
+    await run_db(_check_ward_access, user, ward_id)
+    dates = _export_dates(start_date, end_date)
+    # Số job đồng thời đã giới hạn theo user (EXPORT_JOBS_PER_USER): chỉ tính vào hạn mức token
+    admission.controller.charge(user, admission.estimate(user, ward_id, *dates, rows=limit))
+    # Cùng phiên bản dữ liệu thì dùng lại job/file đã có; có dữ liệu mới thì export lại
+    version = await run_db(_data_version)
+    key = (version, report_queries.scope_key(user), ward_id, *dates, group_by, format, limit, offset)
+    try:
+        job_id = export_jobs.jobs.submit(
+            user, key,
+            partial(_run_export_job, user, limit, offset, group_by, dates, ward_id, format)
+        )
+    except export_jobs.TooManyJobs as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return export_jobs.jobs.describe(job_id, user)
+
+def _run_export_job(user, limit, offset, group_by, dates, ward_id, format, progress):
+    with replica.report_connection() as conn:
+        on_replica = replica.is_replica(conn)
+        with conn.cursor() as cursor:
+            cursor.execute(*report_queries.count_reports_query(user, ward_id, *dates))
+            total = cursor.fetchone()['total']
+        if not on_replica:
+            total += archive.count_rows(user, ward_id, *dates)
+        progress(0, max(0, min(limit, total - offset)))
+        sql, params = report_queries.list_reports_query(user, limit, offset, ward_id, *dates)
+        tail = None if on_replica else partial(
+            archive.tail, conn, user, limit, offset, ward_id, *dates, as_dicts=True)
+        with metrics.stage("export_stream"):
+            return export_stream.export_to_file(conn, sql, params, group_by, format, progress, tail)
+
+@app.get("/reports/export/jobs/{job_id}", summary="Trạng thái và tiến độ job xuất báo cáo")
+def get_export_job(job_id: str, user: dict = Depends(get_current_user)):
+    job = export_jobs.jobs.describe(job_id, user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job export")
+    return job
+
+@app.get("/reports/export/jobs/{job_id}/download", summary="Tải file của job xuất báo cáo")
+def download_export_job(job_id: str, user: dict = Depends(get_current_user)):
+    build = export_jobs.jobs.get(job_id, user)
+    if build is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job export")
+    if build.status != export_jobs.DONE:
+        raise HTTPException(status_code=409, detail=f"Job export chưa xong (trạng thái: {build.status})")
+    # File thuộc kho artifact (dùng chung giữa các job), không xoá sau khi gửi
+    return FileResponse(
+        build.path,
+        media_type=build.media_type,
+        filename=build.filename,
+        headers={"Content-Disposition": f"attachment; filename={build.filename}"}
+    )
+
+# ====== 13. API Nhận dữ liệu in phiếu từ kiosk (ingest theo lô) ======
+@app.post("/reports/ingest", summary="Kiosk gửi lô dữ liệu in phiếu (JSON lines, CSV hoặc mảng JSON)")
+async def ingest_reports(
+    request: Request,
+    user: dict = Depends(get_current_user),
+    idempotency_key: str = Header(None)
+):
+    body = await request.body()
+    # Parse + validate (Pydantic) cũng chạy ngoài event loop: lô vài nghìn dòng mất hàng chục ms
+    return await run_db(_ingest_events, user, body, request.headers.get("content-type"), idempotency_key)
+
+def _ingest_events(user, body, content_type, idempotency_key):
+    started = time.perf_counter()
+    try:
+        events = ingest.validate(ingest.parse_body(body, content_type))
+        resolved = ingest.resolve_wards(events, user, auth_cache.wards.city_of)
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                ingest.check_dates(resolved, archive.ingest_cutoff(cursor))
+            inserted = ingest.insert_events(conn, resolved, idempotency_key)
+    except ingest.IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail={"message": str(e), "errors": e.errors})
+    if inserted:
+        # Dữ liệu mới: cache đọc lại phiên bản, rollup cập nhật sớm
+        cache.invalidate_version()
+        rollup.request_refresh()
+        replica.request_sync()
+        live.broadcaster.notify()
+    print(f"Ingest: {len(events)} events, {inserted} inserted, {(time.perf_counter() - started) * 1000:.1f} ms")
+    return {"success": True, "received": len(events), "inserted": inserted, "duplicates": len(events) - inserted}
+
+# ====== 14. API Cập nhật dashboard trực tiếp (Server-Sent Events) ======
+@app.get("/reports/live", summary="Luồng SSE các delta tổng hợp (lượt in mới) theo phạm vi quyền")
+async def live_reports(
+    request: Request,
+    ward_id: int = Query(None),
+    token: str = Query(None),
+    authorization: str = Header(None)
+):
+    # EventSource của trình duyệt không gửi được header: cho phép truyền token qua ?token=
+    if authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    user = _decode_token(token)
+    scope = report_queries.scope_key(user)
+    if ward_id is not None and user["role"] != "ward":
+        # City/admin theo dõi riêng một ward
+        await run_db(_check_ward_access, user, ward_id)
+        scope = ("ward", ward_id)
+    try:
+        events = live.event_stream(request, scope)
+        # Đăng ký ngay để lỗi quá tải trả 503 trước khi bắt đầu stream
+        first = await events.__anext__()
+    except live.TooManyClients as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def body():
         try:
-            conn.close()
-        except:
-            pass
+            yield first
+            async for message in events:
+                yield message
+        finally:
+            # Client ngắt kết nối: huỷ đăng ký ngay, không chờ GC
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",   # nginx không gom buffer SSE
+    })
+
+# ====== 15. Số liệu hiệu năng (Prometheus) ======
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"   # chỉ bật khi /metrics đã được chặn ở mạng nội bộ
+
+
+def _require_monitoring(authorization, detail):
+    """Cho qua giám sát gửi "Authorization: Bearer <METRICS_TOKEN>" hoặc JWT của admin."""
+    if METRICS_TOKEN and authorization == f"Bearer {METRICS_TOKEN}":
+        return
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if _decode_token(authorization[7:])["role"] != "admin":
+        raise HTTPException(status_code=403, detail=detail)
+
+metrics.register_gauges("db_pool", pool.stats)
+metrics.register_gauges("db_read", read_router.stats)
+metrics.register_gauges("export_jobs", export_jobs.jobs.stats)
+metrics.register_gauges("live", live.broadcaster.stats)
+metrics.register_gauges("process", metrics.process_stats)
+metrics.register_gauges("admission", admission.controller.stats)
+
+@app.get("/metrics", summary="Số liệu hiệu năng dạng Prometheus", include_in_schema=False)
+def get_metrics(authorization: str = Header(None)):
+    # Như /health/db: METRICS_TOKEN (Prometheus) hoặc admin; METRICS_PUBLIC=1 để mở hẳn
+    if not METRICS_PUBLIC:
+        _require_monitoring(authorization, "Only admin can view metrics")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # ====== 10. Health check/root API ======
 @app.get("/", summary="Kiểm tra server API hoạt động")
 def root():
-    return {"msg": "API is running!"}
\ No newline at end of file
+    return {"msg": "API is running!"}
+
+@app.get("/health/db", summary="Trạng thái connection pool (admin hoặc METRICS_TOKEN)")
+def db_health(authorization: str = Header(None)):
+    # Lộ địa chỉ replica, job, cache, admission: chỉ admin hoặc giám sát gửi METRICS_TOKEN như /metrics
+    _require_monitoring(authorization, "Only admin can view health")
+    return {"pool": pool.stats(), "read_routing": read_router.stats(),
+            "read_replicas": [r.describe() for r in read_router.replicas],
+            "export_jobs": export_jobs.jobs.stats(), "cache": cache.backend.stats(),
+            "live": live.broadcaster.stats(), "replica": replica.replica.stats(),
+            "process": metrics.process_stats(), "admission": admission.controller.stats()}
+
+metrics.record_import(round(time.perf_counter() - _import_started, 3))
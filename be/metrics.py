@@ -0,0 +1,281 @@
+"""Số liệu hiệu năng trong process, xuất ra định dạng text của Prometheus (/metrics).
+
+- http_request_duration_seconds{method,route,status}: thời gian mỗi request (middleware trong main)
+- db_connect_seconds: thời gian mở connection MySQL mới (db.get_connection)
+- db_query_seconds{route,operation}, db_rows_returned{route}: mọi truy vấn qua db._TimedConnection
+- app_stage_seconds{route,stage}: các bước không phải DB (pandas, serialize JSON, ghi file export)
+
+Nhãn route là đường dẫn mẫu của FastAPI (/reports/summary/{name}); truy vấn chạy ngoài
+request (thread nền rollup, replica, job export) có route="background".
+
+SLOW_QUERY_MS > 0 bật log (print) các truy vấn chậm hơn ngưỡng. Sampler là profiler lấy
+mẫu stack dùng cho header X-Profile của admin (xem main._Metrics).
+
+process_stats(): thời gian import/khởi động và bộ nhớ của process (mỗi worker gunicorn
+một giá trị, xem gunicorn.conf.py).
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 0))   # 0 = tắt
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+# Với các lệnh khác, số dòng của PyMySQL là số dòng bị ảnh hưởng, không phải số dòng trả về
+READ_OPERATIONS = {"SELECT", "WITH", "SHOW", "EXPLAIN", "(SELECT"}
+
+# Scope ASGI của request đang xử lý (None ngoài request); executor chép context sang thread pool
+current_request = contextvars.ContextVar("current_request", default=None)
+_sampler = contextvars.ContextVar("sampler", default=None)
+
+
+class Histogram:
+    """Histogram có nhãn, an toàn giữa các thread."""
+
+    def __init__(self, name, help, labelnames=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}   # nhãn -> [số đếm theo bucket..., tổng, số lần]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _labels(self, labels, extra=None):
+        pairs = list(zip(self.labelnames, labels))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{self._labels(labels, ('le', _number(bound)))} {count}")
+            lines.append(f"{self.name}_bucket{self._labels(labels, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {series[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+requests = Histogram("http_request_duration_seconds", "Thời gian xử lý request",
+                     ("method", "route", "status"))
+db_connect = Histogram("db_connect_seconds", "Thời gian mở connection MySQL mới")
+db_query = Histogram("db_query_seconds", "Thời gian thực thi truy vấn (gồm đọc kết quả nếu cursor có buffer)",
+                     ("route", "operation"))
+db_rows = Histogram("db_rows_returned", "Số dòng trả về mỗi truy vấn SELECT có buffer", ("route",), ROW_BUCKETS)
+stages = Histogram("app_stage_seconds", "Thời gian các bước ngoài DB (pandas, serialize, ghi file)",
+                   ("route", "stage"))
+HISTOGRAMS = [requests, db_connect, db_query, db_rows, stages]
+
+# name -> hàm trả về dict số liệu, xuất thành gauge name_<khoá> (pool, job export, ...)
+_gauges = {}
+
+
+def register_gauges(prefix, stats):
+    _gauges[prefix] = stats
+
+
+def route_label(scope=None):
+    scope = current_request.get() if scope is None else scope
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+def observe_request(scope, status, seconds):
+    requests.observe(seconds, scope["method"], route_label(scope), str(status))
+
+
+def observe_query(sql, seconds, rows=None):
+    route = route_label()
+    text = sql.decode(errors="replace") if isinstance(sql, bytes) else sql
+    operation = (text.lstrip().split(None, 1) or ["?"])[0].upper()
+    db_query.observe(seconds, route, operation)
+    if rows is not None and operation in READ_OPERATIONS:
+        db_rows.observe(rows, route)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        print(f"Slow query ({seconds * 1000:.0f} ms, {route}): {' '.join(text.split())[:1000]}")
+
+
+def observe_stage(name, seconds):
+    stages.observe(seconds, route_label(), name)
+
+
+@contextmanager
+def stage(name):
+    """Đo một bước xử lý ngoài DB: with metrics.stage("serialize"): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+# ====== Thời gian khởi động và bộ nhớ của process ======
+# Module nặng chỉ nạp khi export (hoặc preload ở master gunicorn)
+HEAVY_MODULES = ("pandas", "numpy", "xlsxwriter", "pyarrow", "duckdb")
+_process = {"import_pid": None, "import_seconds": None, "startup_seconds": None,
+            "started_at": time.time()}
+
+
+def record_import(seconds):
+    """Gọi cuối main: thời gian import app (với preload_app là của master, trước khi fork)."""
+    _process.update(import_pid=os.getpid(), import_seconds=seconds)
+
+
+def record_startup(seconds):
+    """Gọi cuối sự kiện startup của từng worker."""
+    _process.update(startup_seconds=seconds, started_at=time.time())
+
+
+def _memory():
+    # RSS và phần dùng chung (trang file/shmem) từ statm; PSS (chia đều trang dùng chung,
+    # gồm cả trang copy-on-write từ master) từ smaps_rollup; ngoài Linux chỉ có max RSS
+    stats = {}
+    try:
+        with open("/proc/self/statm") as f:
+            resident, shared = (int(x) for x in f.read().split()[1:3])
+        page = os.sysconf("SC_PAGE_SIZE")
+        stats["rss_bytes"], stats["shared_bytes"] = resident * page, shared * page
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    stats["pss_bytes"] = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        if "rss_bytes" not in stats:
+            import resource
+            stats["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return stats
+
+
+def process_stats():
+    stats = {
+        "pid": os.getpid(),
+        "preloaded": int(_process["import_pid"] not in (None, os.getpid())),
+        "import_seconds": _process["import_seconds"],
+        "startup_seconds": _process["startup_seconds"],
+        "uptime_seconds": round(time.time() - _process["started_at"], 1),
+        "heavy_modules_loaded": sum(name in sys.modules for name in HEAVY_MODULES),
+    }
+    stats.update(_memory())
+    return stats
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    for prefix, stats in _gauges.items():
+        try:
+            values = stats()
+        except Exception as e:
+            print(f"Metrics gauge error ({prefix}): {e}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ====== Profiler lấy mẫu stack cho từng request ======
+def _stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Lấy mẫu stack của các thread đang xử lý một request, mỗi PROFILE_INTERVAL giây.
+
+    Theo dõi thread event loop của request và các thread executor đang chạy việc của nó
+    (executor gọi track()). Event loop dùng chung với request khác nên profile nên lấy
+    khi server ít tải. Kết quả ở dạng "collapsed stack" (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.threads = {threading.get_ident()}
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            self.samples += 1
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                # Event loop đang chờ I/O (selectors) không phải thời gian của request
+                if frame is not None and not frame.f_code.co_filename.endswith("selectors.py"):
+                    self.stacks[_stack(frame)] += 1
+
+    @contextmanager
+    def running(self):
+        token = _sampler.set(self)
+        self._thread.start()
+        try:
+            yield self
+        finally:
+            self._stop.set()
+            self._thread.join()
+            _sampler.reset(token)
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def track(fn):
+    """Bọc fn chạy trên thread pool: giữ context của request (nhãn route, profiler)."""
+    context = contextvars.copy_context()
+
+    def run():
+        return context.run(_run_tracked, fn)
+    return run
+
+
+def _run_tracked(fn):
+    sampler = _sampler.get()
+    if sampler is None:
+        return fn()
+    ident = threading.get_ident()
+    sampler.threads.add(ident)
+    try:
+        return fn()
+    finally:
+        sampler.threads.discard(ident)
@@ -0,0 +1,72 @@
+"""Áp dụng các migration SQL trong thư mục migrations/ theo thứ tự tên file.
+
+Các migration đã chạy được ghi vào bảng schema_migrations.
+
+    python migrate.py            # áp dụng các migration chưa chạy
+    python migrate.py --status   # liệt kê trạng thái
+"""
+import sys
+from pathlib import Path
+
+from db import db_connection
+
+MIGRATIONS_DIR = Path(__file__).with_name("migrations")
+
+
+def split_statements(sql):
+    """Tách file SQL thành từng câu lệnh (bỏ dòng chú thích `--`)."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";\n") if stmt.strip().rstrip(";")]
+
+
+def ensure_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS `schema_migrations` (
+              `name` varchar(255) NOT NULL,
+              `applied_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+              PRIMARY KEY (`name`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+    conn.commit()
+
+
+def applied(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM schema_migrations")
+        return {row['name'] for row in cursor.fetchall()}
+
+
+def available():
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+
+def apply_all(conn):
+    """Chạy các migration chưa áp dụng. Trả về danh sách tên đã chạy."""
+    ensure_table(conn)
+    done = applied(conn)
+    ran = []
+    for path in available():
+        if path.name in done:
+            continue
+        # DDL của MySQL tự commit: nếu một câu lỗi, các câu trước đó vẫn giữ hiệu lực
+        with conn.cursor() as cursor:
+            for stmt in split_statements(path.read_text(encoding="utf-8")):
+                cursor.execute(stmt.rstrip(";"))
+            cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (path.name,))
+        conn.commit()
+        ran.append(path.name)
+        print(f"Applied {path.name}")
+    return ran
+
+
+if __name__ == "__main__":
+    with db_connection() as conn:
+        if "--status" in sys.argv:
+            ensure_table(conn)
+            done = applied(conn)
+            for path in available():
+                print(f"{'x' if path.name in done else ' '} {path.name}")
+        else:
+            ran = apply_all(conn)
+            print(f"{len(ran)} migration(s) applied")
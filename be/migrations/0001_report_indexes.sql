@@ -0,0 +1,18 @@
+--
+-- Chỉ mục phức hợp cho các truy vấn báo cáo theo phân quyền.
+--
+-- Mỗi role lọc theo một cột (ward_id / city_id / không lọc), sau đó lọc print_time
+-- trong giờ làm việc và sắp xếp ORDER BY date DESC, print_time ASC. Các chỉ mục dưới
+-- đây khớp đúng thứ tự đó nên MySQL đọc theo chỉ mục, không cần filesort.
+-- `date` DESC cần MySQL 8+ / MariaDB 10.8+; bản cũ hơn bỏ qua DESC.
+-- Các khoá đơn `ward_id`, `city_id` được thay bằng chỉ mục mới (khoá ngoại vẫn dùng được
+-- vì cột đầu tiên trùng).
+--
+ALTER TABLE `reports`
+  ADD KEY `idx_reports_ward_date` (`ward_id`, `date` DESC, `print_time`, `id`),
+  ADD KEY `idx_reports_city_date` (`city_id`, `date` DESC, `print_time`, `id`),
+  ADD KEY `idx_reports_date` (`date` DESC, `print_time`, `id`);
+
+ALTER TABLE `reports`
+  DROP KEY `ward_id`,
+  DROP KEY `city_id`;
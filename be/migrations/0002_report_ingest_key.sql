@@ -0,0 +1,10 @@
+--
+-- Khoá idempotency cho dữ liệu gửi qua /reports/ingest.
+--
+-- ingest_key = SHA-256 (hex) của ward_id + event_id do kiosk sinh. Chỉ mục UNIQUE làm
+-- cho một sự kiện gửi lại (retry) không tạo thêm dòng: INSERT ... ON DUPLICATE KEY
+-- bỏ qua dòng trùng. Dòng nạp từ nguồn khác để NULL (UNIQUE cho phép nhiều NULL).
+--
+ALTER TABLE `reports`
+  ADD COLUMN `ingest_key` char(64) CHARACTER SET ascii COLLATE ascii_bin DEFAULT NULL,
+  ADD UNIQUE KEY `uq_reports_ingest_key` (`ingest_key`);
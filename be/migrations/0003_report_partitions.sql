@@ -0,0 +1,38 @@
+--
+-- Phân vùng bảng reports theo tháng trên cột `date` (RANGE COLUMNS).
+--
+-- MySQL yêu cầu mọi khoá UNIQUE (kể cả PRIMARY KEY) của bảng phân vùng chứa cột phân vùng,
+-- và bảng phân vùng không có khoá ngoại: khoá chính thành (id, date), ingest_key unique
+-- theo (ingest_key, date) (sự kiện gửi lại có cùng ngày nên vẫn bị bỏ qua), bỏ 2 khoá ngoại
+-- tới wards/cities (ward/city đã được kiểm tra khi ingest). `date` thành NOT NULL;
+-- migration dừng lại nếu còn dòng chưa có ngày.
+--
+-- Ban đầu chỉ có partition p_max; `python archive.py partitions` chia nó thành các
+-- partition tháng (chạy định kỳ để luôn có sẵn partition cho các tháng tới).
+--
+ALTER TABLE `reports`
+  DROP FOREIGN KEY `reports_ibfk_1`,
+  DROP FOREIGN KEY `reports_ibfk_2`;
+
+ALTER TABLE `reports`
+  MODIFY `date` date NOT NULL,
+  DROP PRIMARY KEY,
+  ADD PRIMARY KEY (`id`, `date`),
+  DROP KEY `uq_reports_ingest_key`,
+  ADD UNIQUE KEY `uq_reports_ingest_key` (`ingest_key`, `date`);
+
+ALTER TABLE `reports`
+  PARTITION BY RANGE COLUMNS(`date`) (
+    PARTITION `p_max` VALUES LESS THAN (MAXVALUE)
+  );
+
+--
+-- Các partition đã chuyển ra file Parquet (archive.py run).
+--
+CREATE TABLE IF NOT EXISTS `report_archive` (
+  `partition_name` varchar(16) NOT NULL,
+  `rows` int(11) NOT NULL,
+  `path` varchar(255) NOT NULL,
+  `archived_at` datetime NOT NULL,
+  PRIMARY KEY (`partition_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
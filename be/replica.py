@@ -0,0 +1,325 @@
+"""Bản sao phân tích (DuckDB) của reports/wards/cities cho các truy vấn tổng hợp và export.
+
+Bật bằng REPORT_BACKEND=duckdb (cần gói duckdb). Thread nền chép các dòng reports mới
+theo id (watermark đã ổn định như rollup, xem rollup.SettledId) sang file DuckDB, nạp lại wards/cities mỗi lần; lần đầu
+nạp thêm các file archive Parquet nên replica có đủ lịch sử. Khi replica đã sẵn sàng,
+/reports/summary và export (kể cả job) đọc từ replica qua report_connection(); /users,
+đăng nhập và ingest vẫn dùng MySQL.
+
+ReplicaConnection giả lập phần API PyMySQL mà report_queries/export_stream dùng
+(cursor dict hoặc tuple, %s -> ?), và replica có các view cùng tên bảng rollup nên
+rollup.export_counts chạy được nguyên vẹn.
+
+File DuckDB chỉ mở được ghi bởi một process: nếu chạy nhiều worker, mỗi worker cần
+REPORT_REPLICA_PATH riêng (hoặc ":memory:"); mở lỗi thì tự quay về MySQL.
+
+    python replica.py sync   # đồng bộ một lần (ví dụ để dựng file trước khi deploy)
+"""
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pymysql
+
+import archive
+import rollup
+from db import db_connection, pinned_connection, read_connection
+from report_queries import BUSINESS_HOURS, COUNT_EXPR, Source
+
+ENABLED = os.getenv("REPORT_BACKEND", "mysql") == "duckdb"
+PATH = os.getenv("REPORT_REPLICA_PATH", str(Path(__file__).with_name("replica.duckdb")))
+SYNC_INTERVAL = float(os.getenv("REPORT_REPLICA_SYNC_INTERVAL", 10))   # giây giữa 2 lần đồng bộ
+BATCH_SIZE = int(os.getenv("REPORT_REPLICA_BATCH_SIZE", 100000))
+
+REPORT_COLUMNS = ['id', 'ward_id', 'city_id', 'date', 'procedure', 'count', 'age_group', 'gender',
+                  'domain', 'auth_type', 'print_time']
+INT_COLUMNS = ['id', 'ward_id', 'city_id', 'count', 'print_time']
+
+# Tổng hợp trực tiếp trên bảng reports của replica (DuckDB GROUP BY đủ nhanh, không cần rollup)
+SOURCE = Source(None, f"SUM({COUNT_EXPR})", business_hours=True,
+                yearweek="isoyear(r.date) * 100 + week(r.date)")
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS reports (
+        id INTEGER, ward_id INTEGER, city_id INTEGER, date DATE, "procedure" VARCHAR,
+        count INTEGER, age_group VARCHAR, gender VARCHAR, domain VARCHAR, auth_type VARCHAR,
+        print_time INTEGER
+    )""",
+    "CREATE TABLE IF NOT EXISTS wards (ward_id INTEGER, ward_name VARCHAR, city_id INTEGER)",
+    "CREATE TABLE IF NOT EXISTS cities (city_id INTEGER, city_name VARCHAR)",
+    "CREATE TABLE IF NOT EXISTS replica_state (last_report_id INTEGER, synced_at TIMESTAMP)",
+]
+
+
+def _rollup_view_sql(table, dims):
+    """View cùng tên và cột với bảng rollup MySQL, tính từ bảng reports của replica."""
+    dims_sql = "".join(f', {expr} AS "{name}"' for name, _, expr in dims)
+    return f"""
+        CREATE OR REPLACE VIEW {table} AS
+        SELECT COALESCE(r.ward_id, 0) AS ward_id, COALESCE(r.city_id, 0) AS city_id, r.date{dims_sql},
+               COUNT(*) AS prints, SUM({COUNT_EXPR}) AS total_count
+        FROM reports r
+        WHERE r.date IS NOT NULL AND r.print_time BETWEEN {BUSINESS_HOURS[0]} AND {BUSINESS_HOURS[1]}
+        GROUP BY ALL
+    """
+
+
+class ReplicaCursor:
+    """Cursor kiểu PyMySQL trên một kết nối DuckDB: tham số %s, kết quả dict hoặc tuple.
+
+    Chỉ dùng cho câu SQL của report_queries/rollup (không có ký tự % hay ` trong chuỗi literal).
+    """
+
+    def __init__(self, con, as_dict):
+        self._con = con
+        self._as_dict = as_dict
+        self._columns = None
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, sql, params=()):
+        if sql.lstrip().upper().startswith("SET SESSION"):
+            # Tham số phiên của MySQL (timeout...) không áp dụng cho DuckDB
+            return 0
+        # Tham số %s và tên định danh `...` của MySQL -> ? và "..." của DuckDB
+        self._con.execute(sql.replace("%s", "?").replace("`", '"'), list(params or ()))
+        self.description = self._con.description
+        self._columns = [d[0] for d in self.description] if self.description else None
+        return 0
+
+    def _rows(self, rows):
+        if not self._as_dict:
+            return rows
+        return [dict(zip(self._columns, row)) for row in rows]
+
+    def fetchone(self):
+        row = self._con.fetchone()
+        return self._rows([row])[0] if row is not None else None
+
+    def fetchall(self):
+        return self._rows(self._con.fetchall())
+
+    def fetchmany(self, size):
+        return self._rows(self._con.fetchmany(size))
+
+    def close(self):
+        pass
+
+
+class ReplicaConnection:
+    """Kết nối đọc replica cho một request (một cursor DuckDB riêng, an toàn giữa các thread)."""
+
+    replica = True
+
+    def __init__(self, con):
+        self._con = con
+
+    def cursor(self, cursorclass=None):
+        as_dict = cursorclass not in (pymysql.cursors.Cursor, pymysql.cursors.SSCursor)
+        return ReplicaCursor(self._con, as_dict)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self._con.close()
+
+
+class Replica:
+    def __init__(self, path=PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self.last_id = None
+        self.synced = False
+        self.error = None
+        self._settled = rollup.SettledId()
+
+    def open(self):
+        """Mở (hoặc tạo) file DuckDB. Trả về False nếu không dùng được (thiếu duckdb, file bị khoá...)."""
+        try:
+            import duckdb
+            self._db = duckdb.connect(self.path)
+            fresh = self._db.execute(
+                "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'replica_state'"
+            ).fetchone()[0] == 0
+            for stmt in SCHEMA:
+                self._db.execute(stmt)
+            for table, dims in rollup.ROLLUPS.values():
+                self._db.execute(_rollup_view_sql(table, dims))
+            if fresh:
+                self._seed_archive()
+                self._db.execute("INSERT INTO replica_state VALUES (0, NULL)")
+            self.last_id = self._db.execute("SELECT last_report_id FROM replica_state").fetchone()[0]
+        except Exception as e:
+            self.error = str(e)
+            self._db = None
+            print(f"Replica open error: {e}")
+            return False
+        return True
+
+    def _seed_archive(self):
+        # Dữ liệu đã chuyển khỏi MySQL (archive.py) vẫn có trong replica
+        files = [str(path) for path in archive.archived_files()]
+        if files:
+            cols = ", ".join(f'"{c}"' for c in REPORT_COLUMNS)
+            self._db.execute(f"INSERT INTO reports SELECT {cols} FROM read_parquet(?)", [files])
+            print(f"Replica: seeded {len(files)} archive file(s)")
+
+    def _frame(self, rows):
+        import pandas as pd
+
+        df = pd.DataFrame.from_records(rows, columns=REPORT_COLUMNS)
+        for col in INT_COLUMNS:
+            df[col] = df[col].astype("Int64")
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    def sync(self, mysql_conn, upto=None, batch_size=BATCH_SIZE):
+        """Chép các dòng reports watermark < id <= upto và nạp lại wards/cities. Trả về số dòng mới.
+
+        upto=None: id đã ổn định theo các lần gọi trước (id tự tăng không commit theo thứ tự,
+        chép tới MAX(id) ngay sẽ bỏ sót vĩnh viễn dòng id nhỏ hơn commit muộn).
+        """
+        import pandas as pd
+
+        with self._lock:
+            con = self._db.cursor()
+            copied = 0
+            try:
+                if upto is None:
+                    with mysql_conn.cursor() as cursor:
+                        upto = self._settled.observe(rollup.max_report_id(cursor))
+                with mysql_conn.cursor(pymysql.cursors.Cursor) as cursor:
+                    cursor.execute("SELECT ward_id, ward_name, city_id FROM wards")
+                    wards = cursor.fetchall()
+                    cursor.execute("SELECT city_id, city_name FROM cities")
+                    cities = cursor.fetchall()
+                    con.begin()
+                    con.execute("DELETE FROM wards")
+                    con.register("new_wards", pd.DataFrame.from_records(
+                        wards, columns=['ward_id', 'ward_name', 'city_id']))
+                    con.execute("INSERT INTO wards SELECT * FROM new_wards")
+                    con.execute("DELETE FROM cities")
+                    con.register("new_cities", pd.DataFrame.from_records(cities, columns=['city_id', 'city_name']))
+                    con.execute("INSERT INTO cities SELECT * FROM new_cities")
+                    con.commit()
+
+                    while True:
+                        cursor.execute(f"""
+                            SELECT id, ward_id, city_id, date, `procedure`, count, age_group, gender,
+                                   domain, auth_type, print_time
+                            FROM reports WHERE id > %s AND id <= %s ORDER BY id LIMIT %s
+                        """, (self.last_id, upto, batch_size))
+                        rows = cursor.fetchall()
+                        if not rows:
+                            break
+                        # Mỗi lô một transaction: dòng và watermark luôn đi cùng nhau
+                        con.begin()
+                        con.register("new_reports", self._frame(rows))
+                        con.execute("INSERT INTO reports SELECT * FROM new_reports")
+                        con.execute("UPDATE replica_state SET last_report_id = ?, synced_at = now()", [rows[-1][0]])
+                        con.commit()
+                        self.last_id = rows[-1][0]
+                        copied += len(rows)
+                        if len(rows) < batch_size:
+                            break
+            except Exception:
+                try:
+                    con.rollback()
+                except Exception:
+                    pass   # lỗi xảy ra ngoài transaction (đọc MySQL)
+                raise
+            finally:
+                con.close()
+            # Chỉ dùng replica khi đã chép tới một mốc ổn định (lần quan sát đầu chưa đủ cũ)
+            self.synced = self.synced or self._settled.ready or upto > 0
+            return copied
+
+    def active(self):
+        # Chỉ đọc replica sau lần đồng bộ đầu tiên của process (file cũ có thể trễ xa MySQL)
+        return self._db is not None and self.synced
+
+    def connection(self):
+        return ReplicaConnection(self._db.cursor())
+
+    def stats(self):
+        return {"enabled": ENABLED, "active": self.active(), "path": self.path,
+                "synced": self.synced, "last_report_id": self.last_id,
+                "settled_id": self._settled.value, "error": self.error}
+
+
+replica = Replica()
+_wake = threading.Event()
+
+
+@contextmanager
+def report_connection():
+    """Kết nối cho truy vấn tổng hợp/export: replica DuckDB nếu đang bật và sẵn sàng, ngược lại
+    MySQL (read replica nếu có, xem db.read_connection). Connection đang ghim (db.pinned) được
+    dùng lại nguyên vẹn."""
+    conn = pinned_connection()
+    if conn is not None:
+        yield conn
+        return
+    if not replica.active():
+        with read_connection() as conn:
+            yield conn
+        return
+    conn = replica.connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def is_replica(conn):
+    return getattr(conn, "replica", False)
+
+
+def request_sync():
+    """Báo thread nền đồng bộ sớm (sau khi ingest), không chờ hết interval."""
+    _wake.set()
+
+
+def _sync_loop(stop, interval):
+    while True:
+        try:
+            with db_connection() as conn:
+                copied = replica.sync(conn)
+            if copied:
+                print(f"Replica: synced {copied} rows (last id {replica.last_id})")
+        except Exception as e:
+            replica.error = str(e)
+            print(f"Replica sync error: {e}")
+        _wake.wait(interval)
+        _wake.clear()
+        if stop.is_set():
+            return
+
+
+def start_background_sync(interval=SYNC_INTERVAL):
+    """Mở replica và đồng bộ định kỳ trên thread nền (chỉ khi REPORT_BACKEND=duckdb). Trả về Event để dừng."""
+    stop = threading.Event()
+    if ENABLED and replica.open():
+        threading.Thread(target=_sync_loop, args=(stop, interval), daemon=True, name="replica-sync").start()
+    return stop
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["sync"]:
+        sys.exit("Cách dùng: python replica.py sync")
+    if not replica.open():
+        sys.exit(1)
+    with db_connection() as conn:
+        print(f"Synced {replica.sync(conn, rollup.settle(conn))} rows, last id {replica.last_id}")
@@ -0,0 +1,380 @@
+import base64
+import datetime
+import json
+
+# Khung giờ làm việc của kiosk (các báo cáo chỉ tính print_time trong khoảng này)
+BUSINESS_HOURS = (7, 17)
+
+# Giống frontend: bản ghi có count rỗng/0 được tính là 1 lượt
+COUNT_EXPR = "CASE WHEN r.count IS NULL OR r.count = 0 THEN 1 ELSE r.count END"
+
+AGE_ORDER = ['<18', '18-30', '31-50', '>50']
+MALE_VALUES = ('nam', 'male')
+FEMALE_VALUES = ('nữ', 'nu', 'female')
+
+
+class Source:
+    """Nguồn dữ liệu cho các truy vấn tổng hợp: bảng reports gốc hoặc các bảng rollup.
+
+    `tables` ánh xạ loại tổng hợp (daily, hourly, domain, ...) sang tên bảng; None nghĩa là
+    luôn đọc bảng reports. `weighted` là biểu thức tổng lượt in (có trọng số count),
+    `yearweek` là biểu thức năm*100 + tuần ISO của r.date theo cú pháp của database.
+    """
+
+    def __init__(self, tables, weighted, business_hours, yearweek="YEARWEEK(r.date, 3)"):
+        self.tables = tables
+        self.weighted = weighted
+        self.yearweek = yearweek
+        # Bảng rollup đã chỉ chứa giờ làm việc, không cần lọc print_time lại
+        self.business_hours = business_hours
+
+    def table(self, kind):
+        return self.tables[kind] if self.tables else "reports"
+
+    def parts(self, where, params):
+        """Các phần [(source, where, params)] cần truy vấn rồi cộng kết quả lại."""
+        return [(self, where, params)]
+
+
+RAW = Source(None, f"SUM({COUNT_EXPR})", business_hours=True)
+
+
+class SplitSource:
+    """Rollup cho các ngày trước `cut`, bảng reports gốc từ ngày `cut` (rollup chưa đủ dòng).
+
+    Hai phần chia theo ngày nên cộng kết quả của từng phần là đúng, kể cả số ngày có dữ
+    liệu. Dùng với where không lọc giờ làm việc; phần bảng gốc tự thêm điều kiện đó.
+    """
+
+    business_hours = False
+
+    def __init__(self, rolled, raw, cut):
+        self.rolled = rolled
+        self.raw = raw
+        self.cut = cut
+
+    def parts(self, where, params):
+        return [
+            (self.rolled, f"{where} AND r.date < %s", [*params, self.cut]),
+            (self.raw, f"{where} AND r.print_time BETWEEN %s AND %s AND r.date >= %s",
+             [*params, *BUSINESS_HOURS, self.cut]),
+        ]
+
+
+def scope_filter(user, ward_id=None):
+    """Điều kiện WHERE theo phân quyền (giống get_reports/export_reports)."""
+    role = user["role"]
+    if role == "admin":
+        if ward_id is not None:
+            return ["r.ward_id = %s"], [ward_id]
+        return [], []
+    if role == "city":
+        clauses, params = ["r.city_id = %s"], [user["city_id"]]
+        if ward_id is not None and ward_id > 0:
+            # Ward phải thuộc city của user, điều kiện city_id ở trên đảm bảo điều đó
+            clauses.append("r.ward_id = %s")
+            params.append(ward_id)
+        return clauses, params
+    if role == "ward":
+        return ["r.ward_id = %s"], [user["ward_id"]]
+    raise PermissionError("Invalid role")
+
+
+def scope_key(user):
+    """Phạm vi dữ liệu của user theo scope_filter: các user cùng phạm vi thấy cùng dữ liệu."""
+    if user["role"] == "admin":
+        return ("admin",)
+    if user["role"] == "city":
+        return ("city", user.get("city_id"))
+    return ("ward", user.get("ward_id"))
+
+
+def report_filter(user, ward_id=None, start_date=None, end_date=None, business_hours=True):
+    """Trả về (where_sql, params) cho bảng reports r: phân quyền + giờ làm việc + khoảng ngày."""
+    clauses, params = scope_filter(user, ward_id)
+    if business_hours:
+        clauses.append("r.print_time BETWEEN %s AND %s")
+        params.extend(BUSINESS_HOURS)
+    # So sánh trực tiếp trên cột date (không bọc DATE()) để dùng được chỉ mục
+    if start_date:
+        clauses.append("r.date >= %s")
+        params.append(start_date)
+    if end_date:
+        clauses.append("r.date <= %s")
+        params.append(end_date)
+    return " AND ".join(clauses) or "1 = 1", params
+
+
+REPORT_COLUMNS = """
+    r.id, r.ward_id, r.city_id, r.date, r.procedure, r.count, r.age_group, r.gender, r.domain, r.auth_type, r.print_time, w.ward_name
+"""
+# Khớp với chỉ mục (…, date DESC, print_time, id) trong migrations/0001_report_indexes.sql.
+# id là khoá phụ để thứ tự luôn xác định (phân trang không lặp/mất dòng).
+REPORT_ORDER = "ORDER BY r.date DESC, r.print_time ASC, r.id ASC"
+
+
+def encode_cursor(date, print_time, report_id):
+    """Token phân trang (opaque) trỏ tới dòng cuối của trang hiện tại."""
+    raw = json.dumps([_fmt_date(date), print_time, report_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Giải mã token thành (date, print_time, id). Ném ValueError nếu token không hợp lệ."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        date, print_time, report_id = json.loads(raw)
+        if date is not None:
+            datetime.date.fromisoformat(date)
+        return date, int(print_time), int(report_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(after):
+    """Điều kiện lấy các dòng đứng sau `after` theo REPORT_ORDER."""
+    date, print_time, report_id = after
+    tail = "(r.print_time > %s OR (r.print_time = %s AND r.id > %s))"
+    if date is None:
+        # Dòng không có ngày nằm cuối khi sắp xếp date DESC
+        return f"r.date IS NULL AND {tail}", [print_time, print_time, report_id]
+    # r.date <= %s dư thừa về logic nhưng giúp MySQL dùng range trên chỉ mục
+    return (
+        f"(r.date <= %s OR r.date IS NULL) AND "
+        f"(r.date < %s OR r.date IS NULL OR (r.date = %s AND {tail}))",
+        [date, date, date, print_time, print_time, report_id],
+    )
+
+
+def list_reports_query(user, limit, offset, ward_id=None, start_date=None, end_date=None, after=None):
+    """Câu SELECT dữ liệu báo cáo (dùng cho /reports và /reports/export).
+
+    `after` = (date, print_time, id) bật phân trang keyset, khi đó offset bị bỏ qua.
+    """
+    where, params = report_filter(user, ward_id, start_date, end_date)
+    if after is not None:
+        clause, clause_params = keyset_filter(after)
+        where = f"{where} AND {clause}"
+        params = params + clause_params
+        page, page_params = "LIMIT %s", [limit]
+    else:
+        page, page_params = "LIMIT %s OFFSET %s", [limit, offset]
+    sql = f"""
+        SELECT {REPORT_COLUMNS}
+        FROM reports r
+        LEFT JOIN wards w ON r.ward_id = w.ward_id
+        WHERE {where}
+        {REPORT_ORDER}
+        {page}
+    """
+    return sql, params + page_params
+
+
+def count_reports_query(user, ward_id=None, start_date=None, end_date=None):
+    """Số dòng list_reports_query trả về khi không giới hạn (LEFT JOIN không đổi số dòng)."""
+    where, params = report_filter(user, ward_id, start_date, end_date)
+    return f"SELECT COUNT(*) AS total FROM reports r WHERE {where}", params
+
+
+def _fmt_date(value):
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else value
+
+
+def _grouped(cursor, source, where, params, sql, keys):
+    """Chạy sql(source, where) trên từng phần của source, cộng các dòng cùng khoá `keys`."""
+    parts = source.parts(where, params)
+    if len(parts) == 1:
+        part, part_where, part_params = parts[0]
+        cursor.execute(sql(part, part_where), part_params)
+        return cursor.fetchall()
+    merged = {}
+    for part, part_where, part_params in parts:
+        cursor.execute(sql(part, part_where), part_params)
+        for row in cursor.fetchall():
+            key = tuple(row[k] for k in keys)
+            if key not in merged:
+                merged[key] = dict(row)
+                continue
+            for column, value in row.items():
+                if column not in keys:
+                    merged[key][column] += value
+    return list(merged.values())
+
+
+def _by_value(rows):
+    # Giảm dần theo value, bằng nhau thì theo tên (thứ tự không phụ thuộc số phần đã cộng)
+    return sorted(rows, key=lambda row: (-row['value'], row['name']))
+
+
+def _percent(value, total):
+    return f"{value / total * 100:.1f}" if total else "0.0"
+
+
+def prints_by_time(cursor, where, params, group_by="Ngày", source=RAW):
+    if group_by == "Tuần":
+        # YEARWEEK(..., 3) là tuần ISO, giống dayjs 'GGGG-[W]WW'
+        rows = _grouped(cursor, source, where, params, lambda src, w: f"""
+            SELECT {src.yearweek} AS yw, {src.weighted} AS count
+            FROM {src.table('daily')} r
+            WHERE {w} AND r.date IS NOT NULL
+            GROUP BY yw
+            ORDER BY yw
+        """, ['yw'])
+        result = []
+        for row in sorted(rows, key=lambda row: int(row['yw'])):
+            year, week = divmod(int(row['yw']), 100)
+            start = datetime.date.fromisocalendar(year, week, 1)
+            end = datetime.date.fromisocalendar(year, week, 7)
+            result.append({
+                "time": f"{year}-W{week:02d}",
+                "count": int(row['count']),
+                "weekStart": start.strftime('%d/%m'),
+                "weekEnd": end.strftime('%d/%m'),
+            })
+        return result
+
+    rows = _grouped(cursor, source, where, params, lambda src, w: f"""
+        SELECT r.date AS date, {src.weighted} AS count
+        FROM {src.table('daily')} r
+        WHERE {w} AND r.date IS NOT NULL
+        GROUP BY r.date
+        ORDER BY r.date
+    """, ['date'])
+    return [
+        {"time": _fmt_date(row['date']), "count": int(row['count']), "weekStart": None, "weekEnd": None}
+        for row in sorted(rows, key=lambda row: row['date'])
+    ]
+
+
+def hourly(cursor, where, params, source=RAW):
+    rows = _grouped(cursor, source, where, params, lambda src, w: f"""
+        SELECT r.print_time AS hour, {src.weighted} AS total, COUNT(DISTINCT r.date) AS days
+        FROM {src.table('hourly')} r
+        WHERE {w}
+        GROUP BY r.print_time
+    """, ['hour'])
+    by_hour = {int(row['hour']): row for row in rows}
+    result = []
+    for hour in range(BUSINESS_HOURS[0], BUSINESS_HOURS[1] + 1):
+        row = by_hour.get(hour)
+        total = int(row['total']) if row else 0
+        days = int(row['days']) if row else 0
+        result.append({
+            "hour": hour,
+            "count": total / days if days else 0,
+            "totalCount": total,
+            "activeDays": days,
+        })
+    return result
+
+
+def domains(cursor, where, params, source=RAW):
+    rows = _grouped(cursor, source, where, params, lambda src, w: f"""
+        SELECT r.domain AS name, {src.weighted} AS value
+        FROM {src.table('domain')} r
+        WHERE {w} AND r.domain IS NOT NULL AND r.domain <> ''
+        GROUP BY r.domain
+        ORDER BY value DESC
+    """, ['name'])
+    return [{"name": row['name'], "value": int(row['value'])} for row in _by_value(rows)]
+
+
+def top_procedures(cursor, where, params, top_k=8, source=RAW):
+    rows = _grouped(cursor, source, where, params, lambda src, w: f"""
+        SELECT COALESCE(NULLIF(r.procedure, ''), 'Không xác định') AS name, {src.weighted} AS value
+        FROM {src.table('procedure')} r
+        WHERE {w}
+        GROUP BY name
+        ORDER BY value DESC
+    """, ['name'])
+    procs = [{"name": row['name'], "value": int(row['value'])} for row in _by_value(rows)]
+    top, others = procs[:top_k], procs[top_k:]
+    result = [
+        {
+            "name": p["name"][:30] + '...' if len(p["name"]) > 30 else p["name"],
+            "fullName": p["name"],
+            "value": p["value"],
+        }
+        for p in top
+    ]
+    other_count = sum(p["value"] for p in others)
+    if other_count > 0:
+        result.append({
+            "name": f"Khác ({len(others)} thủ tục)",
+            "fullName": f"{len(others)} thủ tục khác",
+            "value": other_count,
+            "isOther": True,
+            "details": others,
+        })
+    return result
+
+
+def auth_types(cursor, where, params, source=RAW):
+    rows = _grouped(cursor, source, where, params, lambda src, w: f"""
+        SELECT UPPER(COALESCE(NULLIF(r.auth_type, ''), 'CCCD')) AS name, {src.weighted} AS value
+        FROM {src.table('auth_type')} r
+        WHERE {w}
+        GROUP BY name
+    """, ['name'])
+    counts = {"CCCD": 0, "QR": 0}
+    for row in rows:
+        if row['name'] in counts:
+            counts[row['name']] += int(row['value'])
+    total = sum(counts.values())
+    return [
+        {"name": "CCCD điện tử" if name == "CCCD" else name, "value": value, "percent": _percent(value, total)}
+        for name, value in counts.items()
+        if value > 0
+    ]
+
+
+def age_gender(cursor, where, params, source=RAW):
+    rows = _grouped(cursor, source, where, params, lambda src, w: f"""
+        SELECT TRIM(r.age_group) AS age_group, LOWER(r.gender) AS gender, {src.weighted} AS value
+        FROM {src.table('age_gender')} r
+        WHERE {w}
+          AND r.age_group IS NOT NULL AND TRIM(r.age_group) <> ''
+          AND r.gender IS NOT NULL AND r.gender <> ''
+        GROUP BY TRIM(r.age_group), LOWER(r.gender)
+    """, ['age_group', 'gender'])
+    groups = {}
+    for row in rows:
+        item = groups.setdefault(row['age_group'], {"ageRange": row['age_group'], "male": 0, "female": 0, "total": 0})
+        value = int(row['value'])
+        if row['gender'] in MALE_VALUES:
+            item["male"] += value
+        elif row['gender'] in FEMALE_VALUES:
+            item["female"] += value
+        item["total"] += value
+    result = []
+    for age in AGE_ORDER:
+        item = groups.get(age)
+        if item and item["total"] > 0:
+            result.append({
+                **item,
+                "malePercent": _percent(item["male"], item["total"]),
+                "femalePercent": _percent(item["female"], item["total"]),
+            })
+    return result
+
+
+SUMMARIES = {
+    "by-time": prints_by_time,
+    "hourly": hourly,
+    "domains": domains,
+    "top-procedures": top_procedures,
+    "auth-types": auth_types,
+    "age-gender": age_gender,
+}
+
+
+def run_summaries(cursor, where, params, names, group_by="Ngày", top_k=8, source=RAW):
+    result = {}
+    for name in names:
+        if name == "by-time":
+            result[name] = prints_by_time(cursor, where, params, group_by, source=source)
+        elif name == "top-procedures":
+            result[name] = top_procedures(cursor, where, params, top_k, source=source)
+        else:
+            result[name] = SUMMARIES[name](cursor, where, params, source=source)
+    return result
@@ -0,0 +1,164 @@
+"""Xử lý kết quả truy vấn reports theo cột: cursor trả tuple, không dựng dict cho từng dòng.
+
+- /reports: tuple -> JSON bytes bằng orjson (date được orjson ghi dạng YYYY-MM-DD).
+  Client chọn định dạng gọn hơn qua header Accept hoặc ?format= (xem negotiate):
+  JSON theo cột với cột chuỗi mã hoá từ điển, hoặc Arrow IPC stream (cần pyarrow).
+- /reports/export: tuple -> DataFrame (from_records), định dạng ngày theo giá trị khác nhau.
+"""
+import importlib.util
+
+import orjson
+import pymysql
+
+import report_queries
+
+# Arrow là tuỳ chọn, không có thì chỉ phục vụ JSON. pyarrow và pandas chỉ được import
+# khi cần (request Arrow / export đầu tiên) để khởi động nhanh.
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+ROWS_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.kiosk.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MEDIA_TYPES = {"rows": ROWS_MEDIA_TYPE, "columnar": COLUMNAR_MEDIA_TYPE, "arrow": ARROW_MEDIA_TYPE}
+
+# Cột lặp lại nhiều (ít giá trị khác nhau): gửi từ điển + mã số nguyên thay cho chuỗi
+DICT_COLUMNS = ('date', 'procedure', 'age_group', 'gender', 'domain', 'auth_type', 'ward_name')
+
+
+def fetch(conn, sql, params):
+    """Chạy truy vấn với cursor trả tuple. Trả về (danh sách tên cột, danh sách tuple)."""
+    with conn.cursor(pymysql.cursors.Cursor) as cursor:
+        cursor.execute(sql, tuple(params))
+        return [d[0] for d in cursor.description], cursor.fetchall()
+
+
+def negotiate(accept=None, format=None):
+    """Chọn định dạng body /reports: "rows", "columnar" hoặc "arrow".
+
+    ?format= được ưu tiên; nếu không thì theo header Accept (q cao trước, cùng q thì
+    theo thứ tự). Trả None nếu client chỉ chấp nhận định dạng không phục vụ được (406).
+    """
+    if format:
+        if format not in MEDIA_TYPES or (format == "arrow" and not ARROW_AVAILABLE):
+            return None
+        return format
+    if not accept:
+        return "rows"
+    ranked = []
+    for position, item in enumerate(accept.split(",")):
+        media, *options = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for option in options:
+            if option.startswith("q="):
+                try:
+                    q = float(option[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranked.append((-q, position, media.lower()))
+    for _, _, media in sorted(ranked):
+        if media == ARROW_MEDIA_TYPE and ARROW_AVAILABLE:
+            return "arrow"
+        if media == COLUMNAR_MEDIA_TYPE:
+            return "columnar"
+        if media in (ROWS_MEDIA_TYPE, "application/*", "*/*"):
+            return "rows"
+    return None
+
+
+def _next_cursor(columns, rows, limit):
+    # Trang đầy thì có thể còn dữ liệu: trả cursor trỏ tới dòng cuối
+    if not rows or len(rows) != limit:
+        return None
+    last = rows[-1]
+    return report_queries.encode_cursor(
+        last[columns.index('date')], last[columns.index('print_time')], last[columns.index('id')]
+    )
+
+
+def render(format, columns, rows, limit):
+    """Body /reports theo định dạng đã chọn bằng negotiate."""
+    if format == "columnar":
+        return reports_columnar_json(columns, rows, limit)
+    if format == "arrow":
+        return reports_arrow(columns, rows, limit)
+    return reports_json(columns, rows, limit)
+
+
+def reports_json(columns, rows, limit):
+    """Body JSON của /reports: mỗi dòng là object các cột + `hour` (= print_time)."""
+    keys = columns + ['hour']
+    pt = columns.index('print_time')
+    data = [dict(zip(keys, row + (row[pt],))) for row in rows]
+    next_cursor = _next_cursor(columns, rows, limit)
+    return orjson.dumps({
+        "success": True,
+        "data": data,
+        "total": len(data),
+        "next_cursor": next_cursor,
+    })
+
+
+def _dictionary_encode(values):
+    index = {}
+    codes = [index.setdefault(v, len(index)) for v in values]
+    return {"dictionary": list(index), "codes": codes}
+
+
+def reports_columnar_json(columns, rows, limit):
+    """JSON theo cột: `data` là {cột: [giá trị]}; cột trong DICT_COLUMNS là
+    {"dictionary": [...], "codes": [...]} (giá trị dòng i = dictionary[codes[i]]).
+
+    Không gửi cột `hour` (bằng print_time), client tự thêm khi dựng lại dòng.
+    """
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    data = {
+        name: _dictionary_encode(col) if name in DICT_COLUMNS else list(col)
+        for name, col in zip(columns, values)
+    }
+    return orjson.dumps({
+        "success": True,
+        "format": "columnar",
+        "columns": columns,
+        "data": data,
+        "total": len(rows),
+        "next_cursor": _next_cursor(columns, rows, limit),
+    })
+
+
+def reports_arrow(columns, rows, limit):
+    """Arrow IPC stream (một record batch); cột chuỗi dạng dictionary, date là date32.
+
+    total và next_cursor nằm trong metadata của schema.
+    """
+    import pyarrow as pa
+
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    arrays = []
+    for name, col in zip(columns, values):
+        if name in DICT_COLUMNS and name != 'date':
+            arrays.append(pa.array(col, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(col))
+    next_cursor = _next_cursor(columns, rows, limit)
+    table = pa.Table.from_arrays(arrays, names=columns).replace_schema_metadata({
+        "total": str(len(rows)), "next_cursor": next_cursor or "",
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def export_frame(columns, rows):
+    """DataFrame dữ liệu export: thêm cột hour, date dạng chuỗi YYYY-MM-DD."""
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    if df.empty:
+        return df
+    df['hour'] = df['print_time']
+    # Số ngày khác nhau rất ít so với số dòng: định dạng mỗi ngày một lần rồi map
+    dates = df['date'].dropna().unique()
+    df['date'] = df['date'].map({d: d.strftime('%Y-%m-%d') if hasattr(d, 'strftime') else d for d in dates})
+    return df
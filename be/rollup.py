@@ -0,0 +1,370 @@
+"""Bảng tổng hợp sẵn (rollup) cho bảng reports, cập nhật tăng dần theo reports.id.
+
+Mỗi bảng rollup giữ số lượt in (prints = số dòng, total_count = tổng count có trọng số)
+theo ward/city/ngày và một chiều dữ liệu (giờ, lĩnh vực, thủ tục, xác thực, tuổi × giới tính).
+Chỉ các dòng trong giờ làm việc (BUSINESS_HOURS) và có ngày được đưa vào rollup.
+Giá trị NULL của các chiều chuỗi được lưu thành '' kèm cột cờ <chiều>_null = 1: dashboard coi
+hai giá trị như nhau, còn export (như pandas groupby) bỏ qua NULL nhưng giữ ''.
+
+Watermark chỉ vượt qua một id khi id đó đã "ổn định" (SettledId): InnoDB cấp id theo thứ
+tự INSERT chứ không theo thứ tự commit, nên lúc đọc MAX(id) = M vẫn có thể còn giao dịch
+giữ id < M chưa commit. ROLLUP_SETTLE_SECONDS phải lớn hơn giao dịch ghi reports dài nhất.
+
+Dùng từ dòng lệnh:
+
+    python rollup.py refresh   # cập nhật phần dữ liệu mới từ watermark
+    python rollup.py rebuild   # xoá và dựng lại toàn bộ
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import pymysql
+
+from db import db_connection
+from report_queries import BUSINESS_HOURS, COUNT_EXPR, RAW, Source, SplitSource, report_filter
+
+REFRESH_INTERVAL = float(os.getenv("ROLLUP_REFRESH_INTERVAL", 60))  # 0 = tắt cập nhật nền
+BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", 50000))
+MIN_REFRESH_GAP = float(os.getenv("ROLLUP_MIN_REFRESH_GAP", 1))   # giây tối thiểu giữa 2 lần refresh
+SETTLE_SECONDS = float(os.getenv("ROLLUP_SETTLE_SECONDS", 30))    # giây chờ trước khi coi một MAX(id) là đủ
+
+STATE_TABLE = "rollup_state"
+STATE_NAME = "reports"
+
+def _text_dim(name, length):
+    # Cột chuỗi (NULL -> '') và cờ NULL, cả hai nằm trong khoá chính
+    return [
+        (name, f"varchar({length}) COLLATE utf8mb4_bin NOT NULL", f"COALESCE(r.{name}, '')"),
+        (f"{name}_null", "tinyint(1) NOT NULL", f"CASE WHEN r.{name} IS NULL THEN 1 ELSE 0 END"),
+    ]
+
+
+# kind -> (tên bảng, các cột chiều [(tên cột, kiểu, biểu thức nguồn)])
+ROLLUPS = {
+    "daily": ("report_rollup_daily", []),
+    "hourly": ("report_rollup_hourly", [
+        ("print_time", "int(11) NOT NULL", "r.print_time"),
+    ]),
+    "domain": ("report_rollup_domain", _text_dim("domain", 255)),
+    "procedure": ("report_rollup_procedure", _text_dim("procedure", 255)),
+    "auth_type": ("report_rollup_auth_type", _text_dim("auth_type", 32)),
+    "age_gender": ("report_rollup_age_gender", _text_dim("age_group", 16) + _text_dim("gender", 8)),
+}
+# Cột có từ khi tách NULL khỏi '': bảng rollup cũ không có thì được dựng lại
+NULL_FLAG = ("report_rollup_domain", "domain_null")
+
+# Nguồn dữ liệu cho report_queries: đọc các bảng rollup thay vì quét reports
+ROLLUP = Source(
+    {kind: table for kind, (table, _) in ROLLUPS.items()},
+    "SUM(r.total_count)",
+    business_hours=False,
+)
+
+
+def max_report_id(cursor):
+    cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM reports")
+    return cursor.fetchone()['max_id']
+
+
+class SettledId:
+    """id lớn nhất của reports mà mọi id nhỏ hơn đã commit (hoặc rollback) xong.
+
+    Một MAX(id) = M nhìn thấy lúc t thì mọi id <= M đã được cấp trước t; sau `settle` giây
+    các giao dịch giữ chúng đã kết thúc, nên watermark theo id (rollup, replica, live) chỉ
+    được tiến tới M từ lúc đó. Mỗi process/thread giữ một bộ đếm riêng.
+    """
+
+    def __init__(self, settle=SETTLE_SECONDS):
+        self.settle = settle
+        self.value = 0
+        self.ready = False     # đã có ít nhất một lần quan sát đủ cũ
+        self._seen = deque()   # (time.monotonic(), MAX(id)) tăng dần
+
+    def observe(self, max_id):
+        """Ghi nhận MAX(id) vừa đọc, trả về id đã ổn định lớn nhất."""
+        now = time.monotonic()
+        if not self._seen or max_id > self._seen[-1][1]:
+            self._seen.append((now, max_id))
+        while self._seen and now - self._seen[0][0] >= self.settle:
+            self.value = max(self.value, self._seen.popleft()[1])
+            self.ready = True
+        return self.value
+
+
+settled = SettledId()
+
+
+def settle(conn):
+    """Đọc MAX(id), chờ SETTLE_SECONDS rồi trả về id đó (dùng cho lệnh chạy một lần)."""
+    with conn.cursor() as cursor:
+        max_id = max_report_id(cursor)
+    conn.commit()
+    if SETTLE_SECONDS > 0:
+        print(f"Chờ {SETTLE_SECONDS:g}s để các giao dịch ghi reports tới id {max_id} kết thúc...")
+        time.sleep(SETTLE_SECONDS)
+    return max_id
+
+
+def _create_table_sql(table, dims):
+    dim_defs = "".join(f"  `{name}` {ddl},\n" for name, ddl, _ in dims)
+    dim_keys = "".join(f", `{name}`" for name, _, _ in dims)
+    return f"""
+        CREATE TABLE IF NOT EXISTS `{table}` (
+          `ward_id` int(11) NOT NULL,
+          `city_id` int(11) NOT NULL,
+          `date` date NOT NULL,
+        {dim_defs}  `prints` int(11) NOT NULL DEFAULT 0,
+          `total_count` int(11) NOT NULL DEFAULT 0,
+          PRIMARY KEY (`ward_id`, `date`{dim_keys}, `city_id`),
+          KEY `city_date` (`city_id`, `date`),
+          KEY `date` (`date`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """
+
+
+def _refresh_sql(table, dims):
+    dim_cols = "".join(f", `{name}`" for name, _, _ in dims)
+    dim_exprs = "".join(f", {expr}" for _, _, expr in dims)
+    group_by = ", ".join(str(i) for i in range(1, 4 + len(dims)))
+    return f"""
+        INSERT INTO `{table}` (`ward_id`, `city_id`, `date`{dim_cols}, `prints`, `total_count`)
+        SELECT COALESCE(r.ward_id, 0), COALESCE(r.city_id, 0), r.date{dim_exprs}, COUNT(*), SUM({COUNT_EXPR})
+        FROM reports r
+        WHERE r.id > %s AND r.id <= %s
+          AND r.date IS NOT NULL
+          AND r.print_time BETWEEN %s AND %s
+        GROUP BY {group_by}
+        ON DUPLICATE KEY UPDATE
+          `prints` = `{table}`.`prints` + VALUES(`prints`),
+          `total_count` = `{table}`.`total_count` + VALUES(`total_count`)
+    """
+
+
+def _upgrade(cursor):
+    # Bảng rollup cũ gộp NULL với '': xoá đi để dựng lại từ đầu (watermark về 0).
+    # GET_LOCK giữ qua các lệnh DDL (tự commit) nên chỉ một worker làm việc này.
+    table, column = NULL_FLAG
+    cursor.execute("SELECT GET_LOCK('rollup_upgrade', 60) AS locked")
+    try:
+        cursor.execute("SELECT COUNT(*) AS n FROM information_schema.tables "
+                       "WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+        exists = cursor.fetchone()['n']
+        cursor.execute("SELECT COUNT(*) AS n FROM information_schema.columns "
+                       "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s", (table, column))
+        if not exists or cursor.fetchone()['n']:
+            return
+        print("Rollup: schema cũ (NULL gộp với ''), dựng lại rollup")
+        for name, _ in ROLLUPS.values():
+            cursor.execute(f"DROP TABLE IF EXISTS `{name}`")
+        cursor.execute(f"UPDATE `{STATE_TABLE}` SET last_report_id = 0 WHERE name = %s", (STATE_NAME,))
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('rollup_upgrade')")
+
+
+def ensure_schema(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS `{STATE_TABLE}` (
+              `name` varchar(64) NOT NULL,
+              `last_report_id` int(11) NOT NULL DEFAULT 0,
+              `refreshed_at` datetime DEFAULT NULL,
+              PRIMARY KEY (`name`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        _upgrade(cursor)
+        for table, dims in ROLLUPS.values():
+            cursor.execute(_create_table_sql(table, dims))
+        cursor.execute(
+            f"INSERT IGNORE INTO `{STATE_TABLE}` (`name`, `last_report_id`) VALUES (%s, 0)",
+            (STATE_NAME,)
+        )
+    conn.commit()
+
+
+def refresh(conn, upto=None, batch_size=BATCH_SIZE):
+    """Cộng dồn các dòng reports có watermark < id <= upto vào rollup. Trả về watermark mới.
+
+    upto=None: id đã ổn định theo các lần gọi trước trong process (settled); gọi khi không
+    có ghi đồng thời (dựng dữ liệu, kiểm tra) thì truyền max_report_id().
+    Mỗi lô batch_size id là một transaction (cộng dồn + watermark cùng commit): undo và khoá
+    trên bảng rollup giới hạn theo lô, worker khác chỉ phải chờ một lô.
+    """
+    if upto is None:
+        with conn.cursor() as cursor:
+            upto = settled.observe(max_report_id(cursor))
+        conn.commit()
+    while True:
+        with conn.cursor() as cursor:
+            # Khoá dòng trạng thái để nhiều worker không cộng trùng cùng một khoảng id
+            cursor.execute(
+                f"SELECT last_report_id FROM `{STATE_TABLE}` WHERE name = %s FOR UPDATE",
+                (STATE_NAME,)
+            )
+            last_id = cursor.fetchone()['last_report_id']
+            if last_id >= upto:
+                break
+            batch_end = min(last_id + batch_size, upto)
+            for table, dims in ROLLUPS.values():
+                cursor.execute(_refresh_sql(table, dims), (last_id, batch_end, *BUSINESS_HOURS))
+            cursor.execute(
+                f"UPDATE `{STATE_TABLE}` SET last_report_id = %s, refreshed_at = UTC_TIMESTAMP() WHERE name = %s",
+                (batch_end, STATE_NAME)
+            )
+        conn.commit()
+    conn.commit()
+    return last_id
+
+
+def rebuild(conn, upto=None):
+    """Xoá toàn bộ rollup và tổng hợp lại từ đầu (tới upto, xem refresh)."""
+    ensure_schema(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT 1 FROM `{STATE_TABLE}` WHERE name = %s FOR UPDATE", (STATE_NAME,))
+        for table, _ in ROLLUPS.values():
+            cursor.execute(f"DELETE FROM `{table}`")
+        cursor.execute(f"UPDATE `{STATE_TABLE}` SET last_report_id = 0 WHERE name = %s", (STATE_NAME,))
+    conn.commit()
+    return refresh(conn, upto)
+
+
+def watermark(cursor):
+    """reports.id lớn nhất đã được tổng hợp, None nếu chưa có rollup."""
+    try:
+        cursor.execute(f"SELECT last_report_id FROM `{STATE_TABLE}` WHERE name = %s", (STATE_NAME,))
+    except pymysql.err.ProgrammingError:
+        return None
+    row = cursor.fetchone()
+    return row['last_report_id'] if row else None
+
+
+def is_current(cursor):
+    """Rollup đã bao phủ toàn bộ reports (không còn dòng nào sau watermark).
+
+    Khi đang ingest liên tục điều này gần như không bao giờ đúng; API dùng source_for.
+    """
+    last_id = watermark(cursor)
+    if last_id is None:
+        return False
+    return last_id >= max_report_id(cursor)
+
+
+def source_for(cursor, user, ward_id=None, start_date=None, end_date=None):
+    """Nguồn tổng hợp cho phạm vi quyền và khoảng ngày, quyết định theo từng khoảng.
+
+    ROLLUP khi không còn dòng nào (thuộc phạm vi, trong khoảng ngày) sau watermark; ngược
+    lại rollup cho các ngày trước ngày nhỏ nhất của các dòng đó và bảng gốc từ ngày đó
+    (SplitSource). Phần bảng gốc không bao giờ gồm tháng đã archive (ingest vào tháng
+    đã archive bị từ chối), nên kết quả luôn có cả dữ liệu archive như rollup. Chưa có
+    rollup: bảng gốc.
+    """
+    last_id = watermark(cursor)
+    if last_id is None:
+        return RAW
+    where, params = report_filter(user, ward_id, start_date, end_date)
+    cursor.execute(f"SELECT MIN(r.date) AS first FROM reports r WHERE r.id > %s AND {where}", [last_id, *params])
+    first = cursor.fetchone()['first']
+    if first is None:
+        return ROLLUP
+    return SplitSource(ROLLUP, RAW, first)
+
+
+def covers(cursor, user, ward_id=None, start_date=None, end_date=None):
+    """Rollup đã có mọi dòng của phạm vi/khoảng ngày (xem source_for)."""
+    return source_for(cursor, user, ward_id, start_date, end_date) is ROLLUP
+
+
+def export_counts(cursor, where, params):
+    """Các Series đếm số dòng dùng cho export_sheets.build_sheets, đọc từ rollup."""
+    import pandas as pd
+
+    def series(kind, columns, names, value="SUM(r.prints)", text=True):
+        table = ROLLUPS[kind][0]
+        select = ", ".join(columns)
+        # pandas groupby bỏ qua các khoá NULL (cờ _null), còn '' là một nhóm như mọi giá trị khác
+        not_null = "".join(f" AND {c}_null = 0" for c in columns) if text else ""
+        cursor.execute(f"""
+            SELECT {select}, {value} AS n
+            FROM `{table}` r
+            WHERE {where}{not_null}
+            GROUP BY {select}
+        """, params)
+        rows = cursor.fetchall()
+        if len(names) == 1:
+            index = pd.Index([row[names[0]] for row in rows], name=names[0])
+        else:
+            index = pd.MultiIndex.from_tuples([tuple(row[n] for n in names) for row in rows], names=names)
+        return pd.Series([int(row['n']) for row in rows], index=index, dtype='int64').sort_index()
+
+    date_counts = series("daily", ["r.date"], ["date"], text=False)
+    date_counts.index = pd.Index([d.strftime('%Y-%m-%d') for d in date_counts.index], name='date')
+    return {
+        'date': date_counts,
+        'hour': series("hourly", ["r.print_time"], ["print_time"], text=False).rename_axis('hour'),
+        'hour_days': series("hourly", ["r.print_time"], ["print_time"], "COUNT(DISTINCT r.date)",
+                            text=False).rename_axis('hour'),
+        'domain': series("domain", ["r.domain"], ["domain"]),
+        'procedure': series("procedure", ["r.procedure"], ["procedure"]),
+        'age_gender': series("age_gender", ["r.age_group", "r.gender"], ["age_group", "gender"]),
+        'auth_type': series("auth_type", ["r.auth_type"], ["auth_type"]),
+    }
+
+
+_wake = threading.Event()
+# Hàm gọi sau mỗi lần refresh nền, cùng connection (distributions dựng lại sketch)
+_after_refresh = []
+
+
+def after_refresh(fn):
+    _after_refresh.append(fn)
+
+
+def request_refresh():
+    """Báo thread nền refresh sớm (ví dụ sau khi ingest dữ liệu mới), không chờ hết interval."""
+    _wake.set()
+
+
+def _refresh_loop(stop, interval):
+    try:
+        with db_connection() as conn:
+            ensure_schema(conn)
+    except Exception as e:
+        print(f"Rollup schema error: {e}")
+    while True:
+        _wake.wait(interval)
+        # Gom các lần ingest liên tiếp vào một lần refresh
+        if stop.wait(MIN_REFRESH_GAP):
+            return
+        _wake.clear()
+        try:
+            with db_connection() as conn:
+                refresh(conn)
+                for fn in _after_refresh:
+                    try:
+                        fn(conn)
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"Rollup after-refresh error ({fn.__module__}): {e}")
+        except Exception as e:
+            print(f"Rollup refresh error: {e}")
+
+
+def start_background_refresh(interval=REFRESH_INTERVAL):
+    """Chạy refresh định kỳ trên thread nền. Trả về Event để dừng."""
+    stop = threading.Event()
+    if interval > 0:
+        threading.Thread(target=_refresh_loop, args=(stop, interval), daemon=True, name="rollup-refresh").start()
+    return stop
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "refresh"
+    if command not in ("refresh", "rebuild"):
+        sys.exit("Cách dùng: python rollup.py [refresh|rebuild]")
+    with db_connection() as conn:
+        ensure_schema(conn)
+        upto = settle(conn)
+        last_id = rebuild(conn, upto) if command == "rebuild" else refresh(conn, upto)
+    print(f"Rollup {command} xong, watermark reports.id = {last_id}")
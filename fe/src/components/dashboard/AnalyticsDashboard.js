@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useMemo } from 'react';
 import { Row, Col, Typography, Card, Alert, Spin } from 'antd';
 import DashboardControls from './controls/DashboardControls';
 import TimeSeriesChart from './charts/TimeSeriesChart';
@@ -10,15 +10,7 @@ import FieldFrequencyChart from './charts/FieldFrequencyChart';
 import BoxPlotChart from './charts/BoxPlotChart';
 import AgeGenderDistChart from './charts/AgeGenderDistChart';
 import { 
-  getPrintsByTimeData, 
-  getDomainData, 
-  getHourlyData,
-  getWeekdayData,
-  getBoxPlotData,
-  getTopProcedures,
-  getAuthTypeData,
   getGenderData,
-  getAgeGenderDistribution,
   getScatterData,
   filterDashboardData
 } from '../../utils/dataProcessing';
@@ -28,6 +20,8 @@ const { Title } = Typography;
 
 const AnalyticsDashboard = ({ 
   filteredData: rawFilteredData = [],
+  summary = {},
+  dailyCounts = [],
   dateRange, 
   setDateRange, 
   groupBy = 'Ngày',
@@ -37,83 +31,42 @@ const AnalyticsDashboard = ({
   loading = false,
   wardId
 }) => {
-  // Sửa: Lọc dữ liệu theo wardId đúng kiểu (số hoặc chuỗi)
+  // Dòng thô (mới nhất, giới hạn) chỉ còn dùng cho biểu đồ giới tính và scatter
   const filteredData = useMemo(() => {
     if (!dateRange || !dateRange[0] || !dateRange[1]) {
-      // Không lọc theo ngày, trả về toàn bộ dữ liệu cho wardId
       return rawFilteredData.filter(item => 
         !wardId || String(item.ward_id ?? item.wardId) === String(wardId)
       );
     }
-    // Đã chọn ngày, lọc theo khoảng ngày
     return filterDashboardData(rawFilteredData, wardId, dateRange);
   }, [rawFilteredData, wardId, dateRange]);
 
-  const [processedData, setProcessedData] = useState(null);
-  const [processingStatus, setProcessingStatus] = useState('loading');
-
-  useEffect(() => {
-    if (!filteredData?.length) return;
-
-    setProcessingStatus('processing');
-    try {
-      console.log('[AnalyticsDashboard] filteredData:', filteredData); // Thêm log đầu vào
-
-      const scatterData = getScatterData(filteredData);
-      console.log('[AnalyticsDashboard] scatterData:', scatterData); // Thêm log đầu ra
-
-      const data = {
-        printsByTimeData: getPrintsByTimeData(filteredData, groupBy),
-        hourlyData: getHourlyData(filteredData),
-        domainData: getDomainData(filteredData),
-        topProceduresData: getTopProcedures(filteredData, topK),
-        authTypeData: getAuthTypeData(filteredData),
-        genderData: getGenderData(filteredData),
-        ageGenderData: getAgeGenderDistribution(filteredData),
-        scatterData
-      };
-
-      // Log the data
-      console.log('Auth Type Data:', data.authTypeData);
-      console.log('Gender Data:', data.genderData);
-
-      setProcessedData(data);
-      setProcessingStatus('complete');
-    } catch (error) {
-      console.error('Error processing data:', error);
-      setProcessingStatus('error');
-    }
-  }, [filteredData, groupBy, topK]);
-
-  // Show loading state
-  if (loading || processingStatus === 'loading' || processingStatus === 'processing') {
+  // Các bảng tổng hợp đã tính trên server (/reports/summary) theo ward, khoảng ngày, groupBy, topK
+  const data = useMemo(() => {
+    const orEmpty = (items) => (items && items.length ? items : [{ name: 'Không có dữ liệu', value: 0 }]);
+    return {
+      printsByTimeData: summary['by-time'] || [],
+      hourlyData: summary.hourly || [],
+      domainData: orEmpty(summary.domains),
+      topProceduresData: orEmpty(summary['top-procedures']),
+      authTypeData: orEmpty(summary['auth-types']),
+      ageGenderData: summary['age-gender'] || [],
+      genderData: orEmpty(getGenderData(filteredData)),
+      scatterData: getScatterData(filteredData)
+    };
+  }, [summary, filteredData]);
+
+  // Chỉ che dashboard ở lần tải đầu; đổi bộ lọc thì giữ biểu đồ cũ tới khi có số liệu mới
+  if (loading && !summary['by-time']) {
     return (
       <div style={{ textAlign: 'center', padding: '50px' }}>
         <Spin size="large" />
-        <div style={{ marginTop: 16 }}>
-          {processingStatus === 'processing' ? 'Đang xử lý dữ liệu...' : 'Đang tải dữ liệu...'}
-        </div>
+        <div style={{ marginTop: 16 }}>Đang tải dữ liệu...</div>
       </div>
     );
   }
 
-  // Handle no data case - removed early return and replaced with empty data
-  const emptyData = {
-    printsByTimeData: [],
-    hourlyData: Array(24).fill({ hour: 0, count: 0 }), 
-    domainData: [{ name: 'Không có dữ liệu', value: 0 }],
-    topProceduresData: [{ name: 'Không có dữ liệu', value: 0 }],
-    authTypeData: [{ name: 'Không có dữ liệu', value: 0 }],
-    genderData: [{ name: 'Không có dữ liệu', value: 0 }],
-    ageGenderData: [],
-    scatterData: []
-  };
-
-  const data = filteredData?.length > 0 ? processedData : emptyData;
-
   try {
-    console.log('Processed data:', processedData);
-
     return (
       <>
         {/* Dashboard Analytics từ notebook */}
@@ -139,7 +92,7 @@ const AnalyticsDashboard = ({
             <HourlyTrendChart data={data.hourlyData} groupBy={groupBy} />
           </Col>
           <Col span={12}>
-            <BoxPlotChart data={filteredData || []} groupBy={groupBy} />
+            <BoxPlotChart data={dailyCounts} groupBy={groupBy} />
           </Col>
         </Row>
 
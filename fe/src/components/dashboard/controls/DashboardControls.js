@@ -1,15 +1,7 @@
-import React, { useEffect, useState, useMemo } from 'react';
+import React from 'react';
 import { Card, Row, Col, Space, DatePicker, Select, Button, message } from 'antd';
 import { CalendarOutlined, DownloadOutlined } from '@ant-design/icons';
 import dayjs from 'dayjs';
-import {
-  getPrintsByTimeData,
-  getDomainData,
-  getTopProcedures,
-  getHourlyData,
-  getAgeGenderDistribution,
-  getAuthTypeData
-} from '../../../utils/dataProcessing'; 
 import api from '../../../services/api'; // Đảm bảo đã có api.js
 
 const { RangePicker } = DatePicker;
@@ -20,7 +12,6 @@ const DashboardControls = ({
   setDateRange,
   groupBy,
   setGroupBy,
-  filteredData: filteredDataProp,
   wardId // nhận wardId từ props
 }) => {
   // Không ràng buộc chọn ngày, cho phép chọn bất kỳ ngày nào
@@ -33,142 +24,6 @@ const DashboardControls = ({
 
   const [exportFormat, setExportFormat] = React.useState('xlsx');
 
-  // State để lưu dữ liệu thực tế từ API
-  const [filteredData, setFilteredData] = useState([]);
-
-  // Lấy dữ liệu thực tế từ API khi component mount hoặc khi dateRange thay đổi
-  useEffect(() => {
-    // Nếu đã truyền filteredData từ cha thì ưu tiên dùng
-    if (filteredDataProp && filteredDataProp.length > 0) {
-      setFilteredData(filteredDataProp);
-      return;
-    }
-    // Nếu không, tự fetch dữ liệu từ API (ví dụ)
-    const fetchData = async () => {
-      try {
-        // Gọi API lấy dữ liệu, có thể truyền limit/offset hoặc filter theo dateRange nếu backend hỗ trợ
-        const res = await api.get('/reports');
-        if (res.data && Array.isArray(res.data.data)) {
-          setFilteredData(res.data.data);
-        } else {
-          setFilteredData([]);
-        }
-      } catch (err) {
-        setFilteredData([]);
-      }
-    };
-    fetchData();
-  }, [filteredDataProp, dateRange]);
-
-  // Helper: build all report tables
-  const buildReportTables = () => {
-    // Chuẩn hóa dữ liệu: loại bỏ các trường bắt đầu bằng dấu chấm (.)
-    const normalizeData = (arr) => {
-      if (!Array.isArray(arr)) return [];
-      return arr.map(obj => {
-        const newObj = {};
-        Object.keys(obj).forEach(key => {
-          if (!key.startsWith('.')) {
-            newObj[key] = obj[key];
-          }
-        });
-        return newObj;
-      });
-    };
-
-    // Lọc dữ liệu theo khoảng ngày được chọn
-    let filteredByDate = filteredData;
-    if (
-      dateRange &&
-      dateRange[0] &&
-      dateRange[1]
-    ) {
-      const startDate = dayjs(dateRange[0]).format('YYYY-MM-DD');
-      const endDate = dayjs(dateRange[1]).format('YYYY-MM-DD');
-      filteredByDate = filteredData.filter(item => {
-        let itemDate = item.date ?? item['Ngày'];
-        if (itemDate instanceof Date) {
-          itemDate = dayjs(itemDate).format('YYYY-MM-DD');
-        } else {
-          itemDate = dayjs(itemDate).format('YYYY-MM-DD');
-        }
-        return itemDate >= startDate && itemDate <= endDate;
-      });
-    }
-
-    // Data sheet
-    const dataSheet = normalizeData(filteredByDate || []);
-
-    // Số lượt in theo ngày/tuần
-    const rawSoLuotIn = getPrintsByTimeData(filteredByDate, groupBy).map(row => ({
-      ...(groupBy === 'Tuần'
-        ? { 'Tuần': row.time, 'Từ': row.weekStart, 'Đến': row.weekEnd }
-        : { 'Ngày': row.time }),
-      'Số lượt in': row.count
-    }));
-    console.log('[Export] rawSoLuotIn:', rawSoLuotIn);
-    const soLuotIn = normalizeData(rawSoLuotIn);
-
-    // Lĩnh vực
-    const rawLinhVuc = getDomainData(filteredByDate).map(row => ({
-      'Lĩnh vực': row.name,
-      'Tần suất': row.value
-    }));
-    console.log('[Export] rawLinhVuc:', rawLinhVuc);
-    const linhVuc = normalizeData(rawLinhVuc);
-
-    // Top thủ tục
-    const rawTopThuTuc = getTopProcedures(filteredByDate, 8).map(row => ({
-      'Tên thủ tục': row.name,
-      'Tần suất': row.value
-    }));
-    console.log('[Export] rawTopThuTuc:', rawTopThuTuc);
-    const topThuTuc = normalizeData(rawTopThuTuc);
-
-    // In theo giờ
-    const rawInTheoGio = getHourlyData(filteredByDate).map(row => ({
-      'Giờ': row.hour,
-      'Trung bình': row.count,
-      'Tổng số lượt': row.totalCount,
-      'Số ngày có in': row.activeDays
-    }));
-    console.log('[Export] rawInTheoGio:', rawInTheoGio);
-    const inTheoGio = normalizeData(rawInTheoGio);
-
-    // Tuổi & Giới tính
-    const tuoiGioiTinhArr = getAgeGenderDistribution(filteredByDate);
-    console.log('[Export] rawTuoiGioiTinh:', tuoiGioiTinhArr);
-    const tuoiGioiTinh = tuoiGioiTinhArr.length > 0
-      ? normalizeData(tuoiGioiTinhArr.map(row => ({
-          'Nhóm tuổi': row.ageRange,
-          'Nam': row.male,
-          'Nữ': row.female,
-          'Tổng': row.total
-        })))
-      : null;
-
-    // Xác thực
-    const xacThucArr = getAuthTypeData(filteredByDate);
-    console.log('[Export] rawXacThuc:', xacThucArr);
-    const xacThuc = xacThucArr.length > 0
-      ? normalizeData(xacThucArr.map(row => ({
-          'Loại xác thực': row.name,
-          'Số lượng': row.value,
-          'Tỷ lệ (%)': row.percent
-        })))
-      : null;
-
-    return {
-      dataSheet,
-      soLuotIn,
-      linhVuc,
-      topThuTuc,
-      inTheoGio,
-      tuoiGioiTinh,
-      xacThuc
-    };
-  };
-
   // Export handler
   const handleExportReport = async () => {
     try {
@@ -1,80 +1,83 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { message } from 'antd';
-import dayjs from 'dayjs';
+import { decodeColumnarReports } from '../utils/dataProcessing';
 
-export const useDashboardData = (wardId) => {
+// Các bảng tổng hợp của AnalyticsDashboard, tính trên server (/reports/summary)
+export const SUMMARY_NAMES = ['by-time', 'hourly', 'domains', 'top-procedures', 'auth-types', 'age-gender'];
+// Dòng thô chỉ còn cho bảng danh sách, biểu đồ giới tính và scatter (cần từng dòng)
+const RAW_LIMIT = 1000;
+
+const summaryParams = (wardId, dateRange, extra) => {
+	const params = { ward_id: wardId, ...extra };
+	if (dateRange && dateRange[0] && dateRange[1]) {
+		params.start_date = dateRange[0].format('YYYY-MM-DD');
+		params.end_date = dateRange[1].format('YYYY-MM-DD');
+	}
+	return params;
+};
+
+export const useDashboardData = (wardId, { dateRange = null, groupBy = 'Ngày', topK = 5 } = {}) => {
 	const [reports, setReports] = useState([]);
-	const [loading, setLoading] = useState(true);
+	const [summary, setSummary] = useState({});
+	const [dailyCounts, setDailyCounts] = useState([]);
+	const [loadingReports, setLoadingReports] = useState(true);
+	const [loadingSummary, setLoadingSummary] = useState(true);
 	const [error, setError] = useState(null);
 
-	// Tính toán reportStats từ reports
+	const wardReports = reports.filter(r => r.ward_id === wardId);
 	const reportStats = {
-		total: reports.filter(r => r.ward_id === wardId).length,
-		totalCount: reports
-			.filter(r => r.ward_id === wardId)
-			.reduce((sum, report) => sum + (report.count || 0), 0),
-		byProcedure: reports
-			.filter(r => r.ward_id === wardId)
-			.reduce((acc, report) => {
-				acc[report.procedure] = (acc[report.procedure] || 0) + (report.count || 1);
-				return acc;
-			}, {}),
-		byGender: reports
-			.filter(r => r.ward_id === wardId)
-			.reduce((acc, report) => {
-				acc[report.gender] = (acc[report.gender] || 0) + (report.count || 1);
-				return acc;
-			}, {}),
+		total: wardReports.length,
+		totalCount: wardReports.reduce((sum, report) => sum + (report.count || 0), 0),
+		byProcedure: wardReports.reduce((acc, report) => {
+			acc[report.procedure] = (acc[report.procedure] || 0) + (report.count || 1);
+			return acc;
+		}, {}),
+		byGender: wardReports.reduce((acc, report) => {
+			acc[report.gender] = (acc[report.gender] || 0) + (report.count || 1);
+			return acc;
+		}, {}),
 	};
 
-	const transformData = (reports) => {
-		if (!Array.isArray(reports)) return [];
-
-		// Log raw data to verify hour values
-		// console.log('Raw reports sample:', reports.slice(0, 5));
-
-		return reports.map(report => {
-			const hour = report.hour || report.print_time;
-			// console.log('Processing hour:', hour, 'for report:', report);
-
-			return {
-				...report,
-				hour: parseInt(hour), // Ensure hour is a number
-				count: report.count || 1,
-				wardId: report.ward_id
-			};
-		}).filter(item => {
-			const validHour = item.hour >= 7 && item.hour <= 17;
-			if (!validHour) {
-				console.warn('Invalid hour:', item.hour, 'for report:', item);
-			}
-			return validHour;
+	// Dòng thô mới nhất (keyset order của /reports), không phụ thuộc bộ lọc ngày
+	const fetchReports = async () => {
+		const response = await axios.get('/reports', {
+			// format=columnar: JSON theo cột, chuỗi lặp lại mã hoá từ điển
+			params: { limit: RAW_LIMIT, format: 'columnar' }
 		});
+		if (!response.data.success) {
+			throw new Error(response.data.message || 'Không thể tải dữ liệu');
+		}
+		setReports(decodeColumnarReports(response.data));
+	};
+
+	const fetchSummary = async () => {
+		const requests = [
+			axios.get('/reports/summary', {
+				params: summaryParams(wardId, dateRange, {
+					include: SUMMARY_NAMES.join(','), group_by: groupBy, top_k: topK
+				})
+			})
+		];
+		// Box plot theo thứ trong tuần cần số lượt in từng ngày kể cả khi xem theo tuần
+		if (groupBy !== 'Ngày') {
+			requests.push(axios.get('/reports/summary/by-time', {
+				params: summaryParams(wardId, dateRange, { group_by: 'Ngày' })
+			}));
+		}
+		const [all, daily] = await Promise.all(requests);
+		setSummary(all.data.data || {});
+		setDailyCounts((daily ? daily.data.data : all.data.data['by-time']) || []);
 	};
 
-	const fetchData = async () => {
+	const run = async (load, setLoading) => {
 		setLoading(true);
 		try {
-			const response = await axios.get('/reports', {
-				params: { limit: 10000, offset: 0 } // Tăng limit để lấy đủ dữ liệu
-			});
-
-			if (!response.data.success) {
-				throw new Error(response.data.message || 'Không thể tải dữ liệu');
-			}
-
-			const rawData = response.data.data || [];
-			// console.log('Raw data sample:', rawData.slice(0, 5));
-
-			setReports(rawData);
-			return rawData;
-
+			await load();
+			setError(null);
 		} catch (error) {
-			// console.error('Error fetching data:', error);
 			message.error(`Lỗi: ${error.message}`);
 			setError(error.message);
-			return [];
 		} finally {
 			setLoading(false);
 		}
@@ -82,15 +85,24 @@ export const useDashboardData = (wardId) => {
 
 	useEffect(() => {
 		if (wardId) {
-			fetchData();
+			run(fetchReports, setLoadingReports);
 		}
 	}, [wardId]);
 
+	useEffect(() => {
+		if (wardId) {
+			run(fetchSummary, setLoadingSummary);
+		}
+	}, [wardId, dateRange, groupBy, topK]);
+
 	return {
-		dashboardData: reports, // Return transformed reports directly
-		reports: reports.filter(r => r.ward_id === wardId),
+		dashboardData: reports,
+		reports: wardReports,
+		summary,
+		// { time: 'YYYY-MM-DD', count } theo ngày, đổi sang dạng dòng { date, count } cho BoxPlotChart
+		dailyCounts: dailyCounts.map(item => ({ date: item.time, count: item.count })),
 		reportStats,
-		loading,
+		loading: loadingReports || loadingSummary,
 		error,
 	};
-};
\ No newline at end of file
+};
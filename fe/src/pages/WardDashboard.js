@@ -44,11 +44,12 @@ const WardDashboard = () => {
   const {
     dashboardData,
     reports: wardReports,
-    metadata,
+    summary,
+    dailyCounts,
     loading,
     error,
     reportStats
-  } = useDashboardData(wardId);
+  } = useDashboardData(wardId, { dateRange, groupBy, topK });
 
   useEffect(() => {
     // Sửa: Luôn lọc dữ liệu cho đúng wardId, không lấy toàn bộ dashboardData
@@ -173,6 +174,8 @@ const WardDashboard = () => {
           {selectedMenuItem === 'reports' && (
             <AnalyticsDashboard 
               filteredData={filteredData}
+              summary={summary}
+              dailyCounts={dailyCounts}
               dateRange={dateRange}
               setDateRange={setDateRange}
               groupBy={groupBy}
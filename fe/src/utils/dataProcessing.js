@@ -380,4 +380,22 @@ export const getScatterData = (filteredData) => {
 // Không cần sửa gì ở đây nếu filteredData là dữ liệu thực tế
 
 // getScatterData sẽ random giá trị tuổi nếu chỉ có age_group mà không có age cụ thể.
-// Nếu đã có age, dữ liệu không bị random.
\ No newline at end of file
+// Nếu đã có age, dữ liệu không bị random.
+// Dựng lại danh sách dòng từ response /reports?format=columnar
+// (cột chuỗi gửi dạng { dictionary, codes }, không có cột hour = print_time)
+export const decodeColumnarReports = (payload) => {
+  const { columns = [], data = {} } = payload || {};
+  const decoded = columns.map(name => {
+    const col = data[name];
+    return Array.isArray(col) ? col : col.codes.map(code => col.dictionary[code]);
+  });
+  const total = decoded.length ? decoded[0].length : 0;
+  const rows = new Array(total);
+  for (let i = 0; i < total; i++) {
+    const row = {};
+    columns.forEach((name, c) => { row[name] = decoded[c][i]; });
+    row.hour = row.print_time;
+    rows[i] = row;
+  }
+  return rows;
+};